@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 import os
+import tempfile
 from dotenv import load_dotenv
 from pathlib import Path
 from datetime import timedelta
@@ -54,6 +55,117 @@ REST_FRAMEWORK = {
     # остальное по проекту
 }
 
+# Очередь парсинга (manage.py run_parse_workers)
+PARSE_WORKER_CONCURRENCY = int(os.getenv('PARSE_WORKER_CONCURRENCY', '2'))
+PARSE_QUEUE_POLL_SECONDS = float(os.getenv('PARSE_QUEUE_POLL_SECONDS', '2'))
+PARSE_HEARTBEAT_SECONDS = float(os.getenv('PARSE_HEARTBEAT_SECONDS', '15'))
+# Задача без heartbeat дольше этого считается потерянной и возвращается в очередь
+PARSE_JOB_STALE_SECONDS = int(os.getenv('PARSE_JOB_STALE_SECONDS', '120'))
+PARSE_JOB_MAX_ATTEMPTS = int(os.getenv('PARSE_JOB_MAX_ATTEMPTS', '3'))
+# Задача, которая упала, но успела продвинуться, возвращается в очередь и продолжает с чекпоинта
+PARSE_JOB_AUTO_RESUME = os.getenv('PARSE_JOB_AUTO_RESUME', 'True') == 'True'
+# Одинаковый запрос присоединяется к pending/running задаче не старше этого окна (0 — не склеивать)
+PARSE_COALESCE_WINDOW_SECONDS = int(os.getenv('PARSE_COALESCE_WINDOW_SECONDS', '900'))
+# Результаты пишутся в БД пачками по мере парсинга: по размеру пачки или раз в
+# FLUSH_SECONDS, что раньше. Пачка влезает в один INSERT, а от COPY_THRESHOLD строк на
+# PostgreSQL пишется через COPY (замер: manage.py bench_result_insert --methods shipped)
+PARSE_RESULT_BATCH_SIZE = int(os.getenv('PARSE_RESULT_BATCH_SIZE', '500'))
+PARSE_RESULT_FLUSH_SECONDS = float(os.getenv('PARSE_RESULT_FLUSH_SECONDS', '5'))
+PARSE_PROGRESS_FLUSH_SECONDS = float(os.getenv('PARSE_PROGRESS_FLUSH_SECONDS', '1'))
+PARSE_RESULT_CHUNK_SIZE = int(os.getenv('PARSE_RESULT_CHUNK_SIZE', '500'))  # строк на один INSERT
+PARSE_RESULT_COPY_THRESHOLD = int(os.getenv('PARSE_RESULT_COPY_THRESHOLD', '200'))  # с какой пачки писать через COPY
+
+# Навигация парсеров (parsing/navigation.py): повторы с экспоненциальным backoff
+# и circuit breaker на домен (в БД, общий для всех воркеров) — при массовых
+# блокировках все задачи ждут паузу
+NAVIGATION_TRIES = int(os.getenv('NAVIGATION_TRIES', '3'))
+NAVIGATION_BACKOFF_BASE_MS = int(os.getenv('NAVIGATION_BACKOFF_BASE_MS', '800'))
+NAVIGATION_BACKOFF_CAP_MS = int(os.getenv('NAVIGATION_BACKOFF_CAP_MS', '15000'))
+NAVIGATION_BREAKER_WINDOW = float(os.getenv('NAVIGATION_BREAKER_WINDOW', '60'))  # сек
+# Размыкается, если в окне не меньше MIN_REQUESTS запросов и доля сбоев не меньше RATIO
+NAVIGATION_BREAKER_MIN_REQUESTS = int(os.getenv('NAVIGATION_BREAKER_MIN_REQUESTS', '10'))
+NAVIGATION_BREAKER_FAILURE_RATIO = float(os.getenv('NAVIGATION_BREAKER_FAILURE_RATIO', '0.5'))
+NAVIGATION_BREAKER_COOLDOWN = float(os.getenv('NAVIGATION_BREAKER_COOLDOWN', '60'))  # сек, удваивается
+# Как часто процесс сводит свои счётчики в таблицу и перечитывает паузы доменов
+NAVIGATION_BREAKER_SYNC_INTERVAL = float(os.getenv('NAVIGATION_BREAKER_SYNC_INTERVAL', '5'))  # сек
+
+# Пул браузеров (parsing/browser_pool.py)
+BROWSER_POOL_SIZE = int(os.getenv('BROWSER_POOL_SIZE', '2'))  # браузеров на движок
+BROWSER_POOL_MAX_JOBS = int(os.getenv('BROWSER_POOL_MAX_JOBS', '50'))
+BROWSER_POOL_MAX_MEMORY_MB = int(os.getenv('BROWSER_POOL_MAX_MEMORY_MB', '1500'))
+BROWSER_POOL_WARM_ENGINES = [e for e in os.getenv('BROWSER_POOL_WARM_ENGINES', 'chromium').split(',') if e]
+
+# Сколько карточек товара парсить параллельно (страниц на задачу) по магазинам
+PRODUCT_FETCH_WORKERS = {
+    'baucenter': int(os.getenv('BAUCENTER_FETCH_WORKERS', '3')),
+    'petrovich': int(os.getenv('PETROVICH_FETCH_WORKERS', '4')),
+    'lemanapro': int(os.getenv('LEMANAPRO_FETCH_WORKERS', '3')),
+}
+
+# Сколько страниц листинга (пагинации) открывать параллельно по магазинам
+LISTING_FETCH_WORKERS = {
+    'petrovich': int(os.getenv('PETROVICH_LISTING_WORKERS', '3')),
+    'lemanapro': int(os.getenv('LEMANAPRO_LISTING_WORKERS', '3')),
+}
+
+# Листинг категорий из JSON API сайта (parsing/listing_api.py), DOM — фоллбэк.
+# patterns — фрагменты URL ответов, среди которых ищется список товаров
+LISTING_API_ENABLED = os.getenv('LISTING_API_ENABLED', 'True') == 'True'
+LISTING_API = {
+    'baucenter': {'enabled': True, 'patterns': ['/api/', 'catalog', 'search']},
+    'petrovich': {'enabled': True, 'patterns': ['/api/', 'catalog']},
+    'lemanapro': {'enabled': True, 'patterns': ['/api/', 'catalog', 'search', 'products']},
+}
+
+# Блокировка лишних запросов в браузере (parsing/resource_blocking.py).
+# types — типы ресурсов Playwright, patterns — домены (с поддоменами) или фрагменты URL с "/"
+RESOURCE_BLOCKING_ENABLED = os.getenv('RESOURCE_BLOCKING_ENABLED', 'True') == 'True'
+RESOURCE_BLOCKING_COMMON_PATTERNS = [
+    'google-analytics.com', 'googletagmanager.com', 'doubleclick.net', 'googlesyndication.com',
+    'mc.yandex.ru', 'an.yandex.ru', 'yandex.ru/ads/', 'top-fwz1.mail.ru', 'vk.com/rtrg',
+    'connect.facebook.net', 'criteo.com', 'criteo.net', 'adriver.ru', 'mindbox.ru', 'tiktok.com',
+]
+RESOURCE_BLOCKING = {
+    'baucenter': {'types': ['image', 'media', 'font'], 'patterns': []},
+    'petrovich': {'types': ['image', 'media', 'font'], 'patterns': []},
+    'lemanapro': {'types': ['image', 'media', 'font'], 'patterns': []},
+}
+
+# Сохранённые cookies/localStorage браузера по магазинам (parsing/session_store.py)
+SESSION_STATE_ENABLED = os.getenv('SESSION_STATE_ENABLED', 'True') == 'True'
+SESSION_STATE_DIR = os.getenv('SESSION_STATE_DIR', os.path.join(tempfile.gettempdir(), 'parser_sessions'))
+SESSION_STATE_TTL = {  # сек
+    'default': int(os.getenv('SESSION_STATE_TTL', str(6 * 3600))),
+    'lemanapro': int(os.getenv('LEMANAPRO_SESSION_STATE_TTL', str(2 * 3600))),
+}
+SESSION_STATE_REFRESH_SECONDS = int(os.getenv('SESSION_STATE_REFRESH_SECONDS', '900'))
+
+# Память о движках браузера (parsing/engine_health.py): через сколько секунд
+# вклад прошлого успеха/провала в счёт движка уменьшается вдвое
+ENGINE_HEALTH_HALF_LIFE_SECONDS = float(os.getenv('ENGINE_HEALTH_HALF_LIFE_SECONDS', '1800'))
+
+# Отдельные профили Chromium для persistent-контекстов (parsing/profile_manager.py):
+# каждая задача получает копию шаблонного профиля или свободный профиль прошлой задачи
+CHROMIUM_PROFILE_DIR = os.getenv('CHROMIUM_PROFILE_DIR', os.path.join(tempfile.gettempdir(), 'plw-profiles'))
+CHROMIUM_PROFILES = {
+    'lemanapro': {
+        # Прежний общий профиль остаётся шаблоном
+        'template': os.getenv('LEMANAPRO_PROFILE_TEMPLATE', os.path.join(tempfile.gettempdir(), 'plw-lemanapro-chromium')),
+        'max_profiles': int(os.getenv('LEMANAPRO_MAX_PROFILES', str(PARSE_WORKER_CONCURRENCY))),
+        'max_idle': int(os.getenv('LEMANAPRO_MAX_IDLE_PROFILES', '2')),
+        'template_refresh': int(os.getenv('LEMANAPRO_PROFILE_TEMPLATE_REFRESH', '3600')),  # сек
+    },
+}
+
+# Лемана ПРО: сначала пробуем забрать карточку простым HTTP-запросом, браузер — фоллбэк
+LEMANAPRO_HTTP_ENGINE = os.getenv('LEMANAPRO_HTTP_ENGINE', 'True') == 'True'
+# Остаток по магазинам из JSON-ответов наличия (parsing/api_capture.py), модалка — фоллбэк.
+# Перехватываются ответы, в URL которых есть один из фрагментов
+LEMANAPRO_STOCK_API = os.getenv('LEMANAPRO_STOCK_API', 'True') == 'True'
+LEMANAPRO_STOCK_API_PATTERNS = [
+    p for p in os.getenv('LEMANAPRO_STOCK_API_PATTERNS', 'stock,availab,/stores').split(',') if p
+]
+
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=15),
     'REFRESH_TOKEN_LIFETIME': timedelta(days=7),
@@ -110,6 +222,34 @@ DATABASES = {
 }
 
 
+# Cache
+# "products" — кэш разобранных карточек товаров (parsing/product_cache.py).
+# LocMem живёт в процессе воркера; для общего кэша между хостами укажите, например, Redis.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'products': {
+        'BACKEND': os.getenv('PRODUCT_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('PRODUCT_CACHE_LOCATION', 'products'),
+        'OPTIONS': {
+            # две записи на товар: static + volatile
+            'MAX_ENTRIES': int(os.getenv('PRODUCT_CACHE_MAX_ENTRIES', '40000')),
+        },
+    },
+}
+
+PRODUCT_CACHE_ENABLED = os.getenv('PRODUCT_CACHE_ENABLED', 'True') == 'True'
+PRODUCT_CACHE_ALIAS = 'products'
+# TTL, сек: static — название/артикул/характеристики, volatile — цена/остаток
+PRODUCT_CACHE_TTL = {
+    'baucenter': {'static': 24 * 3600, 'volatile': 30 * 60},
+    'petrovich': {'static': 24 * 3600, 'volatile': 30 * 60},
+    'lemanapro': {'static': 24 * 3600, 'volatile': 15 * 60},
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
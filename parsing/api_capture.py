@@ -0,0 +1,121 @@
+# parsing/api_capture.py
+"""
+Перехват JSON-ответов, которые страница и так загружает (XHR/fetch).
+
+    capture = JsonCapture(page, ["/api/", "stock"])   # вешаем до goto
+    await page.goto(url)
+    payload = await capture.first(lambda url, data: ..., cap_ms=1500)
+    capture.detach()
+
+Слушатель только читает ответы и не меняет запросы; тело читается лишь у
+ответов с подходящим URL и JSON content-type.
+"""
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def walk_dicts(obj):
+    """Все dict внутри JSON (включая сам obj), в глубину."""
+    stack = [obj]
+    while stack:
+        cur = stack.pop()
+        if isinstance(cur, dict):
+            yield cur
+            stack.extend(cur.values())
+        elif isinstance(cur, list):
+            stack.extend(reversed(cur))
+
+
+class JsonCapture:
+    def __init__(self, page, patterns, max_payloads=50):
+        self.page = page
+        self.patterns = [p for p in patterns if p]
+        self.max_payloads = max_payloads
+        self.payloads = []  # [(url, data)] в порядке прихода
+        self.methods = {}  # url -> HTTP-метод запроса (повторять можно только GET)
+        self._tasks = set()
+        self._changed = asyncio.Event()
+        page.on("response", self._on_response)
+
+    def matches(self, url):
+        return any(p in url for p in self.patterns)
+
+    def _on_response(self, response):
+        if len(self.payloads) >= self.max_payloads or not self.matches(response.url):
+            return
+        content_type = (response.headers or {}).get("content-type", "")
+        if "json" not in content_type:
+            return
+        task = asyncio.get_running_loop().create_task(self._read(response))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _read(self, response):
+        try:
+            data = await response.json()
+        except Exception:
+            return
+        try:
+            self.methods[response.url] = response.request.method
+        except Exception:
+            pass
+        self.payloads.append((response.url, data))
+        self._changed.set()
+
+    async def first(self, accept, cap_ms=1500):
+        """
+        Первый результат accept(url, data), отличный от None, среди уже пойманных
+        и приходящих в течение cap_ms ответов. None, если такого нет.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + cap_ms / 1000
+        seen = 0
+        while True:
+            while seen < len(self.payloads):
+                url, data = self.payloads[seen]
+                seen += 1
+                try:
+                    got = accept(url, data)
+                except Exception:
+                    logger.debug("api_capture: accept failed for %s", url, exc_info=True)
+                    got = None
+                if got is not None:
+                    return got
+            left = deadline - loop.time()
+            if left <= 0:
+                return None
+            self._changed.clear()
+            # Ответы могли прийти, пока проверяли предыдущие
+            if seen < len(self.payloads):
+                continue
+            try:
+                await asyncio.wait_for(self._changed.wait(), left)
+            except asyncio.TimeoutError:
+                pass
+
+    async def collect(self, accept, cap_ms=1500):
+        """
+        Все результаты accept(url, data) среди пойманных ответов; если пока
+        нет ни одного, ждёт первый до cap_ms.
+        """
+        if await self.first(accept, cap_ms=cap_ms) is None:
+            return []
+        found = []
+        for url, data in list(self.payloads):
+            try:
+                got = accept(url, data)
+            except Exception:
+                got = None
+            if got is not None:
+                found.append(got)
+        return found
+
+    def detach(self):
+        try:
+            self.page.remove_listener("response", self._on_response)
+        except Exception:
+            pass
+        for task in list(self._tasks):
+            task.cancel()
@@ -0,0 +1,246 @@
+# parsing/browser_pool.py
+"""
+Пул «тёплых» браузеров, общий для всех задач одного event loop.
+
+Парсеры не запускают свой браузер, а берут у пула изолированный BrowserContext:
+
+    pool = await get_browser_pool()
+    async with pool.context("chromium", locale="ru-RU") as context:
+        page = await context.new_page()
+
+Браузер перезапускается после BROWSER_POOL_MAX_JOBS контекстов или когда его
+процессы занимают больше BROWSER_POOL_MAX_MEMORY_MB (память считаем через psutil).
+"""
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+
+import psutil
+from django.conf import settings
+from playwright.async_api import async_playwright
+
+from .profile_manager import close_profile_managers, profile_stats
+
+logger = logging.getLogger(__name__)
+
+ENGINES = ("chromium", "firefox", "webkit")
+
+
+def _descendant_pids():
+    try:
+        return {p.pid for p in psutil.Process().children(recursive=True)}
+    except Exception:
+        return set()
+
+
+def _tree_rss_mb(pids):
+    if not pids:
+        return None
+    total = 0
+    for pid in pids:
+        try:
+            proc = psutil.Process(pid)
+            total += proc.memory_info().rss
+            for child in proc.children(recursive=True):
+                try:
+                    total += child.memory_info().rss
+                except Exception:
+                    continue
+        except Exception:
+            continue
+    return total / (1024 * 1024)
+
+
+class PooledBrowser:
+    def __init__(self, engine, browser, pids):
+        self.engine = engine
+        self.browser = browser
+        self.pids = pids  # корневые процессы браузера (для замера памяти)
+        self.launched_at = time.monotonic()
+        self.jobs_served = 0
+        self.active_contexts = 0
+        self.retiring = False
+
+    @property
+    def alive(self):
+        return not self.retiring and self.browser.is_connected()
+
+    def memory_mb(self):
+        return _tree_rss_mb(self.pids)
+
+
+class BrowserPool:
+    def __init__(self, size=None, max_jobs=None, max_memory_mb=None):
+        self.size = max(1, size or settings.BROWSER_POOL_SIZE)
+        self.max_jobs = max_jobs or settings.BROWSER_POOL_MAX_JOBS
+        self.max_memory_mb = max_memory_mb or settings.BROWSER_POOL_MAX_MEMORY_MB
+        self.playwright = None
+        self._browsers = {engine: [] for engine in ENGINES}
+        self._locks = {engine: asyncio.Lock() for engine in ENGINES}
+        self._launch_lock = asyncio.Lock()
+        self._counters = {engine: {"launched": 0, "recycled": 0, "contexts": 0} for engine in ENGINES}
+        self._http_clients = {}
+        self._http_lock = asyncio.Lock()
+
+    async def start(self, warm_engines=()):
+        self.playwright = await async_playwright().start()
+        for engine in warm_engines:
+            async with self._locks[engine]:
+                while len(self._browsers[engine]) < self.size:
+                    self._browsers[engine].append(await self._launch(engine))
+        return self
+
+    async def close(self):
+        for client in self._http_clients.values():
+            try:
+                await client.dispose()
+            except:
+                pass
+        self._http_clients.clear()
+        for engine, browsers in self._browsers.items():
+            for pb in browsers:
+                try:
+                    await pb.browser.close()
+                except:
+                    pass
+            browsers.clear()
+        close_profile_managers()
+        if self.playwright:
+            try:
+                await self.playwright.stop()
+            except:
+                pass
+            self.playwright = None
+
+    async def _launch(self, engine):
+        async with self._launch_lock:
+            before = _descendant_pids()
+            browser = await getattr(self.playwright, engine).launch(headless=True)
+            new = _descendant_pids() - before
+        # Корни нового дерева процессов — те, чей родитель не из этого же набора
+        roots = set()
+        for pid in new:
+            try:
+                if psutil.Process(pid).ppid() not in new:
+                    roots.add(pid)
+            except Exception:
+                continue
+        self._counters[engine]["launched"] += 1
+        return PooledBrowser(engine, browser, roots)
+
+    async def _acquire(self, engine):
+        if engine not in self._browsers:
+            raise ValueError(f"Unknown browser engine: {engine}")
+        async with self._locks[engine]:
+            browsers = self._browsers[engine]
+            # Упавшие браузеры просто выкидываем
+            for pb in [b for b in browsers if not b.browser.is_connected()]:
+                browsers.remove(pb)
+            alive = [b for b in browsers if b.alive]
+            if len(alive) < self.size:
+                pb = await self._launch(engine)
+                browsers.append(pb)
+            else:
+                pb = min(alive, key=lambda b: b.active_contexts)
+            pb.active_contexts += 1
+            return pb
+
+    async def _release(self, pb):
+        pb.active_contexts -= 1
+        pb.jobs_served += 1
+        if not pb.retiring:
+            mem = pb.memory_mb()
+            if pb.jobs_served >= self.max_jobs or (mem is not None and mem >= self.max_memory_mb):
+                pb.retiring = True
+                self._counters[pb.engine]["recycled"] += 1
+                logger.info(
+                    "Recycling %s browser: jobs=%s, memory=%s MB", pb.engine, pb.jobs_served, mem
+                )
+        # Уходящий браузер закрываем, когда его отпустил последний контекст
+        if pb.retiring and pb.active_contexts <= 0:
+            async with self._locks[pb.engine]:
+                if pb in self._browsers[pb.engine]:
+                    self._browsers[pb.engine].remove(pb)
+            try:
+                await pb.browser.close()
+            except:
+                pass
+
+    @asynccontextmanager
+    async def context(self, engine="chromium", **context_kwargs):
+        pb = await self._acquire(engine)
+        context = None
+        try:
+            context = await pb.browser.new_context(**context_kwargs)
+            self._counters[engine]["contexts"] += 1
+            yield context
+        finally:
+            if context is not None:
+                try:
+                    await context.close()
+                except:
+                    pass
+            await self._release(pb)
+
+    async def http_client(self, key, **kwargs):
+        """
+        Общий HTTP-клиент Playwright (APIRequestContext, без браузера) — один на key.
+        Соединения и cookies переиспользуются всеми задачами этого loop.
+        """
+        async with self._http_lock:
+            client = self._http_clients.get(key)
+            if client is None:
+                client = await self.playwright.request.new_context(**kwargs)
+                self._http_clients[key] = client
+            return client
+
+    def stats(self):
+        data = {}
+        for engine, browsers in self._browsers.items():
+            data[engine] = {
+                **self._counters[engine],
+                "browsers": [
+                    {
+                        "jobs_served": pb.jobs_served,
+                        "active_contexts": pb.active_contexts,
+                        "retiring": pb.retiring,
+                        "uptime_s": round(time.monotonic() - pb.launched_at),
+                        "memory_mb": pb.memory_mb(),
+                    }
+                    for pb in browsers
+                ],
+            }
+        data["http_clients"] = sorted(self._http_clients)
+        data["profiles"] = profile_stats()
+        return data
+
+
+# Пул привязан к event loop: браузеры Playwright нельзя делить между loop'ами.
+# Храним задачу запуска, чтобы параллельные вызовы дождались одного и того же пула.
+_pools = {}
+
+
+async def get_browser_pool():
+    loop = asyncio.get_running_loop()
+    starting = _pools.get(loop)
+    if starting is None:
+        pool = BrowserPool()
+        starting = loop.create_task(pool.start(warm_engines=settings.BROWSER_POOL_WARM_ENGINES))
+        _pools[loop] = starting
+    try:
+        return await asyncio.shield(starting)
+    except Exception:
+        _pools.pop(loop, None)
+        raise
+
+
+async def close_browser_pool():
+    starting = _pools.pop(asyncio.get_running_loop(), None)
+    if starting is None:
+        return
+    try:
+        pool = await starting
+    except Exception:
+        return
+    await pool.close()
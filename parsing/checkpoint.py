@@ -0,0 +1,82 @@
+# parsing/checkpoint.py
+"""
+Чекпоинт задачи: повторная попытка продолжает с места сбоя, а не с начала.
+
+- Собранный список ссылок категории пишется в Request.checkpoint_links,
+  как только листинг собран полностью.
+- Сделанные ссылки — это URL результатов, уже записанных в parsing_results
+  (ResultWriter пишет их пачками по ходу задачи), отдельно их не храним.
+
+Когда задача снова попадает к воркеру (воркер потерян, задача упала и
+вернулась в очередь или её продолжили через POST /api/parsing/resume/<id>/),
+листинг берётся из чекпоинта, а сделанные ссылки пропускаются:
+
+    links = checkpoint.saved_links()
+    if links is None:
+        links = await collect_links(...)
+        await checkpoint.save_links(links)
+    for link in checkpoint.pending(links):
+        ...
+
+Вне задачи (разовый запуск парсера) функции ничего не делают.
+"""
+from django.utils import timezone
+
+from . import jobs
+from .models import Request, Result
+
+
+class Checkpoint:
+    def __init__(self, request_id, links=None, done=(), saved=0):
+        self.request_id = request_id
+        self.links = links  # None — листинг ещё не собирали
+        self.done = set(done)
+        self.saved = saved  # строк результатов от прошлых попыток
+
+    def is_done(self, url):
+        return url in self.done
+
+    def pending(self, links):
+        return [u for u in links if u not in self.done]
+
+    async def save_links(self, links):
+        self.links = list(links)
+        await Request.objects.filter(pk=self.request_id).aupdate(
+            checkpoint_links=self.links, checkpoint_at=timezone.now()
+        )
+
+
+async def load(req):
+    """Чекпоинт задачи по строке Request; у первой попытки он пустой."""
+    done, saved = set(), 0
+    async for url in Result.objects.filter(request_id=req.pk).values_list("url", flat=True):
+        saved += 1
+        if url:
+            done.add(url)
+    return Checkpoint(req.pk, req.checkpoint_links, done, saved)
+
+
+def current():
+    job = jobs.current()
+    return getattr(job, "checkpoint", None)
+
+
+def saved_links():
+    cp = current()
+    return list(cp.links) if cp is not None and cp.links is not None else None
+
+
+def pending(links):
+    cp = current()
+    return cp.pending(links) if cp is not None else list(links)
+
+
+def is_done(url):
+    cp = current()
+    return cp is not None and cp.is_done(url)
+
+
+async def save_links(links):
+    cp = current()
+    if cp is not None:
+        await cp.save_links(links)
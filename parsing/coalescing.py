@@ -0,0 +1,126 @@
+# parsing/coalescing.py
+"""
+Склейка одинаковых запросов.
+
+Запрос с тем же отпечатком (магазин + канонический URL + параметры), что и
+уже ожидающий/выполняющийся, не ставится в очередь, а получает статус
+"attached" и ссылку leader. Когда leader завершается, его результаты и
+статус копируются всем присоединённым запросам в той же транзакции.
+"""
+import hashlib
+import json
+from datetime import timedelta
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import Request, Result
+
+# Метки рекламы/аналитики не меняют выдачу категории.
+# "from" сюда не входит: на сайтах это смещение листинга (?from=40)
+IGNORED_QUERY_PARAMS = ("utm_", "yclid", "gclid", "fbclid", "_openstat")
+
+
+def canonical_url(url):
+    parts = urlsplit((url or "").strip())
+    host = (parts.hostname or "").lower()
+    if host.startswith("www."):
+        host = host[4:]
+    if parts.port and parts.port not in (80, 443):
+        host = f"{host}:{parts.port}"
+    path = parts.path.rstrip("/") or "/"
+    query = sorted(
+        (k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+        if not k.lower().startswith(IGNORED_QUERY_PARAMS)
+    )
+    return urlunsplit(("https", host, path, urlencode(query), ""))
+
+
+def _canonical_param(value):
+    if isinstance(value, str):
+        return " ".join(value.split()).lower()
+    return value
+
+
+def request_fingerprint(shop_id, url, params):
+    payload = {
+        "shop": shop_id,
+        "url": canonical_url(url),
+        "params": {k: _canonical_param(v) for k, v in sorted((params or {}).items())},
+    }
+    raw = json.dumps(payload, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def create_request(**fields):
+    """
+    Создаёт Request: либо обычный pending, либо attached к идущему такому же.
+    Строка leader'а блокируется, чтобы он не завершился между проверкой и привязкой.
+    """
+    fields["fingerprint"] = request_fingerprint(fields["shop"].pk, fields["url"], fields.get("params"))
+    window = settings.PARSE_COALESCE_WINDOW_SECONDS
+    with transaction.atomic():
+        leader = None
+        if window > 0:
+            leader = (
+                Request.objects.select_for_update()
+                .filter(
+                    fingerprint=fields["fingerprint"],
+                    status__in=("pending", "running"),
+                    leader__isnull=True,
+                    created_at__gte=timezone.now() - timedelta(seconds=window),
+                )
+                .order_by("id")
+                .first()
+            )
+        if leader is not None:
+            fields.update(status="attached", leader=leader)
+        else:
+            fields.update(status="pending")
+        return Request.objects.create(**fields)
+
+
+COPY_COLUMNS = ("url", "article", "name", "price", "stock", "tx1", "tx2", "change", "created_at")
+FOLLOWER_FIELDS = (
+    "status", "error_message", "finished_at", "stage",
+    "links_found", "pages_processed", "items_saved", "items_failed",
+)
+
+
+def _copy_results_to_followers(leader_id):
+    # Копируем одним INSERT ... SELECT сразу всем присоединённым
+    table = Result._meta.db_table
+    req_table = Request._meta.db_table
+    sql = (
+        f"INSERT INTO {table} (request_id, {', '.join(COPY_COLUMNS)}) "
+        f"SELECT f.id, {', '.join('r.' + c for c in COPY_COLUMNS)} "
+        f"FROM {table} r JOIN {req_table} f ON f.leader_id = r.request_id "
+        f"WHERE r.request_id = %s AND f.status = 'attached' "
+        f"ORDER BY f.id, r.id"
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [leader_id])
+
+
+def finish_request(req, update_fields):
+    """Сохраняет финальный статус leader'а и раздаёт результат присоединённым."""
+    with transaction.atomic():
+        # Блокируем строку: create_request не сможет привязаться к уже завершённому
+        Request.objects.select_for_update().filter(pk=req.pk).values_list("pk").first()
+        req.save(update_fields=update_fields)
+        followers = Request.objects.filter(leader_id=req.pk, status="attached")
+        if not followers.exists():
+            return 0
+        if req.status == "done":
+            _copy_results_to_followers(req.pk)
+        # Счётчики прогресса пишет progress.flush, в req их нет — берём из строки
+        fresh = Request.objects.only(*FOLLOWER_FIELDS).get(pk=req.pk)
+        return followers.update(**{f: getattr(fresh, f) for f in FOLLOWER_FIELDS})
+
+
+def fail_followers(leader_ids, message):
+    return Request.objects.filter(leader_id__in=list(leader_ids), status="attached").update(
+        status="error", error_message=message, finished_at=timezone.now(),
+    )
@@ -0,0 +1,45 @@
+# parsing/engine_health.py
+"""
+Память о том, какой движок браузера сейчас работает на магазине.
+
+После прохода движок получает оценку — долю успешно разобранных ссылок (0..1).
+Счёт движка — экспоненциальное среднее оценок, которое со временем затухает
+к нейтральному 0.5 (период полураспада ENGINE_HEALTH_HALF_LIFE_SECONDS):
+давний успех или провал весит всё меньше. Следующая задача начинает
+с движка с лучшим счётом, при равенстве — в исходном порядке.
+
+Хранится в памяти процесса воркера, как и остальные счётчики парсеров.
+"""
+import time
+
+from django.conf import settings
+
+NEUTRAL = 0.5
+ALPHA = 0.5  # вес свежей оценки
+
+_scores = {}  # (shop_key, engine) -> (счёт, monotonic-время записи)
+
+
+def score(shop_key, engine, now=None):
+    got = _scores.get((shop_key, engine))
+    if got is None:
+        return NEUTRAL
+    value, ts = got
+    now = time.monotonic() if now is None else now
+    decay = 0.5 ** (max(0.0, now - ts) / settings.ENGINE_HEALTH_HALF_LIFE_SECONDS)
+    return NEUTRAL + (value - NEUTRAL) * decay
+
+
+def record(shop_key, engine, outcome):
+    """outcome — 1.0 (всё разобрано) … 0.0 (движок не справился)."""
+    now = time.monotonic()
+    current = score(shop_key, engine, now)
+    _scores[(shop_key, engine)] = (current + ALPHA * (outcome - current), now)
+
+
+def order(shop_key, engines):
+    return sorted(engines, key=lambda e: -score(shop_key, e))
+
+
+def snapshot():
+    return {f"{shop}:{engine}": round(score(shop, engine), 3) for shop, engine in _scores}
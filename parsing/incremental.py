@@ -0,0 +1,123 @@
+# parsing/incremental.py
+"""
+Инкрементальный перепарсинг категории (params["incremental"] = true).
+
+После сбора ссылок список сравнивается с прошлым снимком категории
+(таблица category_products):
+- новые товары парсятся полностью;
+- известные — дешёвое обновление только цены и остатка, остальное из снимка;
+- пропавшие отдаются строкой с change="removed" и помечаются removed_at.
+Снимок обновляется в конце успешного прохода.
+
+    plan = await plan_for_job("baucenter", category_url, links)
+    if plan:
+        row = await plan.fetch(link, full=..., refresh=..., build=...)
+        ...
+        for row in plan.removed_rows(): yield row
+        await plan.save()
+"""
+import hashlib
+
+from django.utils import timezone
+
+from . import checkpoint, jobs
+from .coalescing import canonical_url
+from .models import CategoryProduct, Shop
+
+VOLATILE_FIELDS = ("Цена", "Остаток")
+
+
+def category_key(url):
+    return hashlib.sha256(canonical_url(url).encode("utf-8")).hexdigest()
+
+
+class IncrementalPlan:
+    def __init__(self, shop, category_url, links, known):
+        self.shop = shop
+        self.category_url = category_url
+        self.key = category_key(category_url)
+        self.links = list(dict.fromkeys(links))
+        self.known = known  # url -> CategoryProduct
+        self.seen = {}  # url -> (fields, props)
+        self.started_at = timezone.now()
+
+    def add_links(self, links):
+        """Для парсеров, которые подают ссылки пачками по мере обхода листинга."""
+        listed = set(self.links)
+        self.links.extend(u for u in dict.fromkeys(links) if u not in listed)
+
+    @property
+    def removed(self):
+        # Считается по итоговому списку ссылок, поэтому звать после обхода листинга
+        listed = set(self.links)
+        return [cp for u, cp in self.known.items() if u not in listed and cp.removed_at is None]
+
+    @property
+    def new_count(self):
+        return sum(1 for u in self.links if u not in self.known)
+
+    async def fetch(self, url, full, refresh, build):
+        """
+        full() -> (fields, props, extra) — полный разбор карточки;
+        refresh() -> {"Цена": ..., "Остаток": ...} — дешёвое обновление;
+        build(fields, props, extra) -> строка результата.
+        """
+        snap = self.known.get(url)
+        if snap is None or not snap.fields:
+            fields, props, extra = await full()
+            change = "new"
+        else:
+            fresh = await refresh()
+            fields = {**snap.fields, **{k: v for k, v in fresh.items() if k in VOLATILE_FIELDS}}
+            props, extra = snap.props, None
+            change = "updated"
+        self.seen[url] = (fields, props)
+        row = build(fields, props, extra)
+        row["Изменение"] = change
+        return row
+
+    def removed_rows(self):
+        for cp in self.removed:
+            # Уже отдана прошлой попыткой задачи
+            if checkpoint.is_done(cp.url):
+                continue
+            yield {"Ссылка": cp.url, **cp.fields, "Изменение": "removed"}
+
+    async def save(self):
+        now = timezone.now()
+        if self.seen:
+            await CategoryProduct.objects.abulk_create(
+                [
+                    CategoryProduct(
+                        shop=self.shop, category_key=self.key, category_url=self.category_url,
+                        url=url, fields=fields, props=props, last_seen_at=now, removed_at=None,
+                    )
+                    for url, (fields, props) in self.seen.items()
+                ],
+                update_conflicts=True,
+                unique_fields=["shop", "category_key", "url"],
+                update_fields=["category_url", "fields", "props", "last_seen_at", "removed_at"],
+            )
+        # Товар есть в листинге, но карточку не удалось разобрать — он не пропал
+        unparsed = [u for u in self.links if u not in self.seen and u in self.known]
+        if unparsed:
+            await CategoryProduct.objects.filter(
+                shop=self.shop, category_key=self.key, url__in=unparsed
+            ).aupdate(last_seen_at=now, removed_at=None)
+        removed = self.removed
+        if removed:
+            await CategoryProduct.objects.filter(
+                pk__in=[cp.pk for cp in removed]
+            ).aupdate(removed_at=now)
+
+
+async def plan_for_job(shop_key, category_url, links):
+    """План для текущей задачи или None, если она не инкрементальная."""
+    if not jobs.param("incremental"):
+        return None
+    shop = await Shop.objects.aget(parser_key=shop_key)
+    known = {
+        cp.url: cp
+        async for cp in CategoryProduct.objects.filter(shop=shop, category_key=category_key(category_url))
+    }
+    return IncrementalPlan(shop, category_url, links, known)
@@ -0,0 +1,151 @@
+# parsing/job_queue.py
+"""
+Очередь задач парсинга поверх таблицы parsing_requests.
+
+Задача — это строка Request со статусом "pending". Воркеры забирают её через
+SELECT ... FOR UPDATE SKIP LOCKED, поэтому несколько процессов (и хостов)
+могут работать с одной таблицей, не мешая друг другу.
+"""
+import os
+import socket
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .coalescing import fail_followers
+from .models import Request
+
+
+def make_worker_id():
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+def claim_next_job(worker_id):
+    """
+    Забирает самую старую pending-задачу и переводит её в running.
+    Возвращает id задачи или None, если очередь пуста.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        req = (
+            Request.objects.select_for_update(skip_locked=True)
+            .filter(status="pending")
+            .order_by("id")
+            .only("id", "attempts")
+            .first()
+        )
+        if req is None:
+            return None
+        Request.objects.filter(pk=req.pk).update(
+            status="running",
+            worker_id=worker_id,
+            attempts=req.attempts + 1,
+            started_at=now,
+            heartbeat_at=now,
+            finished_at=None,
+        )
+    return req.pk
+
+
+def heartbeat(worker_id, request_ids):
+    # Одним UPDATE продлеваем задачи, которые воркер действительно ведёт:
+    # строка задачи, упавшей мимо run_parser_job, продлеваться не должна
+    if not request_ids:
+        return 0
+    return Request.objects.filter(
+        pk__in=list(request_ids), worker_id=worker_id, status="running"
+    ).update(heartbeat_at=timezone.now())
+
+
+def fail_job(request_id, worker_id, message):
+    """
+    Помечает ошибкой задачу, которая упала вне run_parser_job (строка осталась
+    running), и её присоединённые запросы. Задачу, уже завершённую или
+    отданную другому воркеру, не трогает.
+    """
+    with transaction.atomic():
+        updated = Request.objects.filter(pk=request_id, worker_id=worker_id, status="running").update(
+            status="error",
+            worker_id=None,
+            finished_at=timezone.now(),
+            error_message=message,
+        )
+        if updated:
+            fail_followers([request_id], message)
+    return updated
+
+
+def requeue_stale_jobs(stale_seconds=None, max_attempts=None):
+    """
+    Возвращает в очередь задачи, чей воркер перестал слать heartbeat
+    (рестарт, OOM, деплой); следующий воркер продолжит её с чекпоинта.
+    После max_attempts попыток задача падает в error.
+    """
+    stale_seconds = stale_seconds or settings.PARSE_JOB_STALE_SECONDS
+    max_attempts = max_attempts or settings.PARSE_JOB_MAX_ATTEMPTS
+    deadline = timezone.now() - timedelta(seconds=stale_seconds)
+
+    with transaction.atomic():
+        stale = list(
+            Request.objects.select_for_update(skip_locked=True)
+            .filter(status="running", heartbeat_at__lt=deadline)
+            .only("id", "attempts")
+        )
+        requeued, failed = [], []
+        for req in stale:
+            (failed if req.attempts >= max_attempts else requeued).append(req.pk)
+        if requeued:
+            Request.objects.filter(pk__in=requeued).update(status="pending", worker_id=None)
+        if failed:
+            message = f"Worker lost the job {max_attempts} times"
+            Request.objects.filter(pk__in=failed).update(
+                status="error",
+                worker_id=None,
+                finished_at=timezone.now(),
+                error_message=message,
+            )
+            fail_followers(failed, message)
+    return requeued, failed
+
+
+def release_jobs(request_ids):
+    # Вернуть в очередь задачи, прерванные остановкой воркера
+    if not request_ids:
+        return 0
+    return Request.objects.filter(pk__in=list(request_ids), status="running").update(
+        status="pending", worker_id=None
+    )
+
+
+def resume_job(request_id):
+    """
+    Возвращает упавшую задачу в очередь (POST /api/parsing/resume/<id>/): она
+    продолжит с чекпоинта (parsing/checkpoint.py). Счётчик попыток обнуляется,
+    присоединённые запросы, упавшие вместе с ней, снова ждут её результатов.
+    Присоединённый запрос сам не продолжается — продолжать нужно его leader'а.
+    Возвращает (Request или None, удалось ли).
+    """
+    with transaction.atomic():
+        req = (
+            Request.objects.select_for_update()
+            .filter(pk=request_id)
+            .only("id", "status", "leader_id")
+            .first()
+        )
+        if req is None or req.status != "error" or req.leader_id:
+            return req, False
+        Request.objects.filter(pk=req.pk).update(
+            status="pending",
+            worker_id=None,
+            attempts=0,
+            error_message=None,
+            finished_at=None,
+            stage="requeued",
+        )
+        Request.objects.filter(leader_id=req.pk, status="error").update(
+            status="attached", error_message=None, finished_at=None,
+        )
+    return req, True
@@ -0,0 +1,30 @@
+# parsing/jobs.py
+"""
+Контекст текущей задачи для кода парсеров.
+
+Парсер вызывается как run_parser(url, tx1, tx2), а параметры запроса
+(например, params["incremental"]) берёт отсюда. Задача выставляет
+contextvar в run_parser_job; задачи asyncio, созданные внутри, его наследуют.
+"""
+import contextvars
+
+
+class JobContext:
+    def __init__(self, request_id, shop_key, url, params):
+        self.request_id = request_id
+        self.shop_key = shop_key
+        self.url = url
+        self.params = params or {}
+        self.checkpoint = None  # parsing/checkpoint.py, выставляет run_parser_job
+
+
+current_job = contextvars.ContextVar("parse_job", default=None)
+
+
+def current():
+    return current_job.get()
+
+
+def param(name, default=None):
+    job = current_job.get()
+    return job.params.get(name, default) if job is not None else default
@@ -0,0 +1,217 @@
+# parsing/listing_api.py
+"""
+Листинг категории из JSON API сайта вместо DOM.
+
+Категории всех трёх магазинов рисуются на клиенте из JSON. Вешаем
+JsonCapture до goto, находим среди пойманных ответов список товаров
+(ссылки, общее число), а следующие страницы запрашиваем тем же GET-запросом
+с увеличенным параметром страницы — через APIRequestContext страницы, без
+рендеринга. Если ответ не распознан или товаров меньше заявленного, парсер
+собирает ссылки из DOM, как раньше.
+
+Из нескольких ответов со списками товаров берётся тот, что относится к
+открытой категории (по URL запроса или по совпадению с товарами на странице).
+Общее число — из контейнера вокруг списка, а если парсер прочитал счётчик
+товаров на странице (expected), то из него.
+
+    capture = listing_capture(page, "baucenter")      # до page.goto
+    ...
+    got = await collect_from_api(page, capture, to_url, expected=counter)
+    if got is not None:
+        links, total = got
+"""
+import logging
+import re
+from urllib.parse import parse_qsl, unquote, urlencode, urlsplit, urlunsplit
+
+from django.conf import settings
+
+from .api_capture import JsonCapture, walk_dicts
+
+logger = logging.getLogger(__name__)
+
+URL_KEYS = ("url", "link", "href", "productUrl", "product_url", "seoUrl", "canonicalUrl", "path", "slug")
+TOTAL_KEYS = ("total", "totalCount", "total_count", "totalProducts", "productsCount", "count", "found")
+PAGE_PARAMS = ("page", "p", "pageNumber", "page_number")
+OFFSET_PARAMS = ("offset", "from", "start")
+# Блоки пагинации рядом со списком товаров, где тоже лежит общее число
+PAGING_KEYS = ("pagination", "paging", "pager", "pageInfo", "meta")
+GENERIC_SEGMENTS = ("catalog", "catalogue", "category", "categories", "products", "product")
+MAX_PAGES = 100
+
+# Сколько категорий собрано через API и сколько ушло в DOM-фоллбэк
+STATS = {"api": 0, "fallback": 0}
+
+
+def listing_capture(page, shop_key):
+    """JsonCapture для листинга магазина или None, если режим выключен."""
+    conf = settings.LISTING_API.get(shop_key) or {}
+    if not settings.LISTING_API_ENABLED or not conf.get("enabled", True):
+        return None
+    return JsonCapture(page, conf.get("patterns") or ["/api/"])
+
+
+def _item_url(item, to_url):
+    for d in walk_dicts(item):
+        for key in URL_KEYS:
+            value = d.get(key)
+            if isinstance(value, str):
+                url = to_url(value)
+                if url:
+                    return url
+    return None
+
+
+def _total_in(d, minimum):
+    for key in TOTAL_KEYS:
+        value = d.get(key)
+        if isinstance(value, int) and not isinstance(value, bool) and value >= minimum:
+            return value
+    return None
+
+
+def parse_listing(data, to_url):
+    """(ссылки на товары, общее число или None) из JSON листинга или None, если это не он."""
+    best, around = [], ()
+    stack = [(data, ())]  # (узел, dict'ы вокруг него — от корня к узлу)
+    while stack:
+        cur, parents = stack.pop()
+        if isinstance(cur, dict):
+            stack.extend((v, parents + (cur,)) for v in cur.values())
+        elif isinstance(cur, list):
+            dicts = [x for x in cur if isinstance(x, dict)]
+            if dicts and len(dicts) > len(best):
+                urls = [u for u in (_item_url(x, to_url) for x in dicts) if u]
+                # Список товаров — большинство элементов ведут на карточку
+                if len(urls) * 2 >= len(dicts):
+                    best, around = urls, parents
+                    continue
+            stack.extend((x, parents) for x in cur)
+    if not best:
+        return None
+    # Общее число ищем только в контейнерах вокруг списка (ближний — первым) и в их
+    # блоках пагинации: у самих товаров бывают свои count (отзывы, остатки)
+    total = None
+    for d in reversed(around):
+        total = _total_in(d, len(best))
+        for key in PAGING_KEYS:
+            if total is None and isinstance(d.get(key), dict):
+                total = _total_in(d[key], len(best))
+        if total is not None:
+            break
+    return list(dict.fromkeys(best)), total
+
+
+def listing_tokens(url):
+    """Признаки категории в URL API: последний сегмент пути и числовые id в нём."""
+    segments = [s for s in unquote(urlsplit(url).path).split("/") if s and s not in GENERIC_SEGMENTS]
+    if not segments:
+        return []
+    last = segments[-1]
+    return [last, *re.findall(r"\d{4,}", last)]
+
+
+async def _dom_links(page, to_url):
+    try:
+        hrefs = await page.eval_on_selector_all("a[href]", "els => els.map(e => e.getAttribute('href'))")
+    except Exception:
+        return set()
+    return {u for u in (to_url(h) for h in hrefs if h) if u}
+
+
+def _listing_score(api_url, links, tokens, dom_links):
+    """
+    Насколько ответ похож на листинг открытой категории, или None, если не похож:
+    в URL запроса есть признак категории или товары ответа — основная часть
+    товаров на странице (виджеты рекомендаций дают лишь малую долю).
+    """
+    decoded = unquote(api_url)
+    by_url = any(t in decoded for t in tokens)
+    overlap = len(dom_links.intersection(links))
+    if not by_url and not (dom_links and overlap * 2 >= len(dom_links)):
+        return None
+    return by_url, overlap, len(links)
+
+
+def _paging(url):
+    """(параметр, текущее значение, это offset?) или None, если листаться нечем."""
+    query = dict(parse_qsl(urlsplit(url).query, keep_blank_values=True))
+    for name in PAGE_PARAMS:
+        if str(query.get(name, "")).isdigit():
+            return name, int(query[name]), False
+    for name in OFFSET_PARAMS:
+        if str(query.get(name, "")).isdigit():
+            return name, int(query[name]), True
+    return None
+
+
+def _with_param(url, name, value):
+    parts = urlsplit(url)
+    query = [(k, str(value) if k == name else v) for k, v in parse_qsl(parts.query, keep_blank_values=True)]
+    return urlunsplit(parts._replace(query=urlencode(query)))
+
+
+async def collect_from_api(page, capture, to_url, expected=None, cap_ms=3000):
+    """
+    (ссылки, total) из API листинга или None. to_url(str) -> абсолютный URL
+    карточки или None — по нему магазин отличает свои товары от прочего JSON.
+    expected — число товаров со счётчика на странице, если парсер его прочитал:
+    оно важнее числа из JSON.
+    """
+    if capture is None:
+        return None
+
+    def accept(url, data):
+        got = parse_listing(data, to_url)
+        return (url, got) if got else None
+
+    # Кроме листинга страница грузит виджеты (рекомендации, «смотрели ранее») —
+    # берём ответ, который больше всего похож на список открытой категории
+    candidates = await capture.collect(accept, cap_ms=cap_ms)
+    tokens = listing_tokens(page.url)
+    dom_links = await _dom_links(page, to_url) if candidates else set()
+    scored = [
+        (score, found) for score, found in
+        ((_listing_score(u, got[0], tokens, dom_links), (u, got)) for u, got in candidates)
+        if score is not None
+    ]
+    if not scored:
+        STATS["fallback"] += 1
+        return None
+    api_url, (links, total) = max(scored, key=lambda x: x[0])[1]
+    links = list(links)
+    if expected and total and abs(total - expected) > 2:
+        logger.debug("listing_api: total %s in %s, page counter says %s", total, api_url, expected)
+    total = expected or total
+    paging = _paging(api_url) if capture.methods.get(api_url, "GET") == "GET" else None
+    if paging is None and not total:
+        # Ни общего числа, ни параметра страницы: это может быть лишь первая страница
+        STATS["fallback"] += 1
+        return None
+
+    if paging is not None:
+        name, value, is_offset = paging
+        page_size = len(links)
+        for _ in range(MAX_PAGES):
+            if total and len(links) >= total:
+                break
+            value += page_size if is_offset else 1
+            try:
+                resp = await page.context.request.get(_with_param(api_url, name, value), timeout=30000, fail_on_status_code=False)
+                if resp.status >= 400:
+                    break
+                got = parse_listing(await resp.json(), to_url)
+            except Exception:
+                break
+            known = set(links)
+            fresh = [u for u in (got[0] if got else []) if u not in known]
+            if not fresh:
+                break
+            links.extend(fresh)
+
+    # Не добрали до заявленного — пусть парсер соберёт из DOM
+    if total and len(links) < total - 2:
+        STATS["fallback"] += 1
+        return None
+    STATS["api"] += 1
+    return links, total
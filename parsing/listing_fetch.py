@@ -0,0 +1,68 @@
+# parsing/listing_fetch.py
+"""
+Параллельный обход страниц листинга (пагинации категории).
+
+Несколько страниц одного контекста открывают URL листинга одновременно;
+их число ограничено настройкой магазина LISTING_FETCH_WORKERS.
+
+    async for page_url, got in iter_listing_pages(context, urls, fetch_page,
+                                                  workers=listing_workers_for("lemanapro")):
+        ...
+
+fetch_page(page, url) — корутина парсера. Результаты отдаются по мере
+готовности, а не в порядке urls. Ошибка на отдельной странице не прерывает
+обход: для неё got = None, а в errors добавляется (url, "сообщение").
+"""
+import asyncio
+
+from django.conf import settings
+
+
+def listing_workers_for(shop_key, default=2):
+    return max(1, settings.LISTING_FETCH_WORKERS.get(shop_key, default))
+
+
+async def iter_listing_pages(context, urls, fetch_page, workers=2, new_page=None, errors=None):
+    urls = list(urls)
+    if not urls:
+        return
+    new_page = new_page or context.new_page
+    queue = asyncio.Queue()
+    for url in urls:
+        queue.put_nowait(url)
+    out = asyncio.Queue()
+
+    async def worker():
+        page = None
+        try:
+            while True:
+                try:
+                    url = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                try:
+                    if page is None or page.is_closed():
+                        page = await new_page()
+                    got = await fetch_page(page, url)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    if errors is not None:
+                        errors.append((url, str(e)[:200]))
+                    got = None
+                await out.put((url, got))
+        finally:
+            if page is not None:
+                try:
+                    await page.close()
+                except:
+                    pass
+
+    tasks = [asyncio.create_task(worker()) for _ in range(min(max(1, workers), len(urls)))]
+    try:
+        for _ in range(len(urls)):
+            yield await out.get()
+    finally:
+        for t in tasks:
+            t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
@@ -0,0 +1,84 @@
+# parsing/management/commands/bench_result_insert.py
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from parsing.models import Request, Result, Shop
+from parsing.result_store import _copy_results, save_results
+
+METHODS = ("create", "bulk", "copy", "auto", "shipped")
+
+
+def make_rows(req, n):
+    return [
+        Result(
+            request=req,
+            url=f"https://example.com/product/{i}/",
+            article=str(100000 + i),
+            name=f"Товар {i}",
+            price=str(1000 + i),
+            stock=str(i % 50),
+            tx1="1500 Вт",
+            tx2="3000 об/мин",
+        )
+        for i in range(n)
+    ]
+
+
+class Command(BaseCommand):
+    help = (
+        "Замер скорости записи результатов в parsing_results. Каждый метод пишет "
+        "в свою временную задачу без внешней транзакции (как в работе), потом она удаляется"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=5000)
+        parser.add_argument("--methods", nargs="+", choices=METHODS, default=list(METHODS))
+
+    def run_method(self, method, req, rows):
+        objs = make_rows(req, rows)
+        started = time.perf_counter()
+        if method == "create":
+            # Как было раньше: отдельный INSERT на строку, каждый в своей транзакции
+            for obj in objs:
+                obj.save()
+        elif method == "bulk":
+            save_results(objs, copy_threshold=rows + 1)
+        elif method == "copy":
+            with transaction.atomic():
+                _copy_results(objs)
+        elif method == "auto":
+            save_results(objs)
+        else:
+            # Как пишет ResultWriter с настройками из settings: пачками по PARSE_RESULT_BATCH_SIZE
+            batch = settings.PARSE_RESULT_BATCH_SIZE
+            for i in range(0, rows, batch):
+                save_results(objs[i:i + batch])
+        return time.perf_counter() - started
+
+    def handle(self, *args, **options):
+        rows = options["rows"]
+        methods = options["methods"]
+        if "copy" in methods and connection.vendor != "postgresql":
+            raise CommandError("COPY доступен только на PostgreSQL")
+
+        self.stdout.write(
+            f"batch={settings.PARSE_RESULT_BATCH_SIZE} chunk={settings.PARSE_RESULT_CHUNK_SIZE} "
+            f"copy_threshold={settings.PARSE_RESULT_COPY_THRESHOLD} ({connection.vendor})"
+        )
+        shop, _ = Shop.objects.get_or_create(parser_key="__bench__", defaults={"name": "__bench__"})
+        try:
+            for method in methods:
+                req = Request.objects.create(user_id=0, shop=shop, url="https://example.com/", params={})
+                try:
+                    elapsed = self.run_method(method, req, rows)
+                    saved = Result.objects.filter(request=req).count()
+                finally:
+                    req.delete()
+                self.stdout.write(
+                    f"{method:>7}: {saved} строк за {elapsed:.3f} c — {saved / elapsed:,.0f} строк/с"
+                )
+        finally:
+            shop.delete()
@@ -0,0 +1,44 @@
+# parsing/management/commands/run_parse_workers.py
+import asyncio
+import signal
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from parsing.job_queue import make_worker_id
+from parsing.runner import JobRunner
+
+
+class Command(BaseCommand):
+    help = "Запускает воркер, который забирает задачи парсинга из parsing_requests"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--concurrency", type=int, default=settings.PARSE_WORKER_CONCURRENCY,
+            help="Сколько задач выполнять одновременно в этом процессе",
+        )
+        parser.add_argument(
+            "--poll-interval", type=float, default=settings.PARSE_QUEUE_POLL_SECONDS,
+            help="Пауза (сек) между опросами пустой очереди",
+        )
+        parser.add_argument(
+            "--drain-timeout", type=float, default=30,
+            help="Сколько секунд ждать текущие задачи при остановке, прежде чем вернуть их в очередь",
+        )
+
+    def handle(self, *args, **options):
+        worker_id = make_worker_id()
+        runner = JobRunner(
+            worker_id,
+            concurrency=options["concurrency"],
+            poll_interval=options["poll_interval"],
+        )
+        self.stdout.write(f"{worker_id}: до {runner.concurrency} задач в одном event loop")
+
+        async def main():
+            loop = asyncio.get_running_loop()
+            for sig in (signal.SIGINT, signal.SIGTERM):
+                loop.add_signal_handler(sig, runner.stop)
+            await runner.run(drain_timeout=options["drain_timeout"])
+
+        asyncio.run(main())
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.4 on 2026-10-18 14:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('parsing', '0003_request_queue_fields'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='request',
+            name='items_failed',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='request',
+            name='items_saved',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='request',
+            name='links_found',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='request',
+            name='pages_processed',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='request',
+            name='stage',
+            field=models.CharField(blank=True, default='', max_length=32),
+        ),
+    ]
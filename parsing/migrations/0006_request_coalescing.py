@@ -0,0 +1,24 @@
+# Generated by Django 5.2.4 on 2026-10-18 14:23
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('parsing', '0005_result_request_id_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='request',
+            name='fingerprint',
+            field=models.CharField(blank=True, db_index=True, max_length=64, null=True),
+        ),
+        migrations.AddField(
+            model_name='request',
+            name='leader',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='followers', to='parsing.request'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.4 on 2026-10-18 14:27
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('parsing', '0006_request_coalescing'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='result',
+            name='change',
+            field=models.CharField(blank=True, max_length=16, null=True),
+        ),
+        migrations.CreateModel(
+            name='CategoryProduct',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('category_key', models.CharField(db_index=True, max_length=64)),
+                ('category_url', models.TextField()),
+                ('url', models.TextField()),
+                ('fields', models.JSONField(default=dict)),
+                ('props', models.JSONField(default=dict)),
+                ('first_seen_at', models.DateTimeField(auto_now_add=True)),
+                ('last_seen_at', models.DateTimeField()),
+                ('removed_at', models.DateTimeField(blank=True, null=True)),
+                ('shop', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='category_products', to='parsing.shop')),
+            ],
+            options={
+                'db_table': 'category_products',
+                'constraints': [models.UniqueConstraint(fields=('shop', 'category_key', 'url'), name='category_products_uniq')],
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.4 on 2026-10-18 14:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('parsing', '0007_category_snapshot'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='request',
+            name='checkpoint_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='request',
+            name='checkpoint_links',
+            field=models.JSONField(blank=True, null=True),
+        ),
+    ]
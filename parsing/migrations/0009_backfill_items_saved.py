@@ -0,0 +1,30 @@
+# Статус-эндпоинт берёт results_count из items_saved; у запросов, завершённых
+# до появления счётчиков (0004_request_progress), он нулевой — считаем по результатам
+
+from django.db import migrations
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_items_saved(apps, schema_editor):
+    Request = apps.get_model('parsing', 'Request')
+    Result = apps.get_model('parsing', 'Result')
+    counts = (
+        Result.objects.filter(request=OuterRef('pk'))
+        .order_by()
+        .values('request')
+        .annotate(n=Count('id'))
+        .values('n')
+    )
+    Request.objects.filter(status='done', items_saved=0).update(items_saved=Coalesce(Subquery(counts), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('parsing', '0008_request_checkpoint'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_items_saved, migrations.RunPython.noop),
+    ]
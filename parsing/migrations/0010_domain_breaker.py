@@ -0,0 +1,30 @@
+# Generated by Django 5.2.4 on 2026-10-18 14:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('parsing', '0009_backfill_items_saved'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DomainBreaker',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('domain', models.CharField(max_length=255, unique=True)),
+                ('window_start', models.DateTimeField()),
+                ('ok_count', models.PositiveIntegerField(default=0)),
+                ('fail_count', models.PositiveIntegerField(default=0)),
+                ('prev_ok_count', models.PositiveIntegerField(default=0)),
+                ('prev_fail_count', models.PositiveIntegerField(default=0)),
+                ('open_until', models.DateTimeField(blank=True, null=True)),
+                ('trips', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'db_table': 'navigation_breakers',
+            },
+        ),
+    ]
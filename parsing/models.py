@@ -21,12 +21,40 @@ class Request(models.Model):
     shop = models.ForeignKey(Shop, on_delete=models.CASCADE, related_name="requests")
     url = models.TextField()
     params = JSONField()  # {'category': ..., 'tx1': ..., 'tx2': ...}
-    status = models.CharField(max_length=32, default="pending")  # pending, done, error
+    status = models.CharField(max_length=32, default="pending")  # pending, running, attached, done, error
     error_message = models.TextField(blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    # Очередь: кто и когда взял задачу в работу
+    worker_id = models.CharField(max_length=255, blank=True, null=True)
+    attempts = models.PositiveIntegerField(default=0)
+    started_at = models.DateTimeField(blank=True, null=True)
+    heartbeat_at = models.DateTimeField(blank=True, null=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+
+    # Склейка одинаковых запросов: attached-запрос ждёт результатов leader'а
+    fingerprint = models.CharField(max_length=64, blank=True, null=True, db_index=True)
+    leader = models.ForeignKey(
+        "self", on_delete=models.SET_NULL, blank=True, null=True, related_name="followers"
+    )
+
+    # Прогресс: пишется воркером по ходу задачи, статус-эндпоинт читает только эту строку
+    stage = models.CharField(max_length=32, blank=True, default="")
+    links_found = models.PositiveIntegerField(default=0)
+    pages_processed = models.PositiveIntegerField(default=0)
+    items_saved = models.PositiveIntegerField(default=0)
+    items_failed = models.PositiveIntegerField(default=0)
+
+    # Чекпоинт для продолжения после сбоя: полный список ссылок категории.
+    # Сделанные ссылки — URL уже записанных результатов (parsing/checkpoint.py)
+    checkpoint_links = JSONField(blank=True, null=True)
+    checkpoint_at = models.DateTimeField(blank=True, null=True)
+
     class Meta:
         db_table = "parsing_requests"
+        indexes = [
+            models.Index(fields=["status", "id"], name="parsing_req_status_id_idx"),
+        ]
 
 
 class Result(models.Model):
@@ -40,10 +68,57 @@ class Result(models.Model):
     stock = models.CharField(max_length=50, blank=True, null=True)
     tx1 = models.CharField(max_length=255, blank=True, null=True)
     tx2 = models.CharField(max_length=255, blank=True, null=True)
+    # Только в инкрементальном режиме: new, updated, removed
+    change = models.CharField(max_length=16, blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
         db_table = "parsing_results"
+        indexes = [
+            # Keyset-пагинация результатов запроса: WHERE request_id = ? AND id > ? ORDER BY id
+            models.Index(fields=["request", "id"], name="parsing_res_request_id_idx"),
+        ]
+
+
 
 
 
+class CategoryProduct(models.Model):
+    """
+    Снимок категории для инкрементального парсинга: какие товары в ней были
+    в прошлый раз и их постоянные поля/характеристики.
+    """
+    shop = models.ForeignKey(Shop, on_delete=models.CASCADE, related_name="category_products")
+    category_key = models.CharField(max_length=64, db_index=True)  # sha256 канонического URL категории
+    category_url = models.TextField()
+    url = models.TextField()
+    fields = JSONField(default=dict)  # {'Артикул': ..., 'Название': ..., 'Цена': ..., 'Остаток': ...}
+    props = JSONField(default=dict)
+    first_seen_at = models.DateTimeField(auto_now_add=True)
+    last_seen_at = models.DateTimeField()
+    removed_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        db_table = "category_products"
+        constraints = [
+            models.UniqueConstraint(fields=["shop", "category_key", "url"], name="category_products_uniq"),
+        ]
+
+
+class DomainBreaker(models.Model):
+    """
+    Circuit breaker навигации по домену, общий для всех воркеров и хостов
+    (parsing/navigation.py). Скользящее окно — два соседних интервала по
+    NAVIGATION_BREAKER_WINDOW секунд: текущий и предыдущий.
+    """
+    domain = models.CharField(max_length=255, unique=True)
+    window_start = models.DateTimeField()
+    ok_count = models.PositiveIntegerField(default=0)
+    fail_count = models.PositiveIntegerField(default=0)
+    prev_ok_count = models.PositiveIntegerField(default=0)
+    prev_fail_count = models.PositiveIntegerField(default=0)
+    open_until = models.DateTimeField(blank=True, null=True)
+    trips = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        db_table = "navigation_breakers"
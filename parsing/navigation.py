@@ -0,0 +1,279 @@
+# parsing/navigation.py
+"""
+Общая политика навигации для парсеров: повторы, backoff и circuit breaker.
+
+    resp = await navigation.goto(page, url)            # вместо page.goto(url, timeout=60000)
+    resp = await navigation.goto(page, url, check=...) # check(page) -> вид сбоя или None
+
+- Сбой классифицируется: timeout, network, server_error (5xx), rate_limited
+  (429), forbidden (403), challenge (заглушка), not_found (404/410),
+  client_error (прочие 4xx).
+- Повторяются только временные сбои; пауза — экспоненциальная с джиттером
+  (NAVIGATION_BACKOFF_BASE_MS … NAVIGATION_BACKOFF_CAP_MS), для 429 — Retry-After.
+- На каждый домен свой circuit breaker, общий для всех воркеров и хостов
+  (таблица navigation_breakers). Если в скользящем окне
+  NAVIGATION_BREAKER_WINDOW секунд не меньше NAVIGATION_BREAKER_MIN_REQUESTS
+  запросов и доля «блокирующих» сбоев не меньше NAVIGATION_BREAKER_FAILURE_RATIO,
+  домен закрывается на NAVIGATION_BREAKER_COOLDOWN секунд (с каждым
+  повторным срабатыванием вдвое дольше). Все задачи перед запросом к домену
+  ждут, пока он откроется, вместо того чтобы жечь таймауты на каждой ссылке.
+  Отдельные успехи на фоне частых блокировок breaker не сбрасывают.
+- Запросы к таблице не идут на каждую навигацию: процесс копит счётчики
+  ok/fail в памяти и раз в NAVIGATION_BREAKER_SYNC_INTERVAL секунд сводит их в
+  строку домена F()-прибавлением, заодно перечитывая паузы доменов. wait()
+  смотрит только на локальную копию паузы.
+"""
+import asyncio
+import logging
+import random
+import time
+from collections import Counter
+from datetime import timedelta
+from urllib.parse import urlsplit
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import DomainBreaker
+
+logger = logging.getLogger(__name__)
+
+RETRYABLE = {"timeout", "network", "server_error", "rate_limited", "forbidden", "challenge"}
+# Сбои, которые говорят «сайт нас не пускает / лежит», а не «нет такой страницы»
+BLOCKING = {"timeout", "network", "server_error", "rate_limited", "forbidden", "challenge"}
+
+STATS = Counter()
+
+
+class NavigationError(Exception):
+    def __init__(self, kind, url, message=""):
+        super().__init__(f"{kind}: {url} {message}".strip())
+        self.kind = kind
+        self.url = url
+
+
+def classify(response=None, exc=None):
+    if exc is not None:
+        name = type(exc).__name__
+        if "Timeout" in name or "timeout" in str(exc).lower()[:200]:
+            return "timeout"
+        return "network"
+    status = getattr(response, "status", None)
+    if not status:
+        return "ok"
+    if status in (404, 410):
+        return "not_found"
+    if status == 429:
+        return "rate_limited"
+    if status == 403:
+        return "forbidden"
+    if status >= 500:
+        return "server_error"
+    if status >= 400:
+        return "client_error"
+    return "ok"
+
+
+def backoff_ms(attempt, response=None):
+    if response is not None and getattr(response, "status", None) == 429:
+        try:
+            retry_after = float((response.headers or {}).get("retry-after", ""))
+            return min(retry_after * 1000, settings.NAVIGATION_BACKOFF_CAP_MS)
+        except (TypeError, ValueError):
+            pass
+    delay = min(settings.NAVIGATION_BACKOFF_CAP_MS, settings.NAVIGATION_BACKOFF_BASE_MS * 2 ** attempt)
+    return delay * random.uniform(0.5, 1.5)
+
+
+_states = {}  # domain -> последнее состояние breaker'а, которое видел этот процесс (для логов)
+_pending = {}  # domain -> [ok, fail], ещё не сведённые в таблицу
+_open_until = {}  # domain -> пауза домена по последней сверке с таблицей
+_synced_at = 0.0
+_syncing = False
+
+
+def domain_of(url):
+    host = (urlsplit(url).hostname or "").lower()
+    return host[4:] if host.startswith("www.") else host
+
+
+def _roll(row, now):
+    # Сдвигаем окно: текущий интервал становится предыдущим
+    window = timedelta(seconds=settings.NAVIGATION_BREAKER_WINDOW)
+    elapsed = now - row.window_start
+    if elapsed >= 2 * window:
+        row.prev_ok_count = row.prev_fail_count = 0
+        row.ok_count = row.fail_count = 0
+        row.window_start = now
+        return "restart"
+    if elapsed >= window:
+        row.prev_ok_count, row.prev_fail_count = row.ok_count, row.fail_count
+        row.ok_count = row.fail_count = 0
+        row.window_start += window
+        return "shift"
+    return None
+
+
+def _window_counts(row, now):
+    # Предыдущий интервал учитываем с весом той части, что ещё попадает в окно
+    elapsed = (now - row.window_start).total_seconds()
+    weight = max(0.0, 1 - elapsed / settings.NAVIGATION_BREAKER_WINDOW)
+    return row.prev_ok_count * weight + row.ok_count, row.prev_fail_count * weight + row.fail_count
+
+
+def _evaluate(row, now):
+    """
+    Решение по окну: "trip" (row закрыт паузой, счётчики сброшены), "reset"
+    (сбоев мало — счётчик срабатываний обнулён) или None. Возвращает
+    (решение, доля сбоев, запросов в окне).
+    """
+    ok, fail = _window_counts(row, now)
+    total = ok + fail
+    ratio = fail / total if total else 0.0
+    is_open = row.open_until is not None and row.open_until > now
+    if total < settings.NAVIGATION_BREAKER_MIN_REQUESTS or is_open:
+        return None, ratio, total
+    if ratio >= settings.NAVIGATION_BREAKER_FAILURE_RATIO:
+        cooldown = settings.NAVIGATION_BREAKER_COOLDOWN * 2 ** min(row.trips, 4)
+        row.open_until = now + timedelta(seconds=cooldown)
+        row.trips += 1
+        # После паузы домен оценивается заново
+        row.prev_ok_count = row.prev_fail_count = row.ok_count = row.fail_count = 0
+        row.window_start = row.open_until
+        return "trip", ratio, total
+    if ratio < settings.NAVIGATION_BREAKER_FAILURE_RATIO / 2 and row.trips:
+        row.trips = 0
+        return "reset", ratio, total
+    return None, ratio, total
+
+
+def _flush_domain(domain, ok, fail, now):
+    breakers = DomainBreaker.objects.filter(domain=domain)
+    row, _ = DomainBreaker.objects.get_or_create(domain=domain, defaults={"window_start": now})
+    start = row.window_start
+    rolled = _roll(row, now)
+    if rolled:
+        if rolled == "shift":
+            counts = {"prev_ok_count": F("ok_count"), "prev_fail_count": F("fail_count")}
+        else:
+            counts = {"prev_ok_count": 0, "prev_fail_count": 0}
+        # Окно сдвигает тот, кто успел первым; остальные увидят уже сдвинутое
+        breakers.filter(window_start=start).update(window_start=row.window_start, ok_count=0, fail_count=0, **counts)
+    if ok or fail:
+        breakers.update(ok_count=F("ok_count") + ok, fail_count=F("fail_count") + fail)
+    row.refresh_from_db()
+    trips = row.trips
+    decision, ratio, total = _evaluate(row, now)
+    if decision == "trip":
+        tripped = breakers.filter(Q(open_until__isnull=True) | Q(open_until__lte=now), trips=trips).update(
+            open_until=row.open_until, trips=row.trips, window_start=row.window_start,
+            ok_count=0, fail_count=0, prev_ok_count=0, prev_fail_count=0,
+        )
+        if tripped:
+            STATS["breaker_trips"] += 1
+            logger.warning(
+                "Circuit breaker open for %s: %.0f%% failures, pause %.0f s",
+                domain, ratio * 100, (row.open_until - now).total_seconds(),
+            )
+        else:
+            # Домен уже закрыл другой воркер
+            row.refresh_from_db()
+    elif decision == "reset":
+        breakers.update(trips=0)
+    _open_until[domain] = row.open_until
+    _states[domain] = {"failure_ratio": round(ratio, 2), "requests": round(total), "trips": row.trips, "open_until": row.open_until}
+
+
+def _flush(batch):
+    now = timezone.now()
+    for domain, (ok, fail) in batch.items():
+        _flush_domain(domain, ok, fail, now)
+    idle = [d for d in _open_until if d not in batch]
+    if idle:
+        for domain, open_until in DomainBreaker.objects.filter(domain__in=idle).values_list("domain", "open_until"):
+            _open_until[domain] = open_until
+
+
+async def sync(force=False):
+    """
+    Сводит накопленные счётчики в таблицу (атомарным F()-прибавлением) и
+    обновляет паузы доменов — не чаще раза в NAVIGATION_BREAKER_SYNC_INTERVAL
+    секунд, если не force.
+    """
+    global _pending, _synced_at, _syncing
+    if _syncing or (not force and time.monotonic() - _synced_at < settings.NAVIGATION_BREAKER_SYNC_INTERVAL):
+        return
+    _syncing = True
+    batch, _pending = _pending, {}
+    try:
+        await sync_to_async(_flush)(batch)
+    except Exception:
+        # Breaker — подсказка; без БД навигация всё равно идёт
+        logger.debug("navigation: breaker sync failed", exc_info=True)
+    finally:
+        _synced_at = time.monotonic()
+        _syncing = False
+
+
+async def wait(url):
+    """Ждёт, пока breaker домена закрыт паузой (решение общее для всех воркеров)."""
+    domain = domain_of(url)
+    _open_until.setdefault(domain, None)
+    while True:
+        await sync()
+        open_until = _open_until.get(domain)
+        left = (open_until - timezone.now()).total_seconds() if open_until else 0
+        if left <= 0:
+            return
+        STATS["breaker_waits"] += 1
+        await asyncio.sleep(min(left, 5))
+
+
+async def record(url, kind):
+    """Учесть результат запроса к домену (и goto, и HTTP-клиент, и API)."""
+    STATS[kind] += 1
+    counts = _pending.setdefault(domain_of(url), [0, 0])
+    counts[kind in BLOCKING] += 1
+    await sync()
+
+
+async def goto(page, url, tries=None, timeout=60000, wait_until="load", check=None):
+    """
+    page.goto с политикой повторов. check(page) (корутина) может вернуть вид
+    сбоя, например "challenge", если страница загрузилась, но не та.
+    Возвращает ответ последней попытки; если все попытки упали с исключением,
+    бросает NavigationError.
+    """
+    tries = tries or settings.NAVIGATION_TRIES
+    response, last_exc = None, None
+    for attempt in range(tries):
+        await wait(url)
+        try:
+            response = await page.goto(url, wait_until=wait_until, timeout=timeout)
+            last_exc = None
+            kind = classify(response)
+            if kind == "ok" and check is not None:
+                kind = await check(page) or "ok"
+        except Exception as e:
+            response, last_exc = None, e
+            kind = classify(exc=e)
+        await record(url, kind)
+
+        if kind == "ok":
+            return response
+        if kind not in RETRYABLE or attempt == tries - 1:
+            break
+        await asyncio.sleep(backoff_ms(attempt, response) / 1000)
+
+    if last_exc is not None:
+        raise NavigationError(classify(exc=last_exc), url, str(last_exc)[:200]) from last_exc
+    return response
+
+
+def stats():
+    return {
+        "kinds": dict(STATS),
+        "breakers": {d: st for d, st in _states.items() if st["trips"] or st["failure_ratio"]},
+    }
@@ -1,31 +1,77 @@
 import re
 from . import register_parser
-from urllib.parse import urljoin
-from playwright.async_api import async_playwright
+from urllib.parse import urljoin, urlparse
 from bs4 import BeautifulSoup
+from .. import checkpoint, navigation, progress, session_store
+from ..browser_pool import get_browser_pool
+from ..incremental import plan_for_job
+from ..listing_api import collect_from_api, listing_capture
+from ..product_cache import cached_product
+from ..product_fetch import iter_products, workers_for
+from ..resource_blocking import install_blocking
+from ..tx_matcher import PropsIndex, matcher_for
+from ..waits import wait_for_count_change, wait_for_dom_quiet, wait_for_selector
+
+BASE = "https://baucenter.ru"
+CARD_SELECTOR = "[data-product-card-id]"
 
 
 def normalize(text):
     return re.sub(r"\W+", "", str(text).lower()).strip()
 
 
-async def extract_links(page, url):
-    await page.goto(url, timeout=60000)
+def product_url(value):
+    u = urljoin(BASE, value)
+    parts = urlparse(u)
+    if parts.netloc.endswith("baucenter.ru") and parts.path.startswith("/product/"):
+        return u
+    return None
+
+
+async def read_total(page, timeout=10000):
+    """Число товаров со счётчика категории или None."""
+    try:
+        await page.wait_for_selector("p:has-text('товар')", timeout=timeout)
+        total_text = await page.inner_text("p:has-text('товар')")
+        return int(re.search(r"\d+", total_text).group())
+    except:
+        return None
+
+
+async def extract_links(page, url, region_known=False):
+    # Ответы API каталога ловим с первой загрузки; DOM — фоллбэк
+    capture = listing_capture(page, "baucenter")
+    try:
+        return await _extract_links(page, url, capture, region_known)
+    finally:
+        if capture is not None:
+            capture.detach()
+
+
+async def _extract_links(page, url, capture, region_known):
+    await navigation.goto(page, url)
     try:
-        await page.locator('button:has-text("Да")').click(timeout=3000)
-        await page.wait_for_timeout(1500)
+        # Регион из сохранённой сессии уже выбран — вопрос, скорее всего, не появится
+        await page.locator('button:has-text("Да")').click(timeout=300 if region_known else 3000)
+        await wait_for_dom_quiet(page, cap_ms=1500, label="baucenter.region")
         await page.reload(timeout=60000)
-        await page.wait_for_timeout(1500)
     except:
         pass
 
-    await page.wait_for_selector("p:has-text('товар')", timeout=10000)
-    total_text = await page.inner_text("p:has-text('товар')")
-    total = int(re.search(r"\d+", total_text).group())
+    # Счётчик на странице — проверка для общего числа из API
+    counter = await read_total(page, timeout=3000)
+    got = await collect_from_api(page, capture, product_url, expected=counter)
+    if got is not None:
+        links, total = got
+        return links, total or len(links)
+
+    total = counter if counter is not None else await read_total(page)
+    if total is None:
+        raise Exception("❌ Не найден счётчик товаров категории")
 
     last_count = 0
     for _ in range(15):
-        cards = await page.query_selector_all("[data-product-card-id]")
+        cards = await page.query_selector_all(CARD_SELECTOR)
         if len(cards) == last_count:
             break
         last_count = len(cards)
@@ -34,26 +80,27 @@ async def extract_links(page, url):
             break
         await show_more.scroll_into_view_if_needed()
         await show_more.click()
-        await page.wait_for_timeout(3000)
+        # Ждём, пока догрузятся новые карточки, а не фиксированные 3 секунды
+        await wait_for_count_change(page, CARD_SELECTOR, last_count, cap_ms=3000, label="baucenter.show_more")
 
     links = set()
-    cards = await page.query_selector_all("[data-product-card-id]")
+    cards = await page.query_selector_all(CARD_SELECTOR)
     for card in cards:
         a = await card.query_selector('a[href^="/product/"]')
         if a:
             href = await a.get_attribute("href")
             if href:
-                links.add(urljoin("https://baucenter.ru", href))
+                links.add(urljoin(BASE, href))
 
     if abs(len(links) - total) > 2:
-        await page.wait_for_timeout(3000)
-        cards = await page.query_selector_all("[data-product-card-id]")
+        await wait_for_count_change(page, CARD_SELECTOR, len(cards), cap_ms=3000, label="baucenter.cards_settle")
+        cards = await page.query_selector_all(CARD_SELECTOR)
         for card in cards:
             a = await card.query_selector('a[href^="/product/"]')
             if a:
                 href = await a.get_attribute("href")
                 if href:
-                    links.add(urljoin("https://baucenter.ru", href))
+                    links.add(urljoin(BASE, href))
 
     if abs(len(links) - total) > 2:
         raise Exception(f"❌ Ссылок: {len(links)} ≠ товаров: {total}")
@@ -61,24 +108,14 @@ async def extract_links(page, url):
     return list(links), total
 
 
-async def extract_data(page, url, tx1, tx2):
-    await page.goto(url, timeout=60000)
-    await page.wait_for_timeout(2000)
-    soup = BeautifulSoup(await page.content(), "lxml")
-
+def extract_price_stock(soup):
     def extract_number(text):
         digits = re.findall(r"\d+", text.replace(" ", ""))
         return int("".join(digits)) if digits else "Н/Д"
 
-    name_elem = soup.select_one("h1")
-    name = name_elem.get_text(strip=True) if name_elem else "Н/Д"
-
     price_elem = soup.select_one('span[class*="MainPrice"]')
     price = extract_number(price_elem.get_text()) if price_elem else "Н/Д"
 
-    article_elem = soup.select_one('span[class*="CopiedTypography"] span')
-    article = article_elem.get_text(strip=True) if article_elem else "Н/Д"
-
     stock = "Н/Д"
     try:
         stock_p = soup.select_one(
@@ -88,19 +125,33 @@ async def extract_data(page, url, tx1, tx2):
             stock = re.sub(r"\D+", "", stock_p.get_text(strip=True)) or "Н/Д"
     except:
         pass
+    return {"Цена": price, "Остаток": stock}
+
+
+async def extract_product(page, url):
+    """Открывает карточку и возвращает (поля, словарь характеристик, None)."""
+    await navigation.goto(page, url)
+    # Цена и характеристики дорисовываются JS: ждём цену, затем затишья DOM
+    await wait_for_selector(page, 'span[class*="MainPrice"]', cap_ms=1500, label="baucenter.price")
+    await wait_for_dom_quiet(page, cap_ms=500, label="baucenter.product", quiet_ms=200)
+    soup = BeautifulSoup(await page.content(), "lxml")
+
+    name_elem = soup.select_one("h1")
+    name = name_elem.get_text(strip=True) if name_elem else "Н/Д"
+
+    article_elem = soup.select_one('span[class*="CopiedTypography"] span')
+    article = article_elem.get_text(strip=True) if article_elem else "Н/Д"
 
-    main_info = {
-        "Ссылка": url,
+    fields = {
         "Артикул": article,
         "Название": name,
-        "Цена": price,
-        "Остаток": stock,
+        **extract_price_stock(soup),
     }
 
-    props = soup.select('div[class^="styled__ProductCardProperty-sc-"]')
-    for prop in props:
+    # Все характеристики: нормализованное название -> значение
+    props = {}
+    for prop in soup.select('div[class^="styled__ProductCardProperty-sc-"]'):
         key_el = prop.select_one("span")
-        val_el = prop.select_one("a, p, div[class*='ProductCardPropertyValue']")
         if key_el:
             key = key_el.get_text(strip=True)
             candidates = [
@@ -111,38 +162,73 @@ async def extract_data(page, url, tx1, tx2):
                 if el.get_text(strip=True) != key
             ]
             if candidates:
-                value = candidates[0]
-                if normalize(key) == normalize(tx1):
-                    main_info[f"ТХ1_{tx1}"] = value
-                if normalize(key) == normalize(tx2):
-                    main_info[f"ТХ2_{tx2}"] = value
+                props[normalize(key)] = candidates[0]
+
+    return fields, props, None
+
+
+async def refresh_product(page, url):
+    """Дешёвое обновление известного товара: только цена и остаток, без ожидания характеристик."""
+    await navigation.goto(page, url)
+    await wait_for_selector(page, 'span[class*="MainPrice"]', cap_ms=1500, label="baucenter.price")
+    return extract_price_stock(BeautifulSoup(await page.content(), "lxml"))
 
-    if f"ТХ1_{tx1}" not in main_info:
-        main_info[f"ТХ1_{tx1}"] = "Н/Д"
-    if f"ТХ2_{tx2}" not in main_info:
-        main_info[f"ТХ2_{tx2}"] = "Н/Д"
 
+def build_row(url, fields, props, tx1, tx2):
+    main_info = {"Ссылка": url, **fields}
+    index = PropsIndex(props)
+    main_info[f"ТХ1_{tx1}"] = matcher_for(tx1).value(index)
+    main_info[f"ТХ2_{tx2}"] = matcher_for(tx2).value(index)
     return main_info
 
+
+async def extract_data(page, url, tx1, tx2):
+    # Сначала кэш карточек: страница открывается только при промахе
+    fields, props, _ = await cached_product("baucenter", url, lambda: extract_product(page, url))
+    return build_row(url, fields, props, tx1, tx2)
+
 @register_parser("baucenter", "Бауцентр")
 async def run_parser(url, tx1, tx2):
-    results = []
-    async with async_playwright() as p:
-        browser = await p.chromium.launch(headless=True)
-        context = await browser.new_context(
-            user_agent="Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/136.0.0.0 Safari/537.36",
-            locale="ru-RU",
-            viewport={"width": 1280, "height": 800},
-            geolocation={"longitude": 37.6173, "latitude": 55.7558},
-            permissions=["geolocation"],
-        )
-        page = await context.new_page()
-        links, _ = await extract_links(page, url)
-        for link in links:
-            try:
-                data = await extract_data(page, link, tx1, tx2)
-                results.append(data)
-            except Exception as e:
-                continue
-        await browser.close()
-    return results
+    pool = await get_browser_pool()
+    # Cookies с выбранным регионом с прошлого прохода
+    session = session_store.context_kwargs("baucenter", "chromium")
+    async with pool.context(
+        "chromium",
+        user_agent="Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/136.0.0.0 Safari/537.36",
+        locale="ru-RU",
+        viewport={"width": 1280, "height": 800},
+        geolocation={"longitude": 37.6173, "latitude": 55.7558},
+        permissions=["geolocation"],
+        **session,
+    ) as context:
+        await install_blocking(context, "baucenter")
+        # Повторная попытка задачи берёт листинг из чекпоинта
+        links = checkpoint.saved_links()
+        if links is None:
+            page = await context.new_page()
+            progress.set_stage("links")
+            links, _ = await extract_links(page, url, region_known=bool(session))
+            await page.close()
+            await checkpoint.save_links(links)
+        progress.set_value("links_found", len(links))
+
+        plan = await plan_for_job("baucenter", url, links)
+
+        async def fetch(page, link):
+            if plan is None:
+                return await extract_data(page, link, tx1, tx2)
+            return await plan.fetch(
+                link,
+                full=lambda: cached_product("baucenter", link, lambda: extract_product(page, link)),
+                refresh=lambda: refresh_product(page, link),
+                build=lambda fields, props, _: build_row(link, fields, props, tx1, tx2),
+            )
+
+        async for item in iter_products(context, checkpoint.pending(links), fetch, workers=workers_for("baucenter")):
+            yield item
+        await session_store.save(context, "baucenter", "chromium")
+
+        if plan is not None:
+            for row in plan.removed_rows():
+                yield row
+            await plan.save()
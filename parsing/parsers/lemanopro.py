@@ -1,13 +1,12 @@
 # parsing/parsers/lemanapro.py
 import re
 import os
-import json
-import difflib
 import tempfile
-from urllib.parse import urljoin, urlparse
+from contextlib import AsyncExitStack, asynccontextmanager
+from urllib.parse import parse_qsl, urlencode, urljoin, urlparse, urlsplit, urlunsplit
 
 from bs4 import BeautifulSoup
-from playwright.async_api import async_playwright
+from django.conf import settings
 
 try:
     from playwright_stealth import stealth_async
@@ -16,6 +15,19 @@ except Exception:
         return
 
 from . import register_parser
+from .. import checkpoint, engine_health, navigation, progress, session_store
+from ..api_capture import JsonCapture
+from ..browser_pool import get_browser_pool
+from ..incremental import plan_for_job
+from ..listing_api import collect_from_api, listing_capture
+from ..listing_fetch import iter_listing_pages, listing_workers_for
+from ..product_cache import cached_product
+from ..profile_manager import get_profile_manager
+from ..product_document import ProductDocument
+from ..product_fetch import iter_products, workers_for
+from ..resource_blocking import install_blocking
+from ..tx_matcher import FUZZY, PropsIndex, matcher_for
+from ..waits import wait_for_dom_quiet, wait_for_height_change, wait_until_not_challenge
 
 BASE = "https://lemanapro.ru"
 DEBUG_DIR = tempfile.gettempdir()
@@ -63,52 +75,51 @@ def parse_rub_price(text):
         return int("".join(digits)) if digits else "Н/Д"
 
 
+CHALLENGE_MARKERS = (
+    "ddos-guard", "checking your browser", "/cdn-cgi/challenge",
+    "captcha", "just a moment", "server error",
+)
+
+
 def is_challenge_html(html: str) -> bool:
     low = html.lower()
-    return any(s in low for s in [
-        "ddos-guard", "checking your browser", "/cdn-cgi/challenge",
-        "captcha", "just a moment", "server error"
-    ])
+    return any(s in low for s in CHALLENGE_MARKERS)
 
 
 async def maybe_pass_challenge(page):
     html = await page.content()
     if is_challenge_html(html):
-        await page.wait_for_timeout(7000)
+        # Сохранённая сессия не помогла: после прохода её надо перезаписать
+        session_store.note_challenge(page.context)
+        # Заглушка часто сама уводит на контент после JS-проверки — ждём этого, а не 7 с вслепую
+        if await wait_until_not_challenge(page, cap_ms=7000, label="lemanapro.challenge", markers=CHALLENGE_MARKERS):
+            await wait_for_dom_quiet(page, cap_ms=800, label="lemanapro.after_challenge")
+            return
         try:
             await page.reload(timeout=60000)
             await page.wait_for_load_state("domcontentloaded")
-            await page.wait_for_timeout(800)
+            await wait_for_dom_quiet(page, cap_ms=800, label="lemanapro.after_challenge")
         except:
             pass
 
 
-async def goto_with_retries(page, url, tries=3, tag=""):
-    last_resp = None
-    for attempt in range(tries):
-        try:
-            last_resp = await page.goto(url, wait_until="domcontentloaded", timeout=60000)
-            await page.wait_for_timeout(400)
-        except:
-            last_resp = None
-
-        html = await page.content()
-        status = last_resp.status if last_resp else None
-        bad = is_challenge_html(html) or (status and status >= 500)
+async def challenge_check(page):
+    # Страница ответила, но это заглушка или пустой документ — повторяем по общей политике
+    await wait_for_dom_quiet(page, cap_ms=400, label="lemanapro.goto", quiet_ms=150)
+    html = await page.content()
+    if is_challenge_html(html):
+        return "challenge"
+    if not html.strip():
+        return "network"
+    return None
 
-        if not bad and html.strip():
-            return last_resp
 
-        if attempt < tries - 1:
-            await page.wait_for_timeout(1200 * (attempt + 1))
-            try:
-                await page.reload(timeout=60000)
-                await page.wait_for_load_state("domcontentloaded")
-                await page.wait_for_timeout(300)
-            except:
-                pass
-
-    return last_resp
+async def goto_with_retries(page, url, tries=3, tag=""):
+    """Навигация по общей политике (parsing/navigation.py); None, если страница так и не открылась."""
+    try:
+        return await navigation.goto(page, url, tries=tries, wait_until="domcontentloaded", check=challenge_check)
+    except navigation.NavigationError:
+        return None
 
 
 async def safe_click_button(page, selectors, timeout=2000):
@@ -122,7 +133,7 @@ async def safe_click_button(page, selectors, timeout=2000):
                     continue
                 await el.scroll_into_view_if_needed()
                 await el.click(timeout=timeout)
-                await page.wait_for_timeout(500)
+                await wait_for_dom_quiet(page, cap_ms=500, label="lemanapro.click", quiet_ms=150)
                 return True
         except:
             continue
@@ -137,7 +148,8 @@ async def auto_scroll(page, max_rounds=30, sleep_ms=700):
         except:
             h = 0
         await page.mouse.wheel(0, h or 1500)
-        await page.wait_for_timeout(sleep_ms)
+        # Новая порция контента увеличит высоту — дальше ждать незачем
+        await wait_for_height_change(page, h, cap_ms=sleep_ms, label="lemanapro.scroll")
         try:
             new_h = await page.evaluate("document.body ? document.body.scrollHeight : 0")
         except:
@@ -176,7 +188,71 @@ def extract_pagination_urls_from_html(html, current_url):
     return sorted(found, key=page_num)
 
 
-async def collect_links(page, category_url):
+def page_number(url):
+    m = re.search(r'[?&]page=(\d+)', url)
+    return int(m.group(1)) if m else None
+
+
+def with_page(url, n):
+    parts = urlsplit(url)
+    query = [(k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True) if k != "page"]
+    if n > 1:
+        query.append(("page", str(n)))
+    return urlunsplit(parts._replace(query=urlencode(query)))
+
+
+def product_links_from_hrefs(hrefs):
+    links = []
+    for h in hrefs or []:
+        u = urljoin(BASE, h)
+        if any(x in u for x in ["#", "/compare", "/favorites", "/filter/", "?PAGEN_"]):
+            continue
+        # только реальные карточки
+        parts = urlparse(u).path.strip("/").split("/")
+        if len(parts) >= 2 and parts[0] == "product":
+            links.append(u)
+    return links
+
+
+async def page_product_hrefs(page):
+    try:
+        return await page.evaluate("""() => Array.from(document.querySelectorAll('a[href*="/product/"]'))
+            .map(a => a.getAttribute('href')).filter(Boolean)""")
+    except:
+        return []
+
+
+async def fetch_listing_page(page, page_url):
+    """Одна страница листинга: (ссылки на товары, ссылки пагинации на ней)."""
+    await goto_with_retries(page, page_url, tries=3, tag="category_page")
+    await maybe_pass_challenge(page)
+    hrefs = await page_product_hrefs(page)
+    more_pages = extract_pagination_urls_from_html(await page.content(), page_url)
+    return product_links_from_hrefs(hrefs), more_pages
+
+
+async def collect_links(page, category_url, new_page=None):
+    """
+    Диапазон страниц берём из пагинации первой страницы (?page=N, максимум N),
+    остальные страницы листинга открываем параллельно (LISTING_FETCH_WORKERS).
+    Если пагинатор показывает только окно страниц, диапазон расширяется
+    по ссылкам с уже загруженных страниц.
+    Сначала пробуем взять весь список из API каталога (parsing/listing_api.py).
+    """
+    capture = listing_capture(page, "lemanapro")
+    try:
+        return await _collect_links(page, category_url, capture, new_page)
+    finally:
+        if capture is not None:
+            capture.detach()
+
+
+def product_url(value):
+    links = product_links_from_hrefs([value])
+    return links[0] if links and urlparse(links[0]).netloc.endswith("lemanapro.ru") else None
+
+
+async def _collect_links(page, category_url, capture, new_page):
     await goto_with_retries(page, category_url, tries=3, tag="category")
     await maybe_pass_challenge(page)
 
@@ -199,100 +275,76 @@ async def collect_links(page, category_url):
     except:
         pass
 
-    # Инициализируем очередь страниц пагинации
-    to_visit = []
-    visited_pages = set()
-    initial_pages = [category_url] + extract_pagination_urls_from_html(html, category_url)
-    # Уберём дубликаты, сохраним порядок
-    seen = set()
-    for u in initial_pages:
-        if u not in seen:
-            seen.add(u)
-            to_visit.append(u)
-
-    links = set()
-    empty_pages_seen = 0
-    MAX_PAGES = 100  # защита от бесконечного обхода
-
-    while to_visit and len(visited_pages) < MAX_PAGES:
-        page_url = to_visit.pop(0)
-        if page_url in visited_pages:
-            continue
-        visited_pages.add(page_url)
-
-        await goto_with_retries(page, page_url, tries=3, tag="category_page")
-        await maybe_pass_challenge(page)
-        await page.wait_for_timeout(200)
+    got = await collect_from_api(page, capture, product_url)
+    if got is not None:
+        links, total = got
+        return links, {
+            "title": first_title,
+            "blocked": False,
+            "pages_visited": 1,
+            "source": "api",
+            "total": total,
+        }
 
-        # Собираем ссылки на товары
-        try:
-            hrefs = await page.evaluate("""() => Array.from(document.querySelectorAll('a[href*="/product/"]'))
-                .map(a => a.getAttribute('href')).filter(Boolean)""")
-        except:
-            hrefs = []
+    MAX_PAGES = 100  # защита от бесконечного обхода
 
-        added = 0
-        for h in hrefs or []:
-            u = urljoin(BASE, h)
-            if any(x in u for x in ["#", "/compare", "/favorites", "/filter/", "?PAGEN_"]):
+    # Страница определяется номером ?page=N, а без номера — самим URL
+    def page_id(u):
+        return page_number(u) or (1 if u == category_url else u)
+
+    by_page = {1: product_links_from_hrefs(await page_product_hrefs(page))}
+    visited = {1}
+    last = 1
+
+    def plan_pages(found):
+        nonlocal last
+        todo = []
+        top = max([page_number(u) or 1 for u in found] + [last])
+        # Недостающие номера между известным концом и новым максимумом
+        for n in range(last + 1, min(top, MAX_PAGES) + 1):
+            todo.append(with_page(category_url, n))
+        last = max(last, min(top, MAX_PAGES))
+        for u in found:
+            if page_number(u) is None and page_id(u) not in visited:
+                todo.append(u)
+        todo = [u for u in dict.fromkeys(todo) if page_id(u) not in visited]
+        visited.update(page_id(u) for u in todo)
+        return todo
+
+    todo = plan_pages(extract_pagination_urls_from_html(html, category_url))
+    errors = []
+    while todo:
+        found = []
+        async for page_url, got in iter_listing_pages(
+            page.context, todo, fetch_listing_page,
+            workers=listing_workers_for("lemanapro"),
+            new_page=new_page,
+            errors=errors,
+        ):
+            if got is None:
                 continue
-            # только реальные карточки
-            parts = urlparse(u).path.strip("/").split("/")
-            if len(parts) >= 2 and parts[0] == "product":
-                if u not in links:
-                    links.add(u)
-                    added += 1
-
-        # Пустые хвостовые страницы — просто учитываем и продолжаем
-        if added == 0:
-            empty_pages_seen += 1
-
-        # На каждой странице расширяем список страниц пагинации
-        page_html = await page.content()
-        more_pages = extract_pagination_urls_from_html(page_html, page_url)
-        for u in more_pages:
-            if u not in visited_pages and u not in to_visit:
-                to_visit.append(u)
-
-        # Немного подождать перед следующей страницей
-        await page.wait_for_timeout(150)
-
-        # Если много страниц оказались пустыми подряд — можно ускориться, но не прерываемся жёстко
-        if empty_pages_seen >= 5 and len(visited_pages) > 5:
-            # вероятно, достигли хвоста
-            break
+            page_links, more_pages = got
+            by_page[page_id(page_url)] = page_links
+            found.extend(more_pages)
+        todo = plan_pages(found) if len(visited) < MAX_PAGES else []
+
+    # Порядок ссылок — по номерам страниц, как при последовательном обходе
+    ordered = sorted(by_page, key=lambda k: (0, k) if isinstance(k, int) else (1, str(k)))
+    links = list(dict.fromkeys(u for k in ordered for u in by_page[k]))
 
     blocked = is_challenge_html(await page.content())
-    return list(links), {
+    return links, {
         "title": first_title,
         "blocked": blocked,
-        "pages_visited": len(visited_pages),
+        "pages_visited": len(by_page),
+        "page_errors": errors[:5],
     }
 
 
-def parse_jsonld(soup):
-    products = []
-    for script in soup.select('script[type="application/ld+json"]'):
-        try:
-            data = json.loads(script.string or "")
-        except Exception:
-            continue
-        nodes = data if isinstance(data, list) else [data]
-        for node in nodes:
-            if not isinstance(node, dict):
-                continue
-            if node.get("@type") == "Product":
-                products.append(node)
-            if "@graph" in node and isinstance(node["@graph"], list):
-                for g in node["@graph"]:
-                    if isinstance(g, dict) and g.get("@type") == "Product":
-                        products.append(g)
-    return products
-
-
-def extract_price(soup):
+def extract_price(doc):
+    soup = doc.soup
     # 1) JSON-LD
-    for p in parse_jsonld(soup):
+    for p in doc.jsonld:
         offer = p.get("offers") or {}
         price = None
         if isinstance(offer, dict):
@@ -342,187 +394,17 @@ def extract_price(soup):
     return "Н/Д"
 
 
-def extract_article(soup):
+def extract_article(doc):
     # JSON-LD
-    for p in parse_jsonld(soup):
+    for p in doc.jsonld:
         sku = p.get("sku") or p.get("mpn")
         if sku:
             return str(sku).strip()
     # Явные подписи
-    val = find_value_by_labels(soup, ["Артикул", "Код товара", "Модель", "SKU", "Код"])
+    val = doc.value_by_labels(["Артикул", "Код товара", "Модель", "SKU", "Код"])
     return val or "Н/Д"
 
 
-def expand_tx_aliases(tx):
-    if not tx:
-        return []
-    t = normalize(tx)
-    aliases = [tx]  # оригинал тоже проверяем
-    # Мощность
-    if "мощност" in t:
-        aliases += ["Мощность", "Потребляемая мощность", "Номинальная мощность", "Мощность двигателя"]
-    # Скорость / обороты
-    if "скорост" in t or "обмин" in t or "rpm" in t or "обор" in t:
-        aliases += ["Скорость вращения", "Частота вращения", "Обороты", "Обороты холостого хода", "Скорость холостого хода"]
-    # Энергия удара
-    if "энерг" in t and "удар" in t:
-        aliases += ["Энергия удара", "Сила удара"]
-    # Частота ударов
-    if "частота" in t and "удар" in t:
-        aliases += ["Число ударов", "Частота ударов"]
-    # АКБ
-    if "напряжен" in t:
-        aliases += ["Напряжение", "Напряжение аккумулятора"]
-    if "емкост" in t or "ёмкост" in t:
-        aliases += ["Емкость аккумулятора", "Ёмкость аккумулятора"]
-
-    # dedup
-    seen, res = set(), []
-    for a in aliases:
-        if a not in seen:
-            seen.add(a)
-            res.append(a)
-    return res
-
-
-def find_value_by_labels(soup, labels):
-    # labels — список «что ищем»; матчим по подстроке (normalized)
-    norm_labels = [normalize(l) for l in labels if l]
-    if not norm_labels:
-        return None
-
-    def match_key(k):
-        nk = normalize(k)
-        return any(nl in nk or nk in nl for nl in norm_labels)
-
-    # Таблицы
-    for row in soup.select("table tr"):
-        cells = row.find_all(["th", "td"])
-        if len(cells) >= 2:
-            key = cells[0].get_text(" ", strip=True)
-            if match_key(key):
-                return cells[1].get_text(" ", strip=True)
-
-    # dl dt/dd
-    for dt in soup.select("dl dt"):
-        key = dt.get_text(" ", strip=True)
-        if match_key(key):
-            dd = dt.find_next("dd")
-            if dd:
-                return dd.get_text(" ", strip=True)
-
-    # Контейнеры характеристик
-    for container in soup.select(".characteristics, .props, .product-props, .product-attrs, .char, .chars, .properties, .product-properties, .product__chars, .product-specs"):
-        for row in container.select("div, li, p"):
-            spans = row.find_all("span")
-            if len(spans) >= 2:
-                key = spans[0].get_text(" ", strip=True)
-                if match_key(key):
-                    return spans[1].get_text(" ", strip=True)
-            key_el = row.find(["b", "strong"])
-            if key_el and match_key(key_el.get_text(" ", strip=True)):
-                key_el.extract()
-                return row.get_text(" ", strip=True)
-
-    # Фоллбэк: "Ключ: Значение" в тексте
-    text = soup.get_text("\n", strip=True)
-    for lab in labels:
-        lab_clean = re.sub(r"\s*KATEX_INLINE_OPEN.*?KATEX_INLINE_CLOSE\s*", "", lab).strip()
-        if not lab_clean:
-            continue
-        rx = re.compile(rf"{re.escape(lab_clean)}\s*[:\-–]\s*([^\n\r;|]+)", re.I)
-        m = rx.search(text)
-        if m:
-            return m.group(1).strip()
-
-    return None
-
-
-def build_props_dict(soup):
-    props = {}
-
-    # A) JSON-LD additionalProperty (PropertyValue)
-    for p in parse_jsonld(soup):
-        addp = p.get("additionalProperty") or p.get("additionalProperties")
-        if isinstance(addp, list):
-            for it in addp:
-                if not isinstance(it, dict):
-                    continue
-                key = it.get("name") or it.get("propertyID")
-                val = it.get("value") or it.get("valueReference") or it.get("propertyValue")
-                if key and val:
-                    props[normalize(key)] = str(val).strip()
-
-    # B) Microdata/LD propertyValue
-    for pv in soup.select('[itemprop="additionalProperty"], [itemtype*="PropertyValue"]'):
-        key_el = pv.select_one('[itemprop="name"]')
-        val_el = pv.select_one('[itemprop="value"]')
-        if key_el and val_el:
-            key = key_el.get_text(" ", strip=True)
-            val = val_el.get_text(" ", strip=True)
-            if key and val:
-                props[normalize(key)] = val
-
-    # C) data-qa name/value (частая React-вёрстка)
-    name_nodes = soup.select('[data-qa*="char"][data-qa*="name"], [data-qa*="spec"][data-qa*="name"], [data-qa*="param"][data-qa*="name"], [data-qa*="character"][data-qa*="name"]')
-    for name_el in name_nodes:
-        key = name_el.get_text(" ", strip=True)
-        if not key:
-            continue
-        row = name_el.parent
-        val_el = row.select_one('[data-qa*="value"]')
-        if not val_el:
-            # второй вариант: другой соседний span/div
-            candidates = [x for x in row.find_all(["span", "div"], recursive=False) if x is not name_el]
-            for c in candidates:
-                text = c.get_text(" ", strip=True)
-                if text and normalize(text) != normalize(key):
-                    val_el = c
-                    break
-        if val_el:
-            val = val_el.get_text(" ", strip=True)
-            if val:
-                props[normalize(key)] = val
-
-    # D) Таблицы
-    for row in soup.select("table tr"):
-        cells = row.find_all(["th", "td"])
-        if len(cells) >= 2:
-            key = cells[0].get_text(" ", strip=True)
-            val = cells[1].get_text(" ", strip=True)
-            if key and val:
-                props[normalize(key)] = val
-
-    # E) dl dt/dd
-    for dt in soup.select("dl dt"):
-        dd = dt.find_next("dd")
-        if dd:
-            key = dt.get_text(" ", strip=True)
-            val = dd.get_text(" ", strip=True)
-            if key and val:
-                props[normalize(key)] = val
-
-    # F) “две колонки” и “Ключ: Значение”
-    for row in soup.select("li, p, div"):
-        children = [ch for ch in row.find_all(["div", "span"], recursive=False)]
-        if len(children) == 2:
-            k = children[0].get_text(" ", strip=True)
-            v = children[1].get_text(" ", strip=True)
-            if k and v and len(k) <= 60 and len(v) <= 200:
-                props[normalize(k)] = v
-                continue
-        t = row.get_text(" ", strip=True)
-        if 5 <= len(t) <= 220 and (":" in t or "—" in t or "-" in t):
-            m = re.match(r"\s*([^:–—-]{2,60})\s*[:–—-]\s*(.{1,160})", t)
-            if m:
-                k = m.group(1).strip()
-                v = m.group(2).strip()
-                if k and v:
-                    props[normalize(k)] = v
-
-    return props
-
-
 async def open_stocks_modal(page):
     """
     Пытаемся открыть модалку "Наличие в магазинах".
@@ -601,13 +483,14 @@ async def scroll_modal_to_end(page):
             }""", container_sel)
         except:
             h = 0
-        await page.wait_for_timeout(300)
+        # Догрузка магазинов увеличит scrollHeight контейнера
+        await wait_for_height_change(page, h, cap_ms=300, label="lemanapro.modal_scroll", selector=container_sel)
         if h == last_h:
             break
         last_h = h
 
 
-async def extract_stock_units(page, soup):
+async def extract_stock_units(page):
     """
     Открывает модалку "Наличие в магазинах" и суммирует все количества "В наличии N шт."
     Возвращает строку с числом или None, если не удалось.
@@ -660,34 +543,24 @@ async def extract_stock_units(page, soup):
         return None
 
 
-def value_for_tx(props, soup, tx):
+def value_for_tx(props, doc, tx):
     if not tx:
         return "Н/Д"
-    key = normalize(tx)
+    matcher = matcher_for(tx)
 
-    # 1) точное
-    val = props.get(key)
-    if val:
+    # 1) точное, подстрока или синоним по уже собранным характеристикам
+    val, rank = matcher.find(props)
+    if val and rank != FUZZY:
         return val
 
-    # 2) подстрочное совпадение
-    for k, v in props.items():
-        if key and (key in k or k in key):
-            return v
+    # 2) синонимы + структурный поиск по подписям страницы (свежей или из кэша)
+    if doc is not None:
+        found = doc.value_by_labels(matcher.labels)
+        if found:
+            return found
 
-    # 3) синонимы + структурный поиск
-    aliases = expand_tx_aliases(tx)
-    val = find_value_by_labels(soup, aliases if aliases else [tx])
-    if val:
-        return val
-
-    # 4) похожесть
-    if props:
-        best = difflib.get_close_matches(key, props.keys(), n=1, cutoff=0.6)
-        if best:
-            return props[best[0]]
-
-    return "Н/Д"
+    # 3) похожесть
+    return val or "Н/Д"
 
 
 async def save_debug(page, tag):
@@ -706,141 +579,381 @@ async def save_debug(page, tag):
         return None, None
 
 
-async def extract_data(page, url, tx1, tx2):
-    await goto_with_retries(page, url, tries=3, tag="product")
-    await maybe_pass_challenge(page)
-
-    html = await page.content()
-    soup = BeautifulSoup(html, "lxml")
-
-    # Иногда характеристики скрыты под кнопкой
-    await safe_click_button(page, [
-        'button:has-text("Все характеристики")',
-        'button:has-text("Показать все характеристики")',
-    ], timeout=1500)
-    html = await page.content()
-    soup = BeautifulSoup(html, "lxml")
-
+def extract_fields(doc):
+    """
+    Всё, что достаётся из готового HTML без браузера: (поля, словарь характеристик).
+    Остаток здесь — текстовый статус; число штук добавляет extract_product из модалки.
+    """
+    soup = doc.soup
     # Название
     name_el = soup.select_one("h1, .product-title, .ProductTitle, .card-title")
     name = name_el.get_text(" ", strip=True) if name_el else "Н/Д"
 
     # Цена / Артикул
-    price = extract_price(soup)
-    article = extract_article(soup)
-
-    # Остаток: пытаемся посчитать суммарное количество из модалки
-    stock_units = await extract_stock_units(page, soup)
-    if stock_units is None:
-        # фоллбэк: вернём общий статус, если не удалось открыть модалку
-        stock_el = soup.select_one('[data-qa="title-interactive-stocks-text"], [data-qa*="stocks-text"]')
-        stock_units = "Н/Д"
-        if stock_el:
-            stock_units = stock_el.get_text(" ", strip=True) or "Н/Д"
-
-    main_info = {
-        "Ссылка": url,
+    price = extract_price(doc)
+    article = extract_article(doc)
+
+    stock_el = soup.select_one('[data-qa="title-interactive-stocks-text"], [data-qa*="stocks-text"]')
+    stock_text = "Н/Д"
+    if stock_el:
+        stock_text = stock_el.get_text(" ", strip=True) or "Н/Д"
+
+    fields = {
         "Артикул": article,
         "Название": name,
         "Цена": price,
-        "Остаток": stock_units,  # число штук (строкой) либо фоллбэк-текст/Н/Д
+        "Остаток": stock_text,
     }
 
     # Характеристики
-    props = build_props_dict(soup)
-    main_info[f"ТХ1_{tx1}"] = value_for_tx(props, soup, tx1)
-    main_info[f"ТХ2_{tx2}"] = value_for_tx(props, soup, tx2)
+    return fields, doc.props
 
+
+def build_row(url, fields, props, tx1, tx2, doc=None):
+    # doc — ProductDocument свежей страницы или CachedLabels карточки из кэша;
+    # None только у инкрементального обновления по снимку (там ищем по props)
+    main_info = {"Ссылка": url, **fields}
+    index = PropsIndex(props)
+    main_info[f"ТХ1_{tx1}"] = value_for_tx(index, doc, tx1)
+    main_info[f"ТХ2_{tx2}"] = value_for_tx(index, doc, tx2)
     return main_info
 
 
-async def scrape_with_engine(p, engine, url, tx1, tx2, debug_messages):
-    context = None
-    browser = None
+# Наличие по магазинам из JSON, который карточка загружает сама.
+# Список магазинов — list из dict'ов с ключом магазина; количество — по ключу штук.
+# amount и available не берём: это часто цена и флаг 0/1
+STOCK_STORE_KEYS = ("store", "storeId", "storeCode", "shop", "shopId", "warehouse", "warehouseId")
+STOCK_QTY_KEYS = ("stock", "quantity", "qty", "availableQuantity", "stockValue")
+# URL ответа с наличием, где код товара заменён на {id}: дальше спрашиваем напрямую
+STOCK_ENDPOINT = {"template": None}
+STOCK_STATS = {"captured": 0, "direct": 0, "modal": 0}
+
+
+def product_code(url):
+    m = re.search(r"(\d{5,})/?$", urlparse(url).path)
+    return m.group(1) if m else None
+
+
+def store_quantity(entry):
+    for k in STOCK_QTY_KEYS:
+        v = entry.get(k)
+        if isinstance(v, bool):
+            continue
+        if isinstance(v, (int, float)) or (isinstance(v, str) and v.strip().isdigit()):
+            return int(float(v))
+    return None
+
+
+def sum_store_quantities(data):
+    """Сумма штук по магазинам из JSON наличия (строкой) или None, если это не он."""
+    total, found = 0, False
+    stack = [data]
+    while stack:
+        cur = stack.pop()
+        if isinstance(cur, dict):
+            stack.extend(cur.values())
+        elif isinstance(cur, list):
+            stores = [x for x in cur if isinstance(x, dict) and any(k in x for k in STOCK_STORE_KEYS)]
+            if not stores:
+                stack.extend(cur)
+                continue
+            # Складываем только записи списка магазинов и внутрь них не заходим:
+            # во вложенных dict (цена, адрес) свои числа
+            for entry in stores:
+                qty = store_quantity(entry)
+                if qty is not None:
+                    total += qty
+                    found = True
+    return str(total) if found else None
+
+
+def accept_stock_payload(url, data, code):
+    # Наличие рекомендаций и аналогов тоже приходит JSON'ом — берём только свой товар
+    if code and code not in url:
+        return None
+    units = sum_store_quantities(data)
+    if units is not None and code and STOCK_ENDPOINT["template"] is None:
+        STOCK_ENDPOINT["template"] = url.replace(code, "{id}")
+    return units
+
+
+async def fetch_stock_direct(request, code):
+    """Наличие запросом на запомненный эндпоинт (APIRequestContext страницы или HTTP-клиента)."""
+    template = STOCK_ENDPOINT["template"]
+    if not template or not code:
+        return None
     try:
+        resp = await request.get(template.replace("{id}", code), timeout=15000, fail_on_status_code=False)
+        if resp.status >= 400:
+            return None
+        return sum_store_quantities(await resp.json())
+    except Exception:
+        return None
+
+
+async def stock_from_api(page, url, capture):
+    code = product_code(url)
+    accept = lambda u, d: accept_stock_payload(u, d, code)
+    if capture is not None:
+        # Эндпоинт уже известен — не ждём XHR, а спрашиваем сами
+        cap_ms = 0 if STOCK_ENDPOINT["template"] else 1500
+        units = await capture.first(accept, cap_ms=cap_ms)
+        if units is not None:
+            STOCK_STATS["captured"] += 1
+            return units
+    units = await fetch_stock_direct(page.context.request, code)
+    if units is not None:
+        STOCK_STATS["direct"] += 1
+    return units
+
+
+async def extract_product(page, url):
+    capture = JsonCapture(page, settings.LEMANAPRO_STOCK_API_PATTERNS) if settings.LEMANAPRO_STOCK_API else None
+    try:
+        await goto_with_retries(page, url, tries=3, tag="product")
+        await maybe_pass_challenge(page)
+
+        # Иногда характеристики скрыты под кнопкой
+        await safe_click_button(page, [
+            'button:has-text("Все характеристики")',
+            'button:has-text("Показать все характеристики")',
+        ], timeout=1500)
+        doc = ProductDocument(await page.content())
+        fields, props = extract_fields(doc)
+
+        # Остаток: сумма штук по магазинам из API наличия, затем из модалки,
+        # иначе остаётся общий статус со страницы
+        stock_units = await stock_from_api(page, url, capture) if settings.LEMANAPRO_STOCK_API else None
+        if stock_units is None:
+            stock_units = await extract_stock_units(page)
+            if stock_units is not None:
+                STOCK_STATS["modal"] += 1
+        if stock_units is not None:
+            fields["Остаток"] = stock_units  # число штук (строкой)
+    finally:
+        if capture is not None:
+            capture.detach()
+
+    return fields, props, doc
+
+
+# Без этих полей ответ HTTP-движка считаем неполным и идём в браузер.
+# Остаток проверяется отдельно: нужен числом штук с эндпоинта наличия
+# (fetch_stock_direct), текстовый статус со страницы не подходит
+HTTP_REQUIRED_FIELDS = ("Название", "Цена", "Артикул")
+
+
+async def get_http_client(pool):
+    return await pool.http_client(
+        "lemanapro",
+        user_agent=REAL_UA,
+        extra_http_headers=COMMON_HEADERS,
+    )
+
+
+async def extract_product_http(client, url):
+    """
+    Быстрый путь без браузера: тянем HTML карточки HTTP-запросом и разбираем
+    теми же экстракторами. Возвращает None, если нужен браузер
+    (челлендж, ошибка ответа, не хватает обязательных полей или числа штук
+    на складах — эндпоинт наличия узнаёт только браузерный путь).
+    """
+    await navigation.wait(url)
+    try:
+        resp = await client.get(url, timeout=30000, fail_on_status_code=False)
+        if resp.status >= 400:
+            await navigation.record(url, navigation.classify(resp))
+            return None
+        html = await resp.text()
+    except Exception as e:
+        await navigation.record(url, navigation.classify(exc=e))
+        return None
+    if not html.strip() or is_challenge_html(html):
+        await navigation.record(url, "challenge")
+        return None
+    await navigation.record(url, "ok")
+
+    doc = ProductDocument(html)
+    fields, props = extract_fields(doc)
+    if any(fields.get(f) in (None, "", "Н/Д") for f in HTTP_REQUIRED_FIELDS):
+        return None
+    # Число штук — только с известного эндпоинта наличия; иначе в браузер, он его и узнает
+    units = await fetch_stock_direct(client, product_code(url)) if settings.LEMANAPRO_STOCK_API else None
+    if units is None:
+        return None
+    STOCK_STATS["direct"] += 1
+    fields["Остаток"] = units
+    return fields, props, doc
+
+
+async def extract_data(page, url, tx1, tx2, http_client=None):
+    # Порядок: кэш карточек -> HTTP без браузера -> браузер
+    async def extract():
+        if http_client is not None:
+            got = await extract_product_http(http_client, url)
+            if got is not None:
+                return got
+        return await extract_product(page, url)
+
+    fields, props, doc = await cached_product("lemanapro", url, extract)
+    return build_row(url, fields, props, tx1, tx2, doc)
+
+
+async def refresh_product(page, url, http_client=None):
+    """Дешёвое обновление известного товара: цена и остаток, по возможности без браузера."""
+    got = await extract_product_http(http_client, url) if http_client is not None else None
+    if got is None:
+        got = await extract_product(page, url)
+    fields = got[0]
+    return {"Цена": fields.get("Цена"), "Остаток": fields.get("Остаток")}
+
+
+@asynccontextmanager
+async def persistent_context(pool, profile_dir, state):
+    context = await pool.playwright.chromium.launch_persistent_context(
+        profile_dir,
+        headless=True,
+        user_agent=REAL_UA,
+        ignore_default_args=["--enable-automation"],
+        viewport={"width": 1366, "height": 820},
+        locale="ru-RU",
+        timezone_id="Europe/Moscow",
+        geolocation={"longitude": 37.6173, "latitude": 55.7558},
+        permissions=["geolocation"],
+        args=["--lang=ru-RU,ru", "--disable-blink-features=AutomationControlled"],
+    )
+    try:
+        if state and state.get("cookies"):
+            # storage_state в persistent context не передать — докладываем cookies
+            try:
+                await context.add_cookies(state["cookies"])
+            except:
+                pass
+        yield context
+    finally:
+        try:
+            await context.close()
+        except:
+            pass
+
+
+@asynccontextmanager
+async def engine_context(pool, engine):
+    # Cookies/localStorage с прошлого успешного прохода: проверка уже пройдена
+    state = session_store.load("lemanapro", engine)
+    async with AsyncExitStack() as stack:
         if engine == "chromium":
-            profile_dir = os.path.join(DEBUG_DIR, "plw-lemanapro-chromium")
-            context = await p.chromium.launch_persistent_context(
-                profile_dir,
-                headless=True,
-                user_agent=REAL_UA,
-                ignore_default_args=["--enable-automation"],
-                viewport={"width": 1366, "height": 820},
-                locale="ru-RU",
-                timezone_id="Europe/Moscow",
-                geolocation={"longitude": 37.6173, "latitude": 55.7558},
-                permissions=["geolocation"],
-                args=["--lang=ru-RU,ru", "--disable-blink-features=AutomationControlled"],
-            )
-        elif engine == "firefox":
-            browser = await p.firefox.launch(headless=True)
-            context = await browser.new_context(
-                user_agent=REAL_UA,
-                viewport={"width": 1366, "height": 820},
-                locale="ru-RU",
-                timezone_id="Europe/Moscow",
-            )
+            # Chromium — с постоянным профилем, такой контекст из общего пула не выдать.
+            # Каждой задаче свой каталог: на общем параллельные задачи упираются в lock профиля
+            profile_dir = await stack.enter_async_context(get_profile_manager("lemanapro").profile())
+            context = await stack.enter_async_context(persistent_context(pool, profile_dir, state))
         else:
-            browser = await p.webkit.launch(headless=True)
-            context = await browser.new_context(
+            context = await stack.enter_async_context(pool.context(
+                engine,
                 user_agent=REAL_UA,
                 viewport={"width": 1366, "height": 820},
                 locale="ru-RU",
                 timezone_id="Europe/Moscow",
-            )
+                **({"storage_state": state} if state else {}),
+            ))
+        try:
+            yield context
+        except:
+            if session_store.was_challenged(context):
+                session_store.invalidate("lemanapro", engine)
+            raise
+
 
+async def scrape_with_engine(pool, engine, url, tx1, tx2, debug_messages, skip=(), state=None, errors=None):
+    """
+    Отдаёт товары по мере готовности. Ссылки из skip уже получены другим движком.
+    state общий для всех движков: state["links"] — ссылки категории (листинг
+    собирается один раз), state["plan"] — план инкрементального прохода.
+    Ссылки, которые не удалось разобрать, попадают в errors как (url, сообщение).
+    """
+    state = state if state is not None else {}
+    errors = errors if errors is not None else []
+    async with engine_context(pool, engine) as context:
         await context.set_extra_http_headers(COMMON_HEADERS)
+        await install_blocking(context, "lemanapro")
         page = await context.new_page()
         await stealth_async(page)
 
+        http_client = await get_http_client(pool) if settings.LEMANAPRO_HTTP_ENGINE else None
+
+        async def fetch(pg, link):
+            plan = state.get("plan")
+            if plan is None:
+                return await extract_data(pg, link, tx1, tx2, http_client)
+
+            async def full():
+                got = await extract_product_http(http_client, link) if http_client is not None else None
+                return got if got is not None else await extract_product(pg, link)
+
+            return await plan.fetch(
+                link,
+                full=lambda: cached_product("lemanapro", link, full),
+                refresh=lambda: refresh_product(pg, link, http_client),
+                build=lambda fields, props, doc: build_row(link, fields, props, tx1, tx2, doc),
+            )
+
         path = urlparse(url).path
         if path.startswith("/product/"):
-            data = await extract_data(page, url, tx1, tx2)
-            return [data]
-
-        links, meta = await collect_links(page, url)
-        if not links:
-            title = meta.get("title")
-            blocked = meta.get("blocked")
-            html_path, png_path = await save_debug(page, f"category_{engine}")
-            msg = f"{engine}: 0 товарных ссылок. blocked={blocked}, title='{title}'. Снимки: {html_path}, {png_path}"
-            debug_messages.append(msg)
-            raise Exception(msg)
-
-        results = []
-        per_link_errors = []
-
-        # Парсим все карточки без агрессивного префильтра
-        for i, link in enumerate(links, 1):
-            try:
-                data = await extract_data(page, link, tx1, tx2)
-                results.append(data)
-            except Exception as e:
-                per_link_errors.append((link, str(e)[:200]))
-                continue
-
-        if not results:
+            yield await fetch(page, url)
+            await session_store.save(context, "lemanapro", engine)
+            return
+
+        async def new_page():
+            pg = await context.new_page()
+            await stealth_async(pg)
+            return pg
+
+        links = state.get("links")
+        if links is None:
+            # Повторная попытка задачи берёт листинг из чекпоинта
+            links = checkpoint.saved_links()
+            if links is None:
+                progress.set_stage("links")
+                links, meta = await collect_links(page, url, new_page=new_page)
+                if not links:
+                    title = meta.get("title")
+                    blocked = meta.get("blocked")
+                    html_path, png_path = await save_debug(page, f"category_{engine}")
+                    msg = f"{engine}: 0 товарных ссылок. blocked={blocked}, title='{title}'. Снимки: {html_path}, {png_path}"
+                    debug_messages.append(msg)
+                    raise Exception(msg)
+                await checkpoint.save_links(links)
+            progress.set_value("links_found", len(links))
+            state["links"] = links
+            state["plan"] = await plan_for_job("lemanapro", url, links)
+        links = [u for u in checkpoint.pending(links) if u not in skip]
+
+        # Парсим все карточки без агрессивного префильтра, несколькими страницами
+        produced = 0
+        async for data in iter_products(
+            context, links,
+            fetch,
+            workers=workers_for("lemanapro"),
+            new_page=new_page,
+            errors=errors,
+        ):
+            produced += 1
+            yield data
+
+        if produced:
+            await session_store.save(context, "lemanapro", engine)
+
+        if not produced and links:
             try:
                 await goto_with_retries(page, links[0], tries=2, tag="product_debug")
                 await save_debug(page, f"product_{engine}")
             except:
                 pass
-            err_preview = "; ".join([f"{i+1}) {u} -> {msg}" for i, (u, msg) in enumerate(per_link_errors[:5])])
+            err_preview = "; ".join([f"{i+1}) {u} -> {msg}" for i, (u, msg) in enumerate(errors[:5])])
             raise Exception(f"{engine}: получили {len(links)} ссылок, но 0 результатов. Примеры ошибок: {err_preview}")
 
-        return results
 
-    finally:
-        try:
-            if context:
-                await context.close()
-        except:
-            pass
-        try:
-            if browser:
-                await browser.close()
-        except:
-            pass
+ENGINES = ("chromium", "firefox", "webkit")
 
 
 @register_parser("lemanapro", "Лемана ПРО")
@@ -850,28 +963,42 @@ async def run_parser(url, tx1, tx2):
     - Любая категория (берём все /product/ ссылки с пагинации ?page=...) или одна карточка (/product/...)
     - Любые tx1/tx2
     - Остаток: сумма штук по всем магазинам из модального окна (если доступно)
+    Товары отдаются потоком. Листинг собирается один раз; следующий движок
+    получает только ссылки, которые предыдущий не разобрал (упал или
+    ошибся на отдельных карточках). Порядок движков — по их недавним
+    успехам на магазине (parsing/engine_health.py).
     """
     debug_messages = []
-    async with async_playwright() as p:
+    done = set()
+    state = {}
+    completed = False
+    pool = await get_browser_pool()
+    for engine in engine_health.order("lemanapro", ENGINES):
+        errors = []
+        before = len(done)
         try:
-            res = await scrape_with_engine(p, "chromium", url, tx1, tx2, debug_messages)
-            if res:
-                return res
+            async for data in scrape_with_engine(
+                pool, engine, url, tx1, tx2, debug_messages, skip=done, state=state, errors=errors,
+            ):
+                done.add(data.get("Ссылка"))
+                yield data
         except Exception as e:
-            debug_messages.append(f"chromium fail: {str(e)}")
-
-        try:
-            res = await scrape_with_engine(p, "firefox", url, tx1, tx2, debug_messages)
-            if res:
-                return res
-        except Exception as e:
-            debug_messages.append(f"firefox fail: {str(e)}")
+            debug_messages.append(f"{engine} fail: {str(e)}")
+            engine_health.record("lemanapro", engine, 0.0)
+            continue
+        completed = True
+        produced = len(done) - before
+        engine_health.record("lemanapro", engine, produced / max(1, produced + len(errors)))
+        if not errors:
+            break
+        debug_messages.append(f"{engine}: {len(errors)} ссылок не разобрано, пробуем следующий движок")
 
-        try:
-            res = await scrape_with_engine(p, "webkit", url, tx1, tx2, debug_messages)
-            if res:
-                return res
-        except Exception as e:
-            debug_messages.append(f"webkit fail: {str(e)}")
+    plan = state.get("plan")
+    if completed and plan is not None:
+        for row in plan.removed_rows():
+            yield row
+        await plan.save()
 
-    raise Exception("Lemana: 0 items. " + " | ".join(debug_messages))
\ No newline at end of file
+    # completed без товаров — всё уже собрано прошлой попыткой задачи
+    if not done and not completed:
+        raise Exception("Lemana: 0 items. " + " | ".join(debug_messages))
@@ -1,42 +1,98 @@
 # parsing/parsers/petrovich.py
-import re
 import asyncio
-from urllib.parse import urljoin
-from playwright.async_api import async_playwright
+import re
+from contextlib import aclosing
+from urllib.parse import urljoin, urlparse
 
 from . import register_parser
+from .. import checkpoint, navigation, progress, session_store
+from ..browser_pool import get_browser_pool
+from ..incremental import plan_for_job
+from ..listing_api import collect_from_api, listing_capture
+from ..listing_fetch import iter_listing_pages, listing_workers_for
+from ..product_cache import cached_product
+from ..product_fetch import ProductFetcher, workers_for
+from ..resource_blocking import install_blocking
+from ..tx_matcher import PropsIndex, matcher_for, normalize
+from ..waits import wait_for_dom_quiet
+
+BASE = "https://petrovich.ru"
+PRODUCT_PATH = re.compile(r"^/catalog/\d+/\d+/?$")
+PRODUCT_ANCHORS = '[data-item-code] >> a[data-test="product-link"], a[data-test="product-link"]'
+
+async def product_links_on_page(page, purl):
+    await page.wait_for_selector('a[data-test="product-link"], [data-item-code]', timeout=30000)
+    links = []
+    for a in await page.locator(PRODUCT_ANCHORS).all():
+        try:
+            href = await a.get_attribute("href")
+            if href:
+                links.append(urljoin(purl, href))
+        except:
+            continue
+    return links
 
-WORKERS = 4
+async def fetch_listing_page(page, purl):
+    await navigation.goto(page, purl)
+    return await product_links_on_page(page, purl)
+
+def product_url(value):
+    u = urljoin(BASE, value)
+    parts = urlparse(u)
+    if parts.netloc.endswith("petrovich.ru") and PRODUCT_PATH.match(parts.path):
+        return u
+    return None
+
+async def read_counter(page, timeout=None):
+    """Заявленное число товаров со счётчика категории или None."""
+    try:
+        counter_text = await page.locator('[data-test="products-counter"]').inner_text(timeout=timeout)
+        digits = re.findall(r"\d+", counter_text.replace("\xa0", ""))
+        if digits:
+            return int(digits[-1])
+    except:
+        pass
+    return None
 
-def normalize(text):
-    return re.sub(r"\W+", "", str(text).lower()).strip()
+async def open_listing(page, list_url, consent_known=False):
+    """
+    Первая страница листинга: (ссылки на ней, URL остальных страниц, заявленное число товаров).
+    Если список товаров удалось забрать из API каталога — в ссылках сразу вся категория.
+    """
+    capture = listing_capture(page, "petrovich")
+    try:
+        return await _open_listing(page, list_url, capture, consent_known)
+    finally:
+        if capture is not None:
+            capture.detach()
 
-async def collect_product_links(page, list_url):
-    await page.goto(list_url, timeout=60000)
+async def _open_listing(page, list_url, capture, consent_known):
+    await navigation.goto(page, list_url)
     await page.wait_for_load_state("domcontentloaded")
 
     # Пытаемся закрыть/принять возможные модалки/куки
     try:
-        await page.get_by_role("button", name=re.compile(r"да|принять|соглас", re.I)).click(timeout=2000)
-        await page.wait_for_timeout(500)
+        # Согласие из сохранённой сессии уже дано — долго кнопку не ждём
+        await page.get_by_role("button", name=re.compile(r"да|принять|соглас", re.I)).click(timeout=300 if consent_known else 2000)
+        await wait_for_dom_quiet(page, cap_ms=500, label="petrovich.consent", quiet_ms=150)
     except:
         pass
 
+    # Счётчик на странице — проверка для общего числа из API
+    counter = await read_counter(page, timeout=3000)
+    got = await collect_from_api(page, capture, product_url, expected=counter)
+    if got is not None:
+        links, total = got
+        return links, [], total
+
     # Ждем появления товаров/списка
-    await page.wait_for_selector('a[data-test="product-link"], [data-item-code]', timeout=30000)
+    first_links = await product_links_on_page(page, list_url)
 
     # Считать заявленное количество товаров (не критично)
-    total_expected = None
-    try:
-        counter_text = await page.locator('[data-test="products-counter"]').inner_text()
-        digits = re.findall(r"\d+", counter_text.replace("\xa0", ""))
-        if digits:
-            total_expected = int(digits[-1])
-    except:
-        pass
+    total_expected = counter if counter is not None else await read_counter(page)
 
-    # Собираем URL всех страниц пагинации
-    page_urls = {list_url}
+    # Собираем URL остальных страниц пагинации
+    page_urls = set()
     try:
         paginator = await page.locator('[data-test="paginator-page-btn"]').all()
         for a in paginator:
@@ -45,42 +101,39 @@ async def collect_product_links(page, list_url):
                 page_urls.add(urljoin(list_url, href))
     except:
         pass
+    page_urls.discard(list_url)
 
-    links = set()
-    for purl in sorted(page_urls):
-        await page.goto(purl, timeout=60000)
-        await page.wait_for_selector('a[data-test="product-link"], [data-item-code]', timeout=30000)
-        anchors = await page.locator('[data-item-code] >> a[data-test="product-link"], a[data-test="product-link"]').all()
-        for a in anchors:
-            try:
-                href = await a.get_attribute("href")
-                if href:
-                    links.add(urljoin(purl, href))
-            except:
-                continue
-        if total_expected and len(links) >= total_expected:
-            break
+    return first_links, sorted(page_urls), total_expected
 
-    return list(links)
+async def iter_product_links(page, list_url, consent_known=False):
+    """
+    Отдаёт новые ссылки на товары пачками по мере загрузки листинга:
+    сразу первую страницу, затем остальные — параллельно (LISTING_FETCH_WORKERS).
+    """
+    first_links, page_urls, total_expected = await open_listing(page, list_url, consent_known)
+    seen = set()
 
-async def extract_product_info(page, product_url, tx1, tx2):
-    await page.goto(product_url, timeout=60000)
-    await page.wait_for_load_state("domcontentloaded")
+    def fresh(links):
+        batch = [u for u in dict.fromkeys(links) if u not in seen]
+        seen.update(batch)
+        return batch
 
-    # Раскрыть блок характеристик, если есть
-    try:
-        await page.get_by_text("Полные характеристики", exact=False).first.click(timeout=2500)
-        await page.wait_for_timeout(400)
-    except:
-        pass
+    yield fresh(first_links)
+    if total_expected and len(seen) >= total_expected:
+        return
 
-    # Название
-    name = "Н/Д"
-    try:
-        name = (await page.locator('h1[data-test="product-title"]').inner_text()).strip()
-    except:
-        pass
+    async with aclosing(iter_listing_pages(
+        page.context, page_urls, fetch_listing_page,
+        workers=listing_workers_for("petrovich"),
+    )) as pages:
+        async for _, links in pages:
+            batch = fresh(links or [])
+            if batch:
+                yield batch
+            if total_expected and len(seen) >= total_expected:
+                return
 
+async def read_price_stock(page):
     # Цена
     price = "Н/Д"
     try:
@@ -90,17 +143,6 @@ async def extract_product_info(page, product_url, tx1, tx2):
     except:
         pass
 
-    # Артикул
-    article = "Н/Д"
-    try:
-        article = (await page.locator('li.data-item:has(.title:has-text("Артикул")) .value').first.inner_text()).strip()
-    except:
-        try:
-            # альтернативные варианты
-            article = (await page.locator('[data-test="product-code"], [data-test="product-sku"], [itemprop="sku"]').first.inner_text()).strip()
-        except:
-            pass
-
     # Остаток
     stock = "Н/Д"
     try:
@@ -117,88 +159,151 @@ async def extract_product_info(page, product_url, tx1, tx2):
         except:
             pass
 
-    # Характеристики для tx1/tx2
-    tx1_val, tx2_val = None, None
+    return {"Цена": price, "Остаток": stock}
+
+async def extract_product(page, product_url):
+    """Открывает карточку и возвращает (поля, характеристики {название: значение}, None)."""
+    await navigation.goto(page, product_url)
+    await page.wait_for_load_state("domcontentloaded")
+
+    # Раскрыть блок характеристик, если есть
     try:
-        props = await page.locator('ul.product-properties-list li.data-item').all()
-        for block in props:
-            try:
-                label = (await block.locator('.title').inner_text()).strip()
-                value = (await block.locator('.value').inner_text()).strip()
-                if tx1 and normalize(tx1) in normalize(label):
-                    tx1_val = value
-                if tx2 and normalize(tx2) in normalize(label):
-                    tx2_val = value
-            except:
-                continue
+        await page.get_by_text("Полные характеристики", exact=False).first.click(timeout=2500)
+        await wait_for_dom_quiet(page, cap_ms=400, label="petrovich.props", quiet_ms=100)
+    except:
+        pass
+
+    # Название
+    name = "Н/Д"
+    try:
+        name = (await page.locator('h1[data-test="product-title"]').inner_text()).strip()
     except:
         pass
 
-    data = {
-        "Ссылка": product_url,
+    # Артикул
+    article = "Н/Д"
+    try:
+        article = (await page.locator('li.data-item:has(.title:has-text("Артикул")) .value').first.inner_text()).strip()
+    except:
+        try:
+            # альтернативные варианты
+            article = (await page.locator('[data-test="product-code"], [data-test="product-sku"], [itemprop="sku"]').first.inner_text()).strip()
+        except:
+            pass
+
+    # Все характеристики одним вызовом в браузере
+    props = {}
+    try:
+        pairs = await page.eval_on_selector_all(
+            'ul.product-properties-list li.data-item',
+            """els => els.map(el => {
+                const t = el.querySelector('.title'), v = el.querySelector('.value');
+                return t && v ? [t.innerText.trim(), v.innerText.trim()] : null;
+            }).filter(Boolean)""",
+        )
+        # Ключи нормализуем, как у остальных магазинов
+        for label, value in pairs:
+            props[normalize(label)] = value
+    except:
+        pass
+
+    fields = {
         "Артикул": article,
         "Название": name,
-        "Цена": price,
-        "Остаток": stock,
+        **(await read_price_stock(page)),
     }
+    return fields, props, None
+
+async def refresh_product(page, product_url):
+    """Дешёвое обновление известного товара: цена и остаток без раскрытия характеристик."""
+    await navigation.goto(page, product_url)
+    await page.wait_for_load_state("domcontentloaded")
+    return await read_price_stock(page)
+
+
+def build_row(product_url, fields, props, tx1, tx2):
+    data = {"Ссылка": product_url, **fields}
+    index = PropsIndex(props)
     if tx1:
-        data[f"ТХ1_{tx1}"] = tx1_val if tx1_val else "Н/Д"
+        data[f"ТХ1_{tx1}"] = matcher_for(tx1).value(index)
     if tx2:
-        data[f"ТХ2_{tx2}"] = tx2_val if tx2_val else "Н/Д"
+        data[f"ТХ2_{tx2}"] = matcher_for(tx2).value(index)
 
     return data
 
-async def worker(name, context, queue, tx1, tx2, results):
-    page = await context.new_page()
-    try:
-        while True:
-            item = await queue.get()
-            if item is None:
-                queue.task_done()
-                break
-            i, total, link = item
-            try:
-                res = await extract_product_info(page, link, tx1, tx2)
-                results.append(res)
-            except Exception as e:
-                # Можно добавить логирование
-                pass
-            finally:
-                queue.task_done()
-    finally:
-        await page.close()
+async def extract_product_info(page, product_url, tx1, tx2):
+    # Сначала кэш карточек: страница открывается только при промахе
+    fields, props, _ = await cached_product("petrovich", product_url, lambda: extract_product(page, product_url))
+    return build_row(product_url, fields, props, tx1, tx2)
 
 @register_parser("petrovich", "Петрович")
 async def run_parser(url, tx1, tx2):
-    results = []
-    async with async_playwright() as p:
-        browser = await p.chromium.launch(headless=True)
-        context = await browser.new_context(
-            locale="ru-RU",
-            viewport={"width": 1280, "height": 800},
-            user_agent="Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
-        )
+    pool = await get_browser_pool()
+    # Cookies с принятым согласием и прочим с прошлого прохода
+    session = session_store.context_kwargs("petrovich", "chromium")
+    async with pool.context(
+        "chromium",
+        locale="ru-RU",
+        viewport={"width": 1280, "height": 800},
+        user_agent="Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
+        **session,
+    ) as context:
         context.set_default_timeout(45000)
         context.set_default_navigation_timeout(60000)
+        await install_blocking(context, "petrovich")
 
         page = await context.new_page()
-        product_links = await collect_product_links(page, url)
-        await page.close()
+        progress.set_stage("links")
+        # Ссылки приходят пачками, поэтому план создаётся пустым и пополняется
+        plan = await plan_for_job("petrovich", url, [])
 
-        # Очередь и воркеры
-        queue = asyncio.Queue()
-        for i, link in enumerate(product_links, 1):
-            await queue.put((i, len(product_links), link))
+        async def fetch(page, link):
+            if plan is None:
+                return await extract_product_info(page, link, tx1, tx2)
+            return await plan.fetch(
+                link,
+                full=lambda: cached_product("petrovich", link, lambda: extract_product(page, link)),
+                refresh=lambda: refresh_product(page, link),
+                build=lambda fields, props, _: build_row(link, fields, props, tx1, tx2),
+            )
 
-        n_workers = min(WORKERS, max(1, len(product_links)))
-        workers = [asyncio.create_task(worker(f"W{idx+1}", context, queue, tx1, tx2, results))
-                   for idx in range(n_workers)]
+        # Повторная попытка задачи берёт листинг из чекпоинта
+        saved = checkpoint.saved_links()
 
-        await queue.join()
-        for _ in workers:
-            await queue.put(None)
-        await asyncio.gather(*workers)
+        # Карточки начинают разбираться с первой страницы листинга, пока грузятся остальные
+        async with ProductFetcher(context, fetch, workers=workers_for("petrovich")) as fetcher:
+            async def feed():
+                found = []
+                def push(batch):
+                    found.extend(batch)
+                    if plan is not None:
+                        plan.add_links(batch)
+                    fetcher.feed_many(checkpoint.pending(batch))
+                    progress.set_value("links_found", len(found))
+                try:
+                    if saved is not None:
+                        push(saved)
+                    else:
+                        async for batch in iter_product_links(page, url, consent_known=bool(session)):
+                            push(batch)
+                        # Чекпоинт — только полный листинг
+                        await checkpoint.save_links(found)
+                finally:
+                    fetcher.close()
 
-        await browser.close()
+            feeder = asyncio.create_task(feed())
+            try:
+                async for item in fetcher:
+                    yield item
+            finally:
+                if not feeder.done():
+                    feeder.cancel()
+            # Ошибка сбора ссылок (например, пустой листинг) — ошибка задачи
+            await feeder
+        await page.close()
+        await session_store.save(context, "petrovich", "chromium")
 
-    return results
\ No newline at end of file
+        if plan is not None:
+            for row in plan.removed_rows():
+                yield row
+            await plan.save()
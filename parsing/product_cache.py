@@ -0,0 +1,91 @@
+# parsing/product_cache.py
+"""
+Кэш разобранных карточек товаров, общий для всех запросов.
+
+Ключ — магазин + канонический URL товара. Храним две записи с разным TTL:
+- static: артикул, название, полный словарь характеристик и снимок подписей
+  страницы для поиска по синонимам (любой tx1/tx2 можно ответить из него) —
+  живёт долго;
+- volatile: цена и остаток — живёт коротко.
+Карточка берётся из кэша, только если свежи обе части.
+
+Используется кэш Django с алиасом "products" (settings.CACHES): по умолчанию
+LocMem с ограничением MAX_ENTRIES, в проде можно указать общий бэкенд.
+"""
+import hashlib
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .coalescing import canonical_url
+from .product_document import CachedLabels, ProductDocument
+
+STATIC_FIELDS = ("Артикул", "Название")
+VOLATILE_FIELDS = ("Цена", "Остаток")
+
+# Промахи/попадания за время жизни процесса
+STATS = {"hits": 0, "misses": 0}
+
+
+def _cache():
+    return caches[settings.PRODUCT_CACHE_ALIAS]
+
+
+def _key(shop_key, url, part):
+    digest = hashlib.sha1(canonical_url(url).encode("utf-8")).hexdigest()
+    return f"product:{shop_key}:{digest}:{part}"
+
+
+def ttl_for(shop_key):
+    default = {"static": 24 * 3600, "volatile": 30 * 60}
+    return {**default, **settings.PRODUCT_CACHE_TTL.get(shop_key, {})}
+
+
+async def get_product(shop_key, url):
+    """(fields, props, снимок подписей или None) из кэша или None."""
+    if not settings.PRODUCT_CACHE_ENABLED:
+        return None
+    keys = [_key(shop_key, url, "static"), _key(shop_key, url, "volatile")]
+    found = await _cache().aget_many(keys)
+    static, volatile = found.get(keys[0]), found.get(keys[1])
+    if static is None or volatile is None:
+        STATS["misses"] += 1
+        return None
+    STATS["hits"] += 1
+    return {**static["fields"], **volatile}, static["props"], static.get("labels")
+
+
+async def put_product(shop_key, url, fields, props, labels=None):
+    if not settings.PRODUCT_CACHE_ENABLED:
+        return
+    # "Н/Д" в обязательных полях — скорее сбой загрузки, такое не кэшируем
+    if any(fields.get(f) in (None, "", "Н/Д") for f in STATIC_FIELDS):
+        return
+    ttl = ttl_for(shop_key)
+    cache = _cache()
+    await cache.aset(
+        _key(shop_key, url, "static"),
+        {"fields": {f: fields.get(f) for f in STATIC_FIELDS}, "props": dict(props or {}), "labels": labels},
+        ttl["static"],
+    )
+    await cache.aset(
+        _key(shop_key, url, "volatile"),
+        {f: fields.get(f) for f in VOLATILE_FIELDS},
+        ttl["volatile"],
+    )
+
+
+async def cached_product(shop_key, url, extract):
+    """
+    extract() -> (fields, props, extra) — открывает страницу только при промахе.
+    Возвращает (fields, props, extra). Если extra — ProductDocument, при
+    попадании вместо него CachedLabels с тем же value_by_labels, иначе None.
+    """
+    hit = await get_product(shop_key, url)
+    if hit is not None:
+        fields, props, labels = hit
+        return fields, props, CachedLabels(labels) if labels else None
+    fields, props, extra = await extract()
+    labels = extra.label_snapshot() if isinstance(extra, ProductDocument) else None
+    await put_product(shop_key, url, fields, props, labels)
+    return fields, props, extra
@@ -0,0 +1,260 @@
+# parsing/product_document.py
+"""
+Разобранная карточка товара: HTML парсится один раз, остальное лениво и с memo.
+
+    doc = ProductDocument(html)
+    doc.jsonld                    # Product-узлы из JSON-LD (json.loads один раз)
+    doc.props                     # {нормализованное название: значение}
+    doc.value_by_labels([...])    # поиск по подписям без повторного обхода DOM
+    doc.label_snapshot()          # то же для кэша: CachedLabels(snapshot).value_by_labels
+
+Индекс «подпись -> значение» строится за один проход по дереву: таблицы,
+dl, контейнеры характеристик, microdata, data-qa и строки «Ключ: Значение».
+"""
+import json
+import re
+from functools import cached_property
+
+from bs4 import BeautifulSoup, Tag
+
+# Классы контейнеров характеристик (строки внутри них — пары «ключ/значение»)
+CONTAINER_CLASSES = {
+    "characteristics", "props", "product-props", "product-attrs", "char", "chars",
+    "properties", "product-properties", "product__chars", "product-specs",
+}
+DATA_QA_NAME_PARTS = ("char", "spec", "param", "character")
+
+# Порядок источников в props: более поздние перекрывают ранние
+PROPS_SOURCES = ("jsonld", "microdata", "data_qa", "table", "dl", "row")
+# Порядок источников при поиске по подписям
+LABEL_SOURCES = ("table", "dl", "container")
+# Строка текста, где может быть «Ключ: Значение» (для снимка в кэш)
+LABEL_SEPARATORS = ":-–"
+
+
+def normalize(text):
+    return re.sub(r"\W+", "", str(text or "").lower()).strip()
+
+
+def _text(el):
+    return el.get_text(" ", strip=True)
+
+
+def _short_text(el, limit):
+    # get_text(" ", strip=True), но с выходом, как только текст длиннее limit:
+    # для больших div не собираем весь их текст ради проверки длины
+    parts, size = [], -1
+    for s in el.stripped_strings:
+        size += len(s) + 1
+        if size > limit:
+            return None
+        parts.append(s)
+    return " ".join(parts)
+
+
+class ProductDocument:
+    def __init__(self, html):
+        self.html = html
+        self.soup = BeautifulSoup(html, "lxml")
+
+    @cached_property
+    def jsonld(self):
+        products = []
+        for script in self.soup.select('script[type="application/ld+json"]'):
+            try:
+                data = json.loads(script.string or "")
+            except Exception:
+                continue
+            nodes = data if isinstance(data, list) else [data]
+            for node in nodes:
+                if not isinstance(node, dict):
+                    continue
+                if node.get("@type") == "Product":
+                    products.append(node)
+                if "@graph" in node and isinstance(node["@graph"], list):
+                    for g in node["@graph"]:
+                        if isinstance(g, dict) and g.get("@type") == "Product":
+                            products.append(g)
+        return products
+
+    @cached_property
+    def text(self):
+        return self.soup.get_text("\n", strip=True)
+
+    @cached_property
+    def index(self):
+        """{источник: [(нормализованная подпись, значение), ...]} в порядке документа."""
+        index = {source: [] for source in PROPS_SOURCES + LABEL_SOURCES}
+
+        for p in self.jsonld:
+            addp = p.get("additionalProperty") or p.get("additionalProperties")
+            if isinstance(addp, list):
+                for it in addp:
+                    if not isinstance(it, dict):
+                        continue
+                    key = it.get("name") or it.get("propertyID")
+                    val = it.get("value") or it.get("valueReference") or it.get("propertyValue")
+                    if key and val:
+                        index["jsonld"].append((normalize(key), str(val).strip()))
+
+        inside = set()  # id элементов внутри контейнеров характеристик (и самих контейнеров)
+        for el in self.soup.descendants:
+            if not isinstance(el, Tag):
+                continue
+            in_container = id(el.parent) in inside
+            if in_container or CONTAINER_CLASSES.intersection(el.get("class") or ()):
+                inside.add(id(el))
+
+            if el.get("itemprop") == "additionalProperty" or "PropertyValue" in (el.get("itemtype") or ""):
+                self._index_microdata(el, index)
+            data_qa = el.get("data-qa") or ""
+            if "name" in data_qa and any(part in data_qa for part in DATA_QA_NAME_PARTS):
+                self._index_data_qa(el, index)
+
+            if el.name == "tr":
+                cells = el.find_all(["th", "td"])
+                if len(cells) >= 2:
+                    key, val = _text(cells[0]), _text(cells[1])
+                    if key:
+                        index["table"].append((normalize(key), val))
+            elif el.name == "dt" and el.find_parent("dl") is not None:
+                dd = el.find_next("dd")
+                if dd:
+                    key = _text(el)
+                    if key:
+                        index["dl"].append((normalize(key), _text(dd)))
+
+            if el.name in ("li", "p", "div"):
+                if in_container:
+                    self._index_container_row(el, index)
+                self._index_row(el, index)
+        return index
+
+    @staticmethod
+    def _index_microdata(el, index):
+        key_el = el.select_one('[itemprop="name"]')
+        val_el = el.select_one('[itemprop="value"]')
+        if key_el and val_el:
+            key, val = _text(key_el), _text(val_el)
+            if key and val:
+                index["microdata"].append((normalize(key), val))
+
+    @staticmethod
+    def _index_data_qa(name_el, index):
+        key = _text(name_el)
+        if not key:
+            return
+        row = name_el.parent
+        val_el = row.select_one('[data-qa*="value"]')
+        if not val_el:
+            # второй вариант: другой соседний span/div
+            for c in row.find_all(["span", "div"], recursive=False):
+                if c is name_el:
+                    continue
+                text = _text(c)
+                if text and normalize(text) != normalize(key):
+                    val_el = c
+                    break
+        if val_el:
+            val = _text(val_el)
+            if val:
+                index["data_qa"].append((normalize(key), val))
+
+    @staticmethod
+    def _index_container_row(row, index):
+        spans = row.find_all("span")
+        if len(spans) >= 2:
+            index["container"].append((normalize(_text(spans[0])), _text(spans[1])))
+            return
+        key_el = row.find(["b", "strong"])
+        if key_el:
+            # Значение — текст строки без подписи
+            val = " ".join(
+                s.strip() for s in row.find_all(string=True)
+                if s.strip() and key_el not in s.parents
+            )
+            index["container"].append((normalize(_text(key_el)), val))
+
+    @staticmethod
+    def _index_row(row, index):
+        # «Две колонки» и «Ключ: Значение»
+        children = row.find_all(["div", "span"], recursive=False)
+        if len(children) == 2:
+            k, v = _text(children[0]), _text(children[1])
+            if k and v and len(k) <= 60 and len(v) <= 200:
+                index["row"].append((normalize(k), v))
+                return
+        t = _short_text(row, 220)
+        if t and len(t) >= 5 and (":" in t or "—" in t or "-" in t):
+            m = re.match(r"\s*([^:–—-]{2,60})\s*[:–—-]\s*(.{1,160})", t)
+            if m:
+                k, v = m.group(1).strip(), m.group(2).strip()
+                if k and v:
+                    index["row"].append((normalize(k), v))
+
+    @cached_property
+    def props(self):
+        props = {}
+        for source in PROPS_SOURCES:
+            for key, val in self.index[source]:
+                if key and val:
+                    props[key] = val
+        return props
+
+    def value_by_labels(self, labels):
+        """Значение по первой подходящей подписи (совпадение по подстроке, normalized)."""
+        return find_by_labels(self.index, self.text, labels)
+
+    def label_snapshot(self):
+        """
+        Всё, что нужно value_by_labels, в JSON-совместимом виде — для кэша
+        карточек: подписи из LABEL_SOURCES и строки текста, похожие на «Ключ: Значение».
+        """
+        lines = self.text.split("\n")
+        # Подпись и разделитель бывают на соседних строках — берём и строку перед разделителем
+        keep = [
+            line for i, line in enumerate(lines)
+            if any(c in line for c in LABEL_SEPARATORS)
+            or (i + 1 < len(lines) and lines[i + 1][:1] != "" and lines[i + 1][:1] in LABEL_SEPARATORS)
+        ]
+        return {
+            "labels": {source: [list(pair) for pair in self.index[source]] for source in LABEL_SOURCES},
+            "text": "\n".join(keep),
+        }
+
+
+class CachedLabels:
+    """value_by_labels карточки из кэша (по ProductDocument.label_snapshot)."""
+
+    def __init__(self, snapshot):
+        labels = snapshot.get("labels") or {}
+        self.index = {source: [tuple(pair) for pair in labels.get(source, [])] for source in LABEL_SOURCES}
+        self.text = snapshot.get("text") or ""
+
+    def value_by_labels(self, labels):
+        return find_by_labels(self.index, self.text, labels)
+
+
+def find_by_labels(index, text, labels):
+    norm_labels = [normalize(l) for l in labels if l]
+    if not norm_labels:
+        return None
+
+    def match_key(nk):
+        return any(nl in nk or nk in nl for nl in norm_labels)
+
+    for source in LABEL_SOURCES:
+        for key, val in index[source]:
+            if key and match_key(key):
+                return val
+
+    # Фоллбэк: "Ключ: Значение" в тексте
+    for lab in labels:
+        lab_clean = re.sub(r"\s*KATEX_INLINE_OPEN.*?KATEX_INLINE_CLOSE\s*", "", lab).strip()
+        if not lab_clean:
+            continue
+        rx = re.compile(rf"{re.escape(lab_clean)}\s*[:\-–]\s*([^\n\r;|]+)", re.I)
+        m = rx.search(text)
+        if m:
+            return m.group(1).strip()
+    return None
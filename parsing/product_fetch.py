@@ -0,0 +1,135 @@
+# parsing/product_fetch.py
+"""
+Общая стадия обхода карточек товаров: N страниц одного контекста разбирают
+очередь ссылок параллельно, а результаты отдаются в порядке подачи ссылок.
+
+    async with ProductFetcher(context, fetch, workers=workers_for("baucenter")) as fetcher:
+        fetcher.feed_many(links)
+        fetcher.close()
+        async for item in fetcher:
+            ...
+
+fetch(page, link) — корутина парсера, которая возвращает dict товара.
+Ошибки по отдельным ссылкам не прерывают обход и копятся в fetcher.errors.
+"""
+import asyncio
+
+from django.conf import settings
+
+from . import progress
+
+_FAILED = object()
+
+
+def workers_for(shop_key, default=2):
+    return max(1, settings.PRODUCT_FETCH_WORKERS.get(shop_key, default))
+
+
+class ProductFetcher:
+    def __init__(self, context, fetch, workers=2, new_page=None, errors=None):
+        self.context = context
+        self.fetch = fetch
+        self.workers = max(1, workers)
+        self.new_page = new_page or context.new_page
+        self.errors = errors if errors is not None else []  # [(link, "сообщение")]
+        self._queue = asyncio.Queue()
+        self._done = {}
+        self._fed = 0
+        self._next = 0
+        self._closed = False
+        self._cond = asyncio.Condition()
+        self._tasks = []
+
+    async def __aenter__(self):
+        progress.set_stage("products")
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        return self
+
+    async def __aexit__(self, *exc):
+        for t in self._tasks:
+            t.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def feed(self, link):
+        if self._closed:
+            raise RuntimeError("ProductFetcher is closed")
+        self._queue.put_nowait((self._fed, link))
+        self._fed += 1
+
+    def feed_many(self, links):
+        for link in links:
+            self.feed(link)
+
+    def close(self):
+        # Больше ссылок не будет: итерация закончится, когда обработаются поданные
+        self._closed = True
+        for _ in self._tasks:
+            self._queue.put_nowait(None)
+        asyncio.get_running_loop().create_task(self._notify())
+
+    async def _notify(self):
+        async with self._cond:
+            self._cond.notify_all()
+
+    async def _put(self, idx, value):
+        async with self._cond:
+            self._done[idx] = value
+            self._cond.notify_all()
+
+    async def _worker(self):
+        page = None
+        try:
+            while True:
+                item = await self._queue.get()
+                if item is None:
+                    break
+                idx, link = item
+                try:
+                    if page is None or page.is_closed():
+                        page = await self.new_page()
+                    value = await self.fetch(page, link)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    self.errors.append((link, str(e)[:200]))
+                    progress.add("items_failed")
+                    value = _FAILED
+                progress.add("pages_processed")
+                await self._put(idx, value)
+        finally:
+            if page is not None:
+                try:
+                    await page.close()
+                except:
+                    pass
+
+    def _ready(self):
+        return self._next in self._done or (self._closed and self._next >= self._fed)
+
+    async def __aiter__(self):
+        while True:
+            async with self._cond:
+                await self._cond.wait_for(self._ready)
+                if self._next not in self._done:
+                    return
+                value = self._done.pop(self._next)
+                self._next += 1
+            if value is not _FAILED and value is not None:
+                yield value
+
+
+async def iter_products(context, links, fetch, workers=2, new_page=None, errors=None):
+    """Обойти готовый список ссылок, отдавая товары по мере готовности (в порядке ссылок)."""
+    workers = min(workers, max(1, len(links)))
+    async with ProductFetcher(context, fetch, workers=workers, new_page=new_page, errors=errors) as fetcher:
+        fetcher.feed_many(links)
+        fetcher.close()
+        async for item in fetcher:
+            yield item
+
+
+async def fetch_products(context, links, fetch, workers=2, new_page=None):
+    """Обойти готовый список ссылок целиком. Возвращает (results, errors)."""
+    errors = []
+    results = [item async for item in iter_products(context, links, fetch, workers, new_page, errors)]
+    return results, errors
@@ -0,0 +1,179 @@
+# parsing/profile_manager.py
+"""
+Отдельные профили Chromium для параллельных задач.
+
+launch_persistent_context держит lock на каталоге профиля, поэтому две задачи
+на одном каталоге не уживаются. Менеджер выдаёт каждой задаче свой каталог:
+- свободный «тёплый» профиль от прошлой задачи этого процесса, если есть;
+- иначе копию шаблонного профиля (cookies, кэш и прочее прогретое состояние).
+
+    async with get_profile_manager("lemanapro").profile() as profile_dir:
+        context = await playwright.chromium.launch_persistent_context(profile_dir, ...)
+
+Настройки — settings.CHROMIUM_PROFILES[name]. После успешной задачи профиль
+возвращается в свободные (не больше max_idle) и не чаще template_refresh
+секунд становится новым шаблоном. После неудачи профиль удаляется. Каталоги
+помечены pid процесса; каталоги умерших процессов чистятся при старте.
+"""
+import asyncio
+import itertools
+import logging
+import os
+import shutil
+import time
+from contextlib import asynccontextmanager
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+_seq = itertools.count(1)  # номера каталогов процесса (общие для всех loop)
+
+# Файлы блокировок Chromium: в копию не переносим, иначе копия «занята»
+LOCK_FILES = ("SingletonLock", "SingletonCookie", "SingletonSocket", "lockfile")
+SKIP_DIRS = ("Cache", "Code Cache", "GPUCache", "ShaderCache", "GrShaderCache", "Crashpad")
+
+
+def _ignore(_dir, names):
+    return [n for n in names if n in LOCK_FILES or n in SKIP_DIRS]
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class ProfileManager:
+    def __init__(self, name, template_dir, base_dir, max_profiles=2, max_idle=2, template_refresh=3600):
+        self.name = name
+        self.template_dir = template_dir
+        self.base_dir = base_dir
+        self.max_idle = max_idle
+        self.template_refresh = template_refresh
+        self._slots = asyncio.Semaphore(max(1, max_profiles))
+        self._idle = []
+        self._template_at = 0.0
+        self._counters = {"cloned": 0, "reused": 0, "discarded": 0, "template_updates": 0}
+        self._cleanup_dead()
+
+    def _prefix(self, pid=None):
+        return f"{self.name}-{pid or os.getpid()}-"
+
+    def _cleanup_dead(self):
+        try:
+            names = os.listdir(self.base_dir)
+        except OSError:
+            return
+        for n in names:
+            parts = n.rsplit("-", 2)
+            if len(parts) != 3 or parts[0] != self.name or not parts[1].isdigit():
+                continue
+            if not _pid_alive(int(parts[1])):
+                shutil.rmtree(os.path.join(self.base_dir, n), ignore_errors=True)
+
+    def _clone(self):
+        path = os.path.join(self.base_dir, f"{self._prefix()}{next(_seq)}")
+        shutil.rmtree(path, ignore_errors=True)
+        if os.path.isdir(self.template_dir):
+            shutil.copytree(self.template_dir, path, ignore=_ignore)
+        else:
+            os.makedirs(path)
+        return path
+
+    def _update_template(self, path):
+        # Новый шаблон собираем рядом и подменяем, чтобы клон не прочитал полкаталога
+        tmp = f"{self.template_dir}.new-{os.getpid()}"
+        old = f"{self.template_dir}.old-{os.getpid()}"
+        shutil.rmtree(tmp, ignore_errors=True)
+        shutil.copytree(path, tmp, ignore=_ignore)
+        if os.path.isdir(self.template_dir):
+            os.replace(self.template_dir, old)
+        os.replace(tmp, self.template_dir)
+        shutil.rmtree(old, ignore_errors=True)
+
+    async def acquire(self):
+        await self._slots.acquire()
+        try:
+            if self._idle:
+                self._counters["reused"] += 1
+                return self._idle.pop()
+            path = await asyncio.to_thread(self._clone)
+            self._counters["cloned"] += 1
+            return path
+        except BaseException:
+            self._slots.release()
+            raise
+
+    async def release(self, path, ok):
+        try:
+            if ok and time.monotonic() - self._template_at >= self.template_refresh:
+                self._template_at = time.monotonic()
+                try:
+                    await asyncio.to_thread(self._update_template, path)
+                    self._counters["template_updates"] += 1
+                except OSError:
+                    logger.warning("Profile template %s not updated", self.template_dir, exc_info=True)
+            if ok and len(self._idle) < self.max_idle:
+                self._idle.append(path)
+            else:
+                self._counters["discarded"] += 1
+                await asyncio.to_thread(shutil.rmtree, path, True)
+        finally:
+            self._slots.release()
+
+    @asynccontextmanager
+    async def profile(self):
+        path = await self.acquire()
+        ok = False
+        try:
+            yield path
+            ok = True
+        finally:
+            await self.release(path, ok)
+
+    def close(self):
+        for path in self._idle:
+            shutil.rmtree(path, ignore_errors=True)
+        self._idle.clear()
+
+    def stats(self):
+        return {**self._counters, "idle": len(self._idle)}
+
+
+# Как и пул браузеров, менеджер привязан к event loop (в нём asyncio.Semaphore)
+_managers = {}  # (loop, name) -> ProfileManager
+
+
+def get_profile_manager(name):
+    key = (asyncio.get_running_loop(), name)
+    manager = _managers.get(key)
+    if manager is None:
+        conf = settings.CHROMIUM_PROFILES.get(name) or {}
+        base_dir = settings.CHROMIUM_PROFILE_DIR
+        os.makedirs(base_dir, exist_ok=True)
+        manager = _managers[key] = ProfileManager(
+            name,
+            template_dir=conf.get("template") or os.path.join(base_dir, f"{name}-template"),
+            base_dir=base_dir,
+            max_profiles=conf.get("max_profiles", settings.PARSE_WORKER_CONCURRENCY),
+            max_idle=conf.get("max_idle", 2),
+            template_refresh=conf.get("template_refresh", 3600),
+        )
+    return manager
+
+
+def close_profile_managers():
+    """Удаляет свободные профили менеджеров текущего loop (вызывается из BrowserPool.close)."""
+    loop = asyncio.get_running_loop()
+    for key in [k for k in _managers if k[0] is loop]:
+        _managers.pop(key).close()
+
+
+def profile_stats():
+    loop = asyncio.get_running_loop()
+    return {name: m.stats() for (l, name), m in _managers.items() if l is loop}
@@ -0,0 +1,82 @@
+# parsing/progress.py
+"""
+Счётчики прогресса задачи.
+
+Парсеры и общие стадии только меняют числа в памяти (без запросов к БД):
+
+    progress.add("pages_processed")
+    progress.set_stage("products")
+
+а задача раз в PARSE_PROGRESS_FLUSH_SECONDS пишет изменения одним UPDATE
+строки parsing_requests. Текущая задача берётся из contextvar, поэтому
+параллельные задачи одного event loop не мешают друг другу.
+"""
+import asyncio
+import contextvars
+
+from django.conf import settings
+
+from .models import Request
+
+FIELDS = ("links_found", "pages_processed", "items_saved", "items_failed")
+
+current_progress = contextvars.ContextVar("parse_progress", default=None)
+
+
+class JobProgress:
+    def __init__(self, request_id, flush_seconds=None):
+        self.request_id = request_id
+        self.flush_seconds = flush_seconds or settings.PARSE_PROGRESS_FLUSH_SECONDS
+        self.counters = dict.fromkeys(FIELDS, 0)
+        self.stage = ""
+        self._dirty = True
+
+    def add(self, field, n=1):
+        self.counters[field] += n
+        self._dirty = True
+
+    def set_value(self, field, value):
+        if self.counters[field] != value:
+            self.counters[field] = value
+            self._dirty = True
+
+    def set_stage(self, stage):
+        if self.stage != stage:
+            self.stage = stage
+            self._dirty = True
+
+    async def flush(self):
+        if not self._dirty:
+            return
+        self._dirty = False
+        await Request.objects.filter(pk=self.request_id).aupdate(stage=self.stage, **self.counters)
+
+    async def autoflush(self):
+        while True:
+            await asyncio.sleep(self.flush_seconds)
+            try:
+                await self.flush()
+            except Exception:
+                self._dirty = True
+
+
+def get():
+    return current_progress.get()
+
+
+def add(field, n=1):
+    p = current_progress.get()
+    if p is not None:
+        p.add(field, n)
+
+
+def set_value(field, value):
+    p = current_progress.get()
+    if p is not None:
+        p.set_value(field, value)
+
+
+def set_stage(stage):
+    p = current_progress.get()
+    if p is not None:
+        p.set_stage(stage)
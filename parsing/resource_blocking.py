@@ -0,0 +1,114 @@
+# parsing/resource_blocking.py
+"""
+Блокировка лишних сетевых запросов в контекстах Playwright.
+
+Для каждого магазина в settings.RESOURCE_BLOCKING задаются типы ресурсов
+(image, media, font, ...) и список доменов/фрагментов URL (аналитика, реклама).
+Скрипты самого сайта не трогаем: ими рендерятся цены и наличие.
+
+    stats = await install_blocking(context, "baucenter")
+
+Реальный размер заблокированного ответа неизвестен (мы его не скачали),
+поэтому bytes_saved_estimate — оценка по типичному размеру ресурса этого типа.
+"""
+import logging
+from collections import Counter
+from urllib.parse import urlparse
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Грубые типичные размеры ответов, байт — только для оценки экономии
+TYPICAL_SIZE = {
+    "image": 60_000,
+    "media": 500_000,
+    "font": 40_000,
+    "stylesheet": 30_000,
+    "script": 40_000,
+    "xhr": 5_000,
+    "fetch": 5_000,
+}
+
+# Счётчики по магазинам за всё время жизни процесса
+TOTALS = {}
+
+
+class BlockingPolicy:
+    def __init__(self, types=(), patterns=()):
+        self.types = frozenset(types)
+        self.patterns = tuple(p.lower() for p in patterns if p)
+
+    def __bool__(self):
+        return bool(self.types or self.patterns)
+
+    def should_block(self, resource_type, url):
+        if resource_type in self.types:
+            return True
+        low = url.lower()
+        host = urlparse(low).hostname or ""
+        for p in self.patterns:
+            # "mc.yandex.ru" — домен и поддомены, "/metrika/" — фрагмент URL
+            if host == p or host.endswith("." + p) or ("/" in p and p in low):
+                return True
+        return False
+
+
+class BlockingStats:
+    def __init__(self, shop_key):
+        self.shop_key = shop_key
+        self.allowed = 0
+        self.blocked = Counter()
+        self.bytes_saved_estimate = 0
+
+    def as_dict(self):
+        return {
+            "allowed": self.allowed,
+            "blocked": dict(self.blocked),
+            "bytes_saved_estimate": self.bytes_saved_estimate,
+        }
+
+
+def totals():
+    """Счётчики по магазинам за время жизни процесса (для логов воркера)."""
+    return {shop_key: stats.as_dict() for shop_key, stats in TOTALS.items()}
+
+
+def policy_for(shop_key):
+    if not settings.RESOURCE_BLOCKING_ENABLED:
+        return BlockingPolicy()
+    conf = settings.RESOURCE_BLOCKING.get(shop_key) or {}
+    patterns = list(settings.RESOURCE_BLOCKING_COMMON_PATTERNS) + list(conf.get("patterns", []))
+    return BlockingPolicy(conf.get("types", ()), patterns)
+
+
+async def install_blocking(context, shop_key, policy=None):
+    """Вешает перехват на контекст. Возвращает BlockingStats или None, если блокировать нечего."""
+    policy = policy if policy is not None else policy_for(shop_key)
+    if not policy:
+        return None
+    stats = BlockingStats(shop_key)
+    totals = TOTALS.setdefault(shop_key, BlockingStats(shop_key))
+
+    async def handler(route):
+        req = route.request
+        if policy.should_block(req.resource_type, req.url):
+            size = TYPICAL_SIZE.get(req.resource_type, 0)
+            for s in (stats, totals):
+                s.blocked[req.resource_type] += 1
+                s.bytes_saved_estimate += size
+            try:
+                await route.abort("blockedbyclient")
+            except:
+                pass
+            return
+        stats.allowed += 1
+        totals.allowed += 1
+        try:
+            await route.continue_()
+        except:
+            pass
+
+    await context.route("**/*", handler)
+    context.on("close", lambda _: logger.info("Blocked requests [%s]: %s", shop_key, stats.as_dict()))
+    return stats
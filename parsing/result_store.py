@@ -0,0 +1,53 @@
+# parsing/result_store.py
+"""
+Пакетная запись результатов в parsing_results.
+
+Пачка пишется в одной транзакции: bulk_create кусками по PARSE_RESULT_CHUNK_SIZE,
+а на PostgreSQL для пачек от PARSE_RESULT_COPY_THRESHOLD строк — через COPY.
+"""
+import io
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import Result
+
+COPY_COLUMNS = ("request_id", "url", "article", "name", "price", "stock", "tx1", "tx2", "change", "created_at")
+
+
+def _csv_field(value):
+    # В CSV-режиме COPY NULL — это пустое поле без кавычек, а строка всегда в кавычках
+    if value is None:
+        return ""
+    return '"' + str(value).replace('"', '""') + '"'
+
+
+def _copy_results(objs):
+    now = timezone.now()
+    buf = io.StringIO()
+    for obj in objs:
+        if obj.created_at is None:
+            obj.created_at = now
+        buf.write(",".join(_csv_field(getattr(obj, col)) for col in COPY_COLUMNS))
+        buf.write("\n")
+    buf.seek(0)
+    sql = f"COPY {Result._meta.db_table} ({', '.join(COPY_COLUMNS)}) FROM STDIN WITH (FORMAT csv)"
+    with connection.cursor() as cursor:
+        cursor.copy_expert(sql, buf)
+
+
+def save_results(objs, chunk_size=None, copy_threshold=None):
+    """Сохраняет список несохранённых Result. Возвращает число записанных строк."""
+    if not objs:
+        return 0
+    chunk_size = chunk_size or settings.PARSE_RESULT_CHUNK_SIZE
+    copy_threshold = copy_threshold or settings.PARSE_RESULT_COPY_THRESHOLD
+
+    with transaction.atomic():
+        if connection.vendor == "postgresql" and len(objs) >= copy_threshold:
+            _copy_results(objs)
+        else:
+            for i in range(0, len(objs), chunk_size):
+                Result.objects.bulk_create(objs[i:i + chunk_size])
+    return len(objs)
@@ -0,0 +1,113 @@
+# parsing/runner.py
+"""
+Асинхронный раннер задач: один event loop на процесс воркера ведёт до
+`concurrency` задач одновременно. Парсеры I/O-bound, поэтому потоки не нужны,
+а ресурсы, привязанные к loop (браузеры, HTTP-клиенты), можно делить между задачами.
+"""
+import asyncio
+import logging
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+
+from . import engine_health, listing_api, navigation, product_cache, resource_blocking
+from .browser_pool import close_browser_pool, get_browser_pool
+from .job_queue import claim_next_job, fail_job, heartbeat, release_jobs, requeue_stale_jobs
+from .parsers.lemanopro import STOCK_STATS
+from .tasks import run_parser_job
+from .waits import wait_stats
+
+logger = logging.getLogger(__name__)
+
+
+class JobRunner:
+    def __init__(self, worker_id, concurrency=None, poll_interval=None):
+        self.worker_id = worker_id
+        self.concurrency = max(1, concurrency or settings.PARSE_WORKER_CONCURRENCY)
+        self.poll_interval = poll_interval or settings.PARSE_QUEUE_POLL_SECONDS
+        self.active = {}  # request_id -> asyncio.Task
+        self._stopping = asyncio.Event()
+
+    def stop(self):
+        self._stopping.set()
+
+    async def _sleep(self, seconds):
+        try:
+            await asyncio.wait_for(self._stopping.wait(), timeout=seconds)
+        except asyncio.TimeoutError:
+            pass
+
+    async def _wait_for_slot(self):
+        stop_wait = asyncio.create_task(self._stopping.wait())
+        try:
+            await asyncio.wait([stop_wait, *self.active.values()], return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            stop_wait.cancel()
+
+    async def _claim(self):
+        def claim():
+            close_old_connections()
+            return claim_next_job(self.worker_id)
+        return await sync_to_async(claim)()
+
+    async def _run_job(self, request_id):
+        try:
+            await run_parser_job(request_id)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.exception("Job %s crashed", request_id)
+            try:
+                await sync_to_async(fail_job)(request_id, self.worker_id, f"Worker error: {e}")
+            except Exception:
+                logger.exception("Job %s not marked as failed", request_id)
+        finally:
+            self.active.pop(request_id, None)
+
+    async def _heartbeat_loop(self):
+        while not self._stopping.is_set():
+            await self._sleep(settings.PARSE_HEARTBEAT_SECONDS)
+            try:
+                await sync_to_async(heartbeat)(self.worker_id, list(self.active))
+                requeued, failed = await sync_to_async(requeue_stale_jobs)()
+                if requeued or failed:
+                    logger.warning("Stale jobs: requeued %s, failed %s", requeued, failed)
+                logger.info("Browser pool: %s", (await get_browser_pool()).stats())
+                logger.info("Waits: %s", wait_stats())
+                logger.info("Engine health: %s", engine_health.snapshot())
+                await navigation.sync(force=True)
+                logger.info("Navigation: %s", navigation.stats())
+                logger.info("Blocked requests: %s", resource_blocking.totals())
+                logger.info("Product cache: %s", product_cache.STATS)
+                logger.info("Lemana PRO stock sources: %s", STOCK_STATS)
+                logger.info("Category listings: %s", listing_api.STATS)
+            except Exception:
+                logger.exception("Heartbeat failed")
+
+    async def run(self, drain_timeout=None):
+        await sync_to_async(requeue_stale_jobs)()
+        # Прогреваем браузеры до первой задачи
+        await get_browser_pool()
+        hb = asyncio.create_task(self._heartbeat_loop())
+        try:
+            while not self._stopping.is_set():
+                if len(self.active) >= self.concurrency:
+                    await self._wait_for_slot()
+                    continue
+                request_id = await self._claim()
+                if request_id is None:
+                    await self._sleep(self.poll_interval)
+                    continue
+                self.active[request_id] = asyncio.create_task(self._run_job(request_id))
+        finally:
+            if self.active:
+                _, pending = await asyncio.wait(list(self.active.values()), timeout=drain_timeout)
+                for task in pending:
+                    task.cancel()
+                interrupted = list(self.active)
+                await asyncio.gather(*pending, return_exceptions=True)
+                await sync_to_async(release_jobs)(interrupted)
+            hb.cancel()
+            await asyncio.gather(hb, return_exceptions=True)
+            await close_browser_pool()
@@ -1,9 +1,20 @@
 from rest_framework import serializers
-from .models import Request, Shop
+from .models import Request, Result, Shop
 
 class RequestSerializer(serializers.ModelSerializer):
 
     url = serializers.URLField(max_length=10000)
     class Meta:
         model = Request
-        fields = "__all__"
\ No newline at end of file
+        fields = "__all__"
+        read_only_fields = (
+            "worker_id", "attempts", "started_at", "heartbeat_at", "finished_at",
+            "stage", "links_found", "pages_processed", "items_saved", "items_failed",
+            "fingerprint", "leader", "checkpoint_links", "checkpoint_at",
+        )
+
+
+class ResultSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Result
+        fields = ("id", "url", "article", "name", "price", "stock", "tx1", "tx2", "change", "created_at")
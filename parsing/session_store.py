@@ -0,0 +1,117 @@
+# parsing/session_store.py
+"""
+Сохранённое состояние сессии браузера (cookies + localStorage) по магазинам.
+
+После успешного прохода storage_state контекста пишется в файл
+SESSION_STATE_DIR/<магазин>-<движок>.json и подкладывается в новые
+контексты: пройденная проверка DDoS-Guard, выбранный регион и согласие на
+cookies переживают закрытие контекста.
+
+    async with pool.context("chromium", **session_store.context_kwargs("baucenter", "chromium")) as context:
+        ...
+        await session_store.save(context, "baucenter", "chromium")
+
+Состояние годно SESSION_STATE_TTL секунд (по магазинам). Если в контексте
+пришлось проходить заглушку (note_challenge), после успеха оно
+перезаписывается сразу, а при неудаче помечается невалидным. Иначе свежее
+состояние перезаписывается не чаще SESSION_STATE_REFRESH_SECONDS.
+"""
+import json
+import logging
+import os
+import tempfile
+import time
+import weakref
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+_challenged = weakref.WeakSet()  # контексты, в которых встречалась заглушка
+
+
+def _path(shop_key, engine):
+    return os.path.join(settings.SESSION_STATE_DIR, f"{shop_key}-{engine}.json")
+
+
+def _read(shop_key, engine):
+    try:
+        with open(_path(shop_key, engine), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write(shop_key, engine, record):
+    os.makedirs(settings.SESSION_STATE_DIR, exist_ok=True)
+    # Через временный файл: параллельный воркер не прочитает половину JSON
+    fd, tmp = tempfile.mkstemp(dir=settings.SESSION_STATE_DIR, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(record, f, ensure_ascii=False)
+        os.replace(tmp, _path(shop_key, engine))
+    except OSError:
+        logger.warning("Session state for %s/%s not saved", shop_key, engine, exc_info=True)
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+
+
+def ttl_for(shop_key):
+    return settings.SESSION_STATE_TTL.get(shop_key, settings.SESSION_STATE_TTL.get("default", 6 * 3600))
+
+
+def load(shop_key, engine):
+    """storage_state или None, если его нет, оно устарело или признано невалидным."""
+    if not settings.SESSION_STATE_ENABLED:
+        return None
+    record = _read(shop_key, engine)
+    if not record or not record.get("valid", True):
+        return None
+    if time.time() - record.get("saved_at", 0) > ttl_for(shop_key):
+        return None
+    state = record.get("state") or {}
+    now = time.time()
+    # Cookies с истёкшим сроком браузер всё равно выбросит; -1 — сессионные
+    state["cookies"] = [c for c in state.get("cookies", []) if (c.get("expires") or -1) <= 0 or c["expires"] > now]
+    return state
+
+
+def context_kwargs(shop_key, engine):
+    state = load(shop_key, engine)
+    return {"storage_state": state} if state else {}
+
+
+def note_challenge(context):
+    _challenged.add(context)
+
+
+def was_challenged(context):
+    return context in _challenged
+
+
+def invalidate(shop_key, engine):
+    record = _read(shop_key, engine)
+    if record and record.get("valid", True):
+        record["valid"] = False
+        _write(shop_key, engine, record)
+
+
+async def save(context, shop_key, engine, force=False):
+    """Сохраняет storage_state после успешного прохода. True, если записали."""
+    if not settings.SESSION_STATE_ENABLED:
+        return False
+    force = force or was_challenged(context)
+    record = _read(shop_key, engine)
+    if (
+        not force and record and record.get("valid", True)
+        and time.time() - record.get("saved_at", 0) < settings.SESSION_STATE_REFRESH_SECONDS
+    ):
+        return False
+    try:
+        state = await context.storage_state()
+    except Exception:
+        return False
+    _write(shop_key, engine, {"saved_at": time.time(), "valid": True, "state": state})
+    return True
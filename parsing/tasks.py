@@ -1,39 +1,150 @@
 # parsing/tasks.py
 import asyncio
+import inspect
+import time
+from contextlib import aclosing
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.utils import timezone
+from .browser_pool import close_browser_pool
+from . import checkpoint, jobs, progress
+from .coalescing import finish_request
 from .models import Request, Result
 from .parsers import get_parser
+from .result_store import save_results
 
-def run_parser_task(request_id):
-    req = Request.objects.select_related("shop").get(id=request_id)
+
+async def iter_parser_results(parser_func, url, tx1, tx2):
+    # Парсер может быть async-генератором (отдаёт товары по одному) или вернуть список
+    produced = parser_func(url, tx1, tx2)
+    if inspect.isasyncgen(produced):
+        async with aclosing(produced) as stream:
+            async for res in stream:
+                yield res
+    else:
+        for res in (await produced) or []:
+            yield res
+
+
+class ResultWriter:
+    """
+    Копит результаты и пишет их в parsing_results пачками: по размеру пачки
+    или по времени, чтобы частичные результаты были видны, пока задача running.
+    """
+
+    def __init__(self, req, batch_size=None, flush_seconds=None):
+        self.req = req
+        self.batch_size = batch_size or settings.PARSE_RESULT_BATCH_SIZE
+        self.flush_seconds = flush_seconds or settings.PARSE_RESULT_FLUSH_SECONDS
+        self.tx1_key = f"ТХ1_{req.params.get('tx1')}"
+        self.tx2_key = f"ТХ2_{req.params.get('tx2')}"
+        self.buffer = []
+        self.saved = 0
+        self._last_flush = time.monotonic()
+
+    def to_model(self, res):
+        return Result(
+            request=self.req,
+            url=res.get("Ссылка"),
+            article=res.get("Артикул"),
+            name=res.get("Название"),
+            price=res.get("Цена"),
+            stock=res.get("Остаток"),
+            tx1=res.get(self.tx1_key),
+            tx2=res.get(self.tx2_key),
+            change=res.get("Изменение"),
+        )
+
+    async def add(self, res):
+        self.buffer.append(self.to_model(res))
+        if (len(self.buffer) >= self.batch_size
+                or time.monotonic() - self._last_flush >= self.flush_seconds):
+            await self.flush()
+
+    async def flush(self):
+        self._last_flush = time.monotonic()
+        if not self.buffer:
+            return
+        batch, self.buffer = self.buffer, []
+        self.saved += await sync_to_async(save_results)(batch)
+        progress.set_value("items_saved", self.saved)
+
+
+def should_resume(req, saved_now):
+    """Упавшую задачу возвращаем в очередь, если эта попытка что-то сохранила и попытки не кончились."""
+    return settings.PARSE_JOB_AUTO_RESUME and saved_now > 0 and req.attempts < settings.PARSE_JOB_MAX_ATTEMPTS
+
+
+async def run_parser_job(request_id):
+    """
+    Выполняет одну задачу внутри уже работающего event loop.
+    Все обращения к ORM — через async-API Django, сам парсер просто await-ится,
+    поэтому один loop может вести много задач одновременно.
+    """
+    req = await Request.objects.select_related("shop").aget(id=request_id)
     parser_func = get_parser(req.shop.parser_key)
 
     if not parser_func:
         req.status = "error"
         req.error_message = f"Parser for shop '{req.shop.parser_key}' not found"
-        req.save()
+        req.finished_at = timezone.now()
+        await sync_to_async(finish_request)(req, ["status", "error_message", "finished_at"])
         return
 
+    # Повторная попытка продолжает с чекпоинта: результаты прошлых попыток остаются,
+    # их ссылки парсер пропустит
+    job_checkpoint = await checkpoint.load(req)
+    job = jobs.JobContext(req.id, req.shop.parser_key, req.url, req.params)
+    job.checkpoint = job_checkpoint
+    jobs.current_job.set(job)
+    job_progress = progress.JobProgress(req.id)
+    job_progress.set_stage("links")
+    # Результаты прошлых попыток уже в БД — не показываем 0 до первой пачки
+    job_progress.set_value("items_saved", job_checkpoint.saved)
+    progress.current_progress.set(job_progress)
+    await job_progress.flush()
+    autoflush = asyncio.create_task(job_progress.autoflush())
+
+    writer = ResultWriter(req)
+    writer.saved = job_checkpoint.saved
     try:
-        results = asyncio.run(
-            parser_func(req.url, req.params.get("tx1"), req.params.get("tx2"))
-        )
-        if not results:
+        try:
+            async for res in iter_parser_results(
+                parser_func, req.url, req.params.get("tx1"), req.params.get("tx2")
+            ):
+                await writer.add(res)
+        finally:
+            # Всё, что успели собрать до падения, остаётся в БД
+            await writer.flush()
+        if not writer.saved:
             raise RuntimeError("Parser returned 0 results (blocked by site or no items found)")
-
-        for res in results:
-            Result.objects.create(
-                request=req,
-                url=res.get("Ссылка"),
-                article=res.get("Артикул"),
-                name=res.get("Название"),
-                price=res.get("Цена"),
-                stock=res.get("Остаток"),
-                tx1=res.get(f"ТХ1_{req.params.get('tx1')}"),
-                tx2=res.get(f"ТХ2_{req.params.get('tx2')}"),
-            )
         req.status = "done"
         req.error_message = None
     except Exception as e:
         req.status = "error"
         req.error_message = str(e)
-    req.save()
+    finally:
+        autoflush.cancel()
+    if req.status == "error" and should_resume(req, writer.saved - job_checkpoint.saved):
+        # Присоединённые остаются ждать: задача ещё не завершена
+        req.status = "pending"
+        req.worker_id = None
+        job_progress.set_stage("requeued")
+        await job_progress.flush()
+        await req.asave(update_fields=["status", "error_message", "worker_id"])
+        return
+    job_progress.set_stage(req.status)
+    await job_progress.flush()
+    req.finished_at = timezone.now()
+    await sync_to_async(finish_request)(req, ["status", "error_message", "finished_at"])
+
+
+def run_parser_task(request_id):
+    # Синхронная обёртка для разового запуска вне воркера (shell, отладка)
+    async def main():
+        try:
+            await run_parser_job(request_id)
+        finally:
+            await close_browser_pool()
+    asyncio.run(main())
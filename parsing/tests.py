@@ -1,3 +1,570 @@
-from django.test import TestCase
+import csv
+import io
+import json
+from datetime import timedelta
+from types import SimpleNamespace
+from unittest import mock
+from urllib.parse import parse_qsl, urlsplit
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+
+from .api_capture import JsonCapture
+from .coalescing import canonical_url, create_request, fail_followers, finish_request
+from . import navigation
+from .job_queue import claim_next_job, fail_job, heartbeat, release_jobs, requeue_stale_jobs, resume_job
+from .listing_api import collect_from_api, parse_listing
+from .models import DomainBreaker, Request, Result, Shop
+from .parsers.lemanopro import sum_store_quantities
+from .product_cache import cached_product
+from .product_document import CachedLabels, ProductDocument
+from .tasks import ResultWriter, run_parser_job
+from .views import RESULT_EXPORT_FIELDS
+from .tx_matcher import ALIAS, EXACT, PropsIndex, matcher_for
+
+CATEGORY_URL = "https://shop.ru/catalog/laminat/"
+API_URL = "https://shop.ru/api/catalog/laminat?page=1"
+
+
+def to_url(value):
+    return "https://shop.ru" + value if value.startswith("/product/") else None
+
+
+def items(start, n, **extra):
+    return [{"url": f"/product/{i}/", "reviews": {"count": 50}, "count": 50, **extra} for i in range(start, start + n)]
+
+
+def listing_page(page, per_page=24, total=600, with_total=True):
+    start = (page - 1) * per_page
+    data = {"data": {"products": items(start, max(0, min(per_page, total - start)))}}
+    if with_total:
+        data["data"]["pagination"] = {"totalCount": total}
+    return data
+
+
+class FakeResponse:
+    def __init__(self, data, status=200):
+        self.status = status
+        self._data = data
+
+    async def json(self):
+        return self._data
+
+
+class FakeApi:
+    def __init__(self, **page_kwargs):
+        self.page_kwargs = page_kwargs
+        self.calls = 0
+
+    async def get(self, url, timeout=None, fail_on_status_code=True):
+        self.calls += 1
+        page = int(dict(parse_qsl(urlsplit(url).query))["page"])
+        return FakeResponse(listing_page(page, **self.page_kwargs))
+
+
+class FakePage:
+    def __init__(self, api, dom_hrefs=()):
+        self.url = CATEGORY_URL
+        self.context = SimpleNamespace(request=api)
+        self.dom_hrefs = list(dom_hrefs)
+
+    def on(self, event, handler):
+        pass
+
+    def remove_listener(self, event, handler):
+        pass
+
+    async def eval_on_selector_all(self, selector, script):
+        return self.dom_hrefs
+
+
+def capture_with(page, *payloads):
+    capture = JsonCapture(page, ["/api/"])
+    for url, data in payloads:
+        capture.payloads.append((url, data))
+        capture.methods[url] = "GET"
+    return capture
+
+
+class ParseListingTests(SimpleTestCase):
+    def test_total_from_container_not_items(self):
+        data = {"total": 600, "items": items(0, 24)}
+        links, total = parse_listing(data, to_url)
+        self.assertEqual(len(links), 24)
+        self.assertEqual(total, 600)
+
+    def test_total_from_pagination_block(self):
+        links, total = parse_listing(listing_page(1), to_url)
+        self.assertEqual(len(links), 24)
+        self.assertEqual(total, 600)
+
+    def test_per_item_counts_are_not_a_total(self):
+        links, total = parse_listing({"items": items(0, 24)}, to_url)
+        self.assertEqual(len(links), 24)
+        self.assertIsNone(total)
+
+    def test_not_a_listing(self):
+        self.assertIsNone(parse_listing({"items": [{"name": "x"}, {"name": "y"}]}, to_url))
+
+
+class CollectFromApiTests(SimpleTestCase):
+    async def test_pages_through_whole_category(self):
+        api = FakeApi()
+        page = FakePage(api)
+        got = await collect_from_api(page, capture_with(page, (API_URL, listing_page(1))), to_url, cap_ms=0)
+        links, total = got
+        self.assertEqual(total, 600)
+        self.assertEqual(len(links), 600)
+
+    async def test_item_counts_do_not_stop_paging(self):
+        api = FakeApi(with_total=False)
+        page = FakePage(api)
+        first = listing_page(1, with_total=False)
+        links, total = await collect_from_api(page, capture_with(page, (API_URL, first)), to_url, cap_ms=0)
+        self.assertIsNone(total)
+        self.assertEqual(len(links), 600)
+
+    async def test_prefers_listing_over_widget(self):
+        widget = {"products": [{"url": f"/product/{i}/"} for i in range(900, 930)]}
+        page = FakePage(FakeApi(), dom_hrefs=[f"/product/{i}/" for i in range(24)])
+        capture = capture_with(
+            page,
+            ("https://shop.ru/api/recommendations?page=1", widget),
+            (API_URL, listing_page(1)),
+        )
+        links, total = await collect_from_api(page, capture, to_url, cap_ms=0)
+        self.assertEqual(total, 600)
+        self.assertIn("https://shop.ru/product/599/", links)
+        self.assertNotIn("https://shop.ru/product/900/", links)
+
+    async def test_rejects_unrelated_payload(self):
+        widget = {"products": [{"url": f"/product/{i}/"} for i in range(900, 930)]}
+        page = FakePage(FakeApi(), dom_hrefs=[f"/product/{i}/" for i in range(24)])
+        capture = capture_with(page, ("https://shop.ru/api/recommendations?page=1", widget))
+        self.assertIsNone(await collect_from_api(page, capture, to_url, cap_ms=0))
+
+    async def test_page_counter_wins_over_api_total(self):
+        page = FakePage(FakeApi())
+        capture = capture_with(page, (API_URL, listing_page(1)))
+        # API отдаёт 600, а на странице 700 — недобор, фоллбэк в DOM
+        self.assertIsNone(await collect_from_api(page, capture, to_url, expected=700, cap_ms=0))
+
+
+class StoreQuantityTests(SimpleTestCase):
+    def test_sums_store_list_entries(self):
+        data = {"stocks": [{"storeId": 1, "stock": 3}, {"storeId": 2, "quantity": "4"}, {"storeId": 3}]}
+        self.assertEqual(sum_store_quantities(data), "7")
+
+    def test_ignores_nested_numbers_in_entries(self):
+        data = {"stores": [{"storeId": 1, "stock": 3, "price": {"shop": "x", "amount": 999}}]}
+        self.assertEqual(sum_store_quantities(data), "3")
+
+    def test_ambiguous_keys_are_not_quantities(self):
+        data = {"stores": [{"storeId": 1, "available": 1, "amount": 999}]}
+        self.assertIsNone(sum_store_quantities(data))
+
+    def test_not_a_stock_payload(self):
+        self.assertIsNone(sum_store_quantities({"price": {"amount": 999}}))
+
+
+PRODUCT_HTML = """
+<html><body>
+<h1>Ламинат</h1>
+<div class="characteristics">
+  <li><span>Класс износостойкости</span><span>33</span></li>
+  <li><b>Толщина</b> 8 мм</li>
+</div>
+<table><tr><th>Цвет</th><td>Дуб</td></tr></table>
+<p>Описание товара длинным текстом без подписей, которое не нужно хранить в кэше целиком.</p>
+<section>Страна производства: Россия</section>
+</body></html>
+"""
+
+
+class CachedLabelsTests(SimpleTestCase):
+    LABELS = (["Класс износостойкости"], ["Толщина"], ["Цвет"], ["Страна производства"], ["Вес"])
+
+    def test_snapshot_answers_like_document(self):
+        doc = ProductDocument(PRODUCT_HTML)
+        cached = CachedLabels(doc.label_snapshot())
+        for labels in self.LABELS:
+            self.assertEqual(cached.value_by_labels(labels), doc.value_by_labels(labels), labels)
+        self.assertEqual(cached.value_by_labels(["Страна производства"]), "Россия")
+        self.assertNotIn("Описание", cached.text)
+
+    async def test_cache_hit_keeps_label_search(self):
+        doc = ProductDocument(PRODUCT_HTML)
+        fields = {"Артикул": "1", "Название": "Ламинат", "Цена": "100", "Остаток": "5"}
+
+        async def extract():
+            return fields, doc.props, doc
+
+        url = "https://shop.ru/product/cached-labels-1/"
+        await cached_product("test", url, extract)
+        _, _, extra = await cached_product("test", url, extract)
+        self.assertIsInstance(extra, CachedLabels)
+        self.assertEqual(extra.value_by_labels(["Толщина"]), doc.value_by_labels(["Толщина"]))
+
+
+class CanonicalUrlTests(SimpleTestCase):
+    def test_drops_tracking_params(self):
+        self.assertEqual(
+            canonical_url("https://www.shop.ru/catalog/laminat/?utm_source=x&page=2&gclid=1"),
+            canonical_url("https://shop.ru/catalog/laminat?page=2"),
+        )
+
+    def test_keeps_offset_param(self):
+        self.assertNotEqual(
+            canonical_url("https://shop.ru/catalog/laminat/?from=40"),
+            canonical_url("https://shop.ru/catalog/laminat/?from=0"),
+        )
+
+
+class TxMatcherTests(SimpleTestCase):
+    def test_manufacturer_is_not_country(self):
+        value, rank = matcher_for("Производитель").find({"Страна производства": "Китай"})
+        self.assertIsNone(value)
+        self.assertIsNone(rank)
+
+    def test_country_synonyms(self):
+        self.assertEqual(matcher_for("Страна изготовления").find({"Страна производства": "Китай"}), ("Китай", ALIAS))
+
+    def test_exact_label_wins_over_earlier_substring(self):
+        props = {"Мощность двигателя": "1800", "Мощность": "1500"}
+        self.assertEqual(matcher_for("Мощность").find(props), ("1500", EXACT))
+
+    def test_best_label_is_remembered_per_label_set(self):
+        matcher = matcher_for("Мощность, Вт")
+        first = PropsIndex({"Мощность двигателя": "1800", "Вес": "2"})
+        second = PropsIndex({"Мощность двигателя": "900", "Вес": "3"})
+        self.assertEqual(matcher.find(first), ("1800", ALIAS))
+        self.assertEqual(matcher.find(second), ("900", ALIAS))
+        self.assertIn(first.labels, matcher._best)
+
+
+class NavigationPolicyTests(SimpleTestCase):
+    def test_classify(self):
+        self.assertEqual(navigation.classify(SimpleNamespace(status=200)), "ok")
+        self.assertEqual(navigation.classify(SimpleNamespace(status=404)), "not_found")
+        self.assertEqual(navigation.classify(SimpleNamespace(status=429)), "rate_limited")
+        self.assertEqual(navigation.classify(SimpleNamespace(status=403)), "forbidden")
+        self.assertEqual(navigation.classify(SimpleNamespace(status=503)), "server_error")
+        self.assertEqual(navigation.classify(SimpleNamespace(status=400)), "client_error")
+        self.assertEqual(navigation.classify(exc=TimeoutError("Timeout 60000ms exceeded")), "timeout")
+        self.assertEqual(navigation.classify(exc=ConnectionError("net::ERR_CONNECTION_RESET")), "network")
+
+    @override_settings(NAVIGATION_BACKOFF_BASE_MS=800, NAVIGATION_BACKOFF_CAP_MS=15000)
+    def test_backoff(self):
+        self.assertTrue(400 <= navigation.backoff_ms(0) <= 1200)
+        self.assertTrue(7500 <= navigation.backoff_ms(10) <= 22500)
+        limited = SimpleNamespace(status=429, headers={"retry-after": "3"})
+        self.assertEqual(navigation.backoff_ms(0, limited), 3000)
+        limited.headers = {"retry-after": "600"}
+        self.assertEqual(navigation.backoff_ms(0, limited), 15000)
+
+
+def breaker_row(now, **counts):
+    row = {"window_start": now, "ok_count": 0, "fail_count": 0, "prev_ok_count": 0, "prev_fail_count": 0, "open_until": None, "trips": 0}
+    row.update(counts)
+    return SimpleNamespace(**row)
+
+
+@override_settings(
+    NAVIGATION_BREAKER_WINDOW=60, NAVIGATION_BREAKER_MIN_REQUESTS=10,
+    NAVIGATION_BREAKER_FAILURE_RATIO=0.5, NAVIGATION_BREAKER_COOLDOWN=60,
+)
+class BreakerWindowTests(SimpleTestCase):
+    def test_previous_interval_is_weighted(self):
+        now = timezone.now()
+        row = breaker_row(now - timedelta(seconds=30), ok_count=4, prev_ok_count=10, prev_fail_count=10)
+        self.assertEqual(navigation._window_counts(row, now), (9.0, 5.0))
+
+    def test_roll_shifts_and_restarts(self):
+        now = timezone.now()
+        row = breaker_row(now - timedelta(seconds=70), ok_count=3, fail_count=2)
+        self.assertEqual(navigation._roll(row, now), "shift")
+        self.assertEqual((row.prev_ok_count, row.prev_fail_count, row.ok_count), (3, 2, 0))
+        row.window_start = now - timedelta(seconds=200)
+        self.assertEqual(navigation._roll(row, now), "restart")
+        self.assertEqual((row.prev_ok_count, row.window_start), (0, now))
+
+    def test_trips_on_failures_and_doubles_cooldown(self):
+        now = timezone.now()
+        row = breaker_row(now, ok_count=4, fail_count=6, trips=1)
+        decision, ratio, total = navigation._evaluate(row, now)
+        self.assertEqual((decision, ratio, total), ("trip", 0.6, 10))
+        self.assertEqual(row.open_until, now + timedelta(seconds=120))
+        self.assertEqual((row.trips, row.fail_count, row.window_start), (2, 0, row.open_until))
+
+    def test_too_few_requests_or_already_open(self):
+        now = timezone.now()
+        self.assertIsNone(navigation._evaluate(breaker_row(now, fail_count=9), now)[0])
+        row = breaker_row(now, fail_count=20, open_until=now + timedelta(seconds=5))
+        self.assertIsNone(navigation._evaluate(row, now)[0])
+
+    def test_resets_trips_when_healthy(self):
+        now = timezone.now()
+        row = breaker_row(now, ok_count=19, fail_count=1, trips=3)
+        self.assertEqual(navigation._evaluate(row, now)[0], "reset")
+        self.assertEqual(row.trips, 0)
+
+
+@override_settings(NAVIGATION_BREAKER_MIN_REQUESTS=10, NAVIGATION_BREAKER_FAILURE_RATIO=0.5)
+class BreakerSyncTests(TestCase):
+    def tearDown(self):
+        navigation._open_until.clear()
+        navigation._states.clear()
+
+    def test_counts_are_merged_and_trip_is_shared(self):
+        navigation._flush({"shop.ru": [3, 4]})
+        row = DomainBreaker.objects.get(domain="shop.ru")
+        self.assertEqual((row.ok_count, row.fail_count, row.open_until), (3, 4, None))
+        # Второй воркер добавляет свои сбои к тем же счётчикам
+        navigation._flush({"shop.ru": [0, 5]})
+        row.refresh_from_db()
+        self.assertIsNotNone(row.open_until)
+        self.assertEqual((row.trips, row.fail_count), (1, 0))
+        self.assertEqual(navigation._open_until["shop.ru"], row.open_until)
+
+    def test_idle_domains_pick_up_pause(self):
+        until = timezone.now() + timedelta(seconds=60)
+        DomainBreaker.objects.create(domain="shop.ru", window_start=timezone.now(), open_until=until)
+        navigation._open_until["shop.ru"] = None
+        navigation._flush({})
+        self.assertEqual(navigation._open_until["shop.ru"], until)
+
+
+def make_request(shop, **fields):
+    fields.setdefault("url", CATEGORY_URL)
+    fields.setdefault("params", {"tx1": "Мощность", "tx2": "Вес"})
+    return Request.objects.create(user_id=1, shop=shop, **fields)
+
+
+class JobQueueTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.shop = Shop.objects.create(name="Тест", parser_key="test")
+
+    def test_claims_oldest_pending(self):
+        first = make_request(self.shop)
+        make_request(self.shop)
+        make_request(self.shop, status="done")
+        self.assertEqual(claim_next_job("w1"), first.pk)
+        first.refresh_from_db()
+        self.assertEqual((first.status, first.worker_id, first.attempts), ("running", "w1", 1))
+        self.assertIsNotNone(first.heartbeat_at)
+
+    def test_empty_queue(self):
+        make_request(self.shop, status="done")
+        self.assertIsNone(claim_next_job("w1"))
+
+    def test_requeues_stale_and_fails_exhausted(self):
+        old = timezone.now() - timedelta(seconds=600)
+        stale = make_request(self.shop, status="running", worker_id="w1", attempts=1, heartbeat_at=old)
+        exhausted = make_request(self.shop, status="running", worker_id="w1", attempts=3, heartbeat_at=old)
+        alive = make_request(self.shop, status="running", worker_id="w2", attempts=1, heartbeat_at=timezone.now())
+        follower = make_request(self.shop, status="attached", leader=exhausted)
+        requeued, failed = requeue_stale_jobs(stale_seconds=120, max_attempts=3)
+        self.assertEqual((requeued, failed), ([stale.pk], [exhausted.pk]))
+        for req in (stale, exhausted, alive, follower):
+            req.refresh_from_db()
+        self.assertEqual((stale.status, stale.worker_id), ("pending", None))
+        self.assertEqual((exhausted.status, follower.status, alive.status), ("error", "error", "running"))
+
+    def test_release_returns_running_jobs_only(self):
+        running = make_request(self.shop, status="running", worker_id="w1")
+        done = make_request(self.shop, status="done", worker_id="w1")
+        self.assertEqual(release_jobs([running.pk, done.pk]), 1)
+        running.refresh_from_db()
+        self.assertEqual((running.status, running.worker_id), ("pending", None))
+
+
+class WorkerJobTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.shop = Shop.objects.create(name="Тест", parser_key="test")
+
+    def test_heartbeat_extends_only_own_running_jobs(self):
+        old = timezone.now() - timedelta(seconds=600)
+        own = make_request(self.shop, status="running", worker_id="w1", heartbeat_at=old)
+        crashed = make_request(self.shop, status="error", worker_id="w1", heartbeat_at=old)
+        other = make_request(self.shop, status="running", worker_id="w2", heartbeat_at=old)
+        self.assertEqual(heartbeat("w1", [own.pk, crashed.pk, other.pk]), 1)
+        own.refresh_from_db()
+        self.assertGreater(own.heartbeat_at, old)
+
+    def test_fail_job_fails_followers(self):
+        leader = make_request(self.shop, status="running", worker_id="w1")
+        follower = make_request(self.shop, status="attached", leader=leader)
+        self.assertEqual(fail_job(leader.pk, "w2", "boom"), 0)
+        self.assertEqual(fail_job(leader.pk, "w1", "boom"), 1)
+        leader.refresh_from_db()
+        follower.refresh_from_db()
+        self.assertEqual((leader.status, leader.worker_id, leader.error_message), ("error", None, "boom"))
+        self.assertEqual((follower.status, follower.error_message), ("error", "boom"))
+
+
+class ResumeJobTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.shop = Shop.objects.create(name="Тест", parser_key="test")
+
+    def test_resumes_failed_job_with_followers(self):
+        leader = make_request(self.shop, status="error", attempts=3, error_message="boom", finished_at=timezone.now())
+        follower = make_request(self.shop, status="error", leader=leader, error_message="boom")
+        req, ok = resume_job(leader.pk)
+        self.assertTrue(ok)
+        leader.refresh_from_db()
+        follower.refresh_from_db()
+        self.assertEqual((leader.status, leader.attempts, leader.error_message, leader.stage), ("pending", 0, None, "requeued"))
+        self.assertEqual((follower.status, follower.error_message), ("attached", None))
+
+    def test_refuses_running_attached_and_missing(self):
+        running = make_request(self.shop, status="running")
+        leader = make_request(self.shop, status="error")
+        follower = make_request(self.shop, status="error", leader=leader)
+        self.assertEqual(resume_job(running.pk), (running, False))
+        self.assertFalse(resume_job(follower.pk)[1])
+        self.assertEqual(resume_job(0), (None, False))
+        response = self.client.post(f"/api/parsing/resume/{follower.pk}/")
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()["attached_to"], leader.pk)
+
+
+def parsed_row(i, tx1="Мощность", tx2="Вес"):
+    return {
+        "Ссылка": f"https://shop.ru/product/{i}/", "Артикул": str(i), "Название": f"Товар {i}",
+        "Цена": "100", "Остаток": "5", f"ТХ1_{tx1}": "1500", f"ТХ2_{tx2}": "2",
+    }
+
+
+class ResultWriterTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.shop = Shop.objects.create(name="Тест", parser_key="test")
+
+    async def test_writes_full_batches(self):
+        req = await sync_to_async(make_request)(self.shop, status="running")
+        writer = ResultWriter(req, batch_size=3, flush_seconds=3600)
+        for i in range(7):
+            await writer.add(parsed_row(i))
+        self.assertEqual((writer.saved, len(writer.buffer)), (6, 1))
+        await writer.flush()
+        self.assertEqual(await Result.objects.filter(request=req).acount(), 7)
+        first = await Result.objects.filter(request=req).order_by("id").afirst()
+        self.assertEqual((first.url, first.tx1, first.tx2), ("https://shop.ru/product/0/", "1500", "2"))
+
+    async def test_flushes_by_time(self):
+        req = await sync_to_async(make_request)(self.shop, status="running")
+        writer = ResultWriter(req, batch_size=100, flush_seconds=0.001)
+        writer._last_flush -= 1
+        await writer.add(parsed_row(0))
+        self.assertEqual(writer.saved, 1)
+
+    @override_settings(PARSE_JOB_AUTO_RESUME=False)
+    async def test_crashed_parser_keeps_collected_rows(self):
+        async def parser(url, tx1, tx2):
+            for i in range(3):
+                yield parsed_row(i)
+            raise RuntimeError("blocked")
+
+        req = await sync_to_async(make_request)(self.shop, status="running", worker_id="w1")
+        with mock.patch("parsing.tasks.get_parser", return_value=parser):
+            await run_parser_job(req.pk)
+        await req.arefresh_from_db()
+        self.assertEqual((req.status, req.error_message), ("error", "blocked"))
+        self.assertEqual(await Result.objects.filter(request=req).acount(), 3)
+
+
+class ResultsApiTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        shop = Shop.objects.create(name="Тест", parser_key="test")
+        cls.req = make_request(shop, status="done")
+        Result.objects.bulk_create(
+            Result(request=cls.req, url=f"https://shop.ru/product/{i}/", name=f"Товар, \"{i}\"", price="100")
+            for i in range(5)
+        )
+        cls.ids = list(Result.objects.filter(request=cls.req).order_by("id").values_list("id", flat=True))
+
+    def test_keyset_pages(self):
+        url = f"/api/parsing/results/{self.req.pk}/"
+        page = self.client.get(url, {"limit": 2}).json()
+        self.assertEqual([r["id"] for r in page["results"]], self.ids[:2])
+        self.assertEqual(page["next_after"], self.ids[1])
+        page = self.client.get(url, {"limit": 2, "after": self.ids[3]}).json()
+        self.assertEqual([r["id"] for r in page["results"]], self.ids[4:])
+        self.assertIsNone(page["next_after"])
+
+    def test_bad_params_and_missing_request(self):
+        self.assertEqual(self.client.get(f"/api/parsing/results/{self.req.pk}/", {"after": "x"}).status_code, 400)
+        self.assertEqual(self.client.get("/api/parsing/results/0/").status_code, 404)
+        self.assertEqual(self.client.get(f"/api/parsing/results/{self.req.pk}/export/xml/").status_code, 400)
+
+    def test_ndjson_export(self):
+        response = self.client.get(f"/api/parsing/results/{self.req.pk}/export/ndjson/")
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        self.assertEqual(len(lines), 5)
+        self.assertEqual(json.loads(lines[0])["name"], 'Товар, "0"')
+        self.assertEqual(json.loads(lines[-1])["id"], self.ids[-1])
+
+    def test_csv_export(self):
+        response = self.client.get(f"/api/parsing/results/{self.req.pk}/export/csv/")
+        self.assertEqual(response["Content-Type"], "text/csv; charset=utf-8")
+        body = b"".join(response.streaming_content).decode()
+        self.assertTrue(body.startswith("\ufeff"))
+        rows = list(csv.reader(io.StringIO(body.lstrip("\ufeff"))))
+        self.assertEqual(rows[0], list(RESULT_EXPORT_FIELDS))
+        self.assertEqual(len(rows), 6)
+        self.assertEqual(rows[1][3], 'Товар, "0"')
+
+
+class CoalescingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.shop = Shop.objects.create(name="Тест", parser_key="test")
+
+    def create(self, url=CATEGORY_URL, **params):
+        params = {"tx1": "Мощность", "tx2": "Вес", **params}
+        return create_request(user_id=1, shop=self.shop, url=url, params=params)
+
+    def test_identical_request_attaches_to_leader(self):
+        leader = self.create()
+        follower = self.create(CATEGORY_URL + "?utm_source=mail", tx1=" мощность ")
+        other = self.create(tx2="Цвет")
+        self.assertEqual((leader.status, follower.status, follower.leader_id), ("pending", "attached", leader.pk))
+        self.assertEqual((other.status, other.leader_id), ("pending", None))
+
+    @override_settings(PARSE_COALESCE_WINDOW_SECONDS=0)
+    def test_window_zero_disables_coalescing(self):
+        self.create()
+        self.assertEqual(self.create().status, "pending")
+
+    def test_finished_leader_is_not_joined(self):
+        leader = self.create()
+        leader.status = "done"
+        finish_request(leader, ["status"])
+        self.assertEqual(self.create().status, "pending")
+
+    def test_finish_copies_results_and_progress(self):
+        leader = self.create()
+        follower = self.create()
+        Result.objects.bulk_create(Result(request=leader, url=f"https://shop.ru/product/{i}/") for i in range(3))
+        Request.objects.filter(pk=leader.pk).update(items_saved=3)
+        leader.status, leader.finished_at = "done", timezone.now()
+        self.assertEqual(finish_request(leader, ["status", "finished_at"]), 1)
+        follower.refresh_from_db()
+        self.assertEqual((follower.status, follower.items_saved), ("done", 3))
+        self.assertEqual(
+            list(follower.results.order_by("id").values_list("url", flat=True)),
+            [f"https://shop.ru/product/{i}/" for i in range(3)],
+        )
+
+    def test_fail_followers(self):
+        leader = self.create()
+        follower = self.create()
+        self.assertEqual(fail_followers([leader.pk], "boom"), 1)
+        follower.refresh_from_db()
+        self.assertEqual((follower.status, follower.error_message), ("error", "boom"))
+        self.assertIsNotNone(follower.finished_at)
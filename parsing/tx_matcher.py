@@ -0,0 +1,163 @@
+# parsing/tx_matcher.py
+"""
+Поиск значения характеристики tx1/tx2 в словаре характеристик товара.
+
+Матчер собирается один раз на строку tx (matcher_for кэширует): нормализованный
+ключ, синонимы из общего словаря SYNONYMS и триграммы для нечёткого сравнения.
+Характеристики товара один раз сводятся в PropsIndex (нормализованная
+подпись -> значение). Точное совпадение — одно обращение к словарю, а лучшая
+подпись для остальных рангов запоминается по набору подписей: в одной
+категории он у товаров повторяется, поэтому подписи ранжируются один раз на
+набор, а не на каждый товар.
+
+    index = PropsIndex(props)          # один раз на товар
+    value, rank = matcher_for(tx1).find(index)
+    matcher_for(tx2).value(index)      # или "Н/Д"; принимает и обычный dict
+
+Ранги (меньше — лучше): точное совпадение, подстрока, синоним, похожесть.
+"""
+import re
+from functools import lru_cache
+
+EXACT, SUBSTRING, ALIAS, FUZZY = range(4)
+NO_MATCH = None
+
+# Общий словарь синонимов для всех магазинов.
+# Условие — список термов, все должны входить в нормализованный tx;
+# терм-кортеж — достаточно любого из вариантов.
+SYNONYMS = [
+    (["мощност"], ["Мощность", "Потребляемая мощность", "Номинальная мощность", "Мощность двигателя"]),
+    ([("скорост", "обмин", "rpm", "обор")], ["Скорость вращения", "Частота вращения", "Обороты", "Обороты холостого хода", "Скорость холостого хода"]),
+    (["энерг", "удар"], ["Энергия удара", "Сила удара"]),
+    (["частота", "удар"], ["Число ударов", "Частота ударов"]),
+    (["напряжен"], ["Напряжение", "Напряжение аккумулятора"]),
+    ([("емкост", "ёмкост")], ["Емкость аккумулятора", "Ёмкость аккумулятора"]),
+    ([("вес", "масс")], ["Вес", "Масса", "Вес нетто", "Вес товара"]),
+    ([("гарант",)], ["Гарантия", "Гарантийный срок", "Срок гарантии"]),
+    # Только «страна»: сам по себе «Производитель» — это бренд, а не страна
+    (["страна"], ["Страна производства", "Страна-производитель", "Страна"]),
+]
+
+FUZZY_CUTOFF = 0.6
+MAX_CACHED_LABELS = 5000
+
+
+def normalize(text):
+    return re.sub(r"\W+", "", str(text or "").lower()).strip()
+
+
+def trigrams(text):
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _term_matches(term, key):
+    if isinstance(term, tuple):
+        return any(t in key for t in term)
+    return term in key
+
+
+def expand_aliases(tx):
+    """tx и синонимы из словаря, без дублей, в исходном виде (для поиска по подписям)."""
+    if not tx:
+        return []
+    key = normalize(tx)
+    aliases = [tx]
+    for terms, group in SYNONYMS:
+        if all(_term_matches(term, key) for term in terms):
+            aliases += group
+    return list(dict.fromkeys(aliases))
+
+
+class PropsIndex:
+    """Характеристики товара по нормализованной подписи (первое непустое значение)."""
+
+    __slots__ = ("values", "labels")
+
+    def __init__(self, props):
+        values = {}
+        for label, value in (props or {}).items():
+            nk = normalize(label)
+            if nk and value and nk not in values:
+                values[nk] = value
+        self.values = values
+        self.labels = tuple(values)  # ключ памяти матчеров
+
+
+def as_index(props):
+    return props if isinstance(props, PropsIndex) else PropsIndex(props)
+
+
+class TxMatcher:
+    def __init__(self, tx):
+        self.tx = tx
+        self.key = normalize(tx)
+        self.labels = expand_aliases(tx)
+        self.aliases = {normalize(a) for a in self.labels[1:]} - {self.key, ""}
+        self.grams = trigrams(self.key)
+        self._ranks = {}  # нормализованная подпись -> ранг или NO_MATCH
+        self._best = {}  # набор подписей товара -> (лучшая подпись, ранг)
+
+    def rank(self, label):
+        nk = normalize(label)
+        try:
+            return self._ranks[nk]
+        except KeyError:
+            pass
+        if len(self._ranks) >= MAX_CACHED_LABELS:
+            self._ranks.clear()
+        rank = self._ranks[nk] = self._rank(nk)
+        return rank
+
+    def _rank(self, nk):
+        if not nk or not self.key:
+            return NO_MATCH
+        if nk == self.key:
+            return EXACT
+        if self.key in nk or nk in self.key:
+            return SUBSTRING
+        if any(a == nk or a in nk or nk in a for a in self.aliases):
+            return ALIAS
+        grams = trigrams(nk)
+        # Коэффициент Дайса по триграммам
+        if 2 * len(self.grams & grams) / (len(self.grams) + len(grams)) >= FUZZY_CUTOFF:
+            return FUZZY
+        return NO_MATCH
+
+    def _best_label(self, labels):
+        best, best_rank = None, NO_MATCH
+        for nk in labels:
+            rank = self.rank(nk)
+            if rank is not NO_MATCH and (best_rank is NO_MATCH or rank < best_rank):
+                best, best_rank = nk, rank
+                if rank == EXACT:
+                    break
+        return best, best_rank
+
+    def find(self, props):
+        """
+        (значение, ранг) лучшей подписи; при равном ранге — первая по порядку.
+        (None, None), если нет. props — PropsIndex или dict характеристик.
+        """
+        index = as_index(props)
+        if not self.key or not index.values:
+            return None, NO_MATCH
+        exact = index.values.get(self.key)
+        if exact:
+            return exact, EXACT
+        try:
+            nk, rank = self._best[index.labels]
+        except KeyError:
+            if len(self._best) >= MAX_CACHED_LABELS:
+                self._best.clear()
+            nk, rank = self._best[index.labels] = self._best_label(index.labels)
+        return (index.values[nk], rank) if nk is not None else (None, NO_MATCH)
+
+    def value(self, props, default="Н/Д"):
+        value, _ = self.find(props)
+        return value or default
+
+
+@lru_cache(maxsize=256)
+def matcher_for(tx):
+    return TxMatcher(tx)
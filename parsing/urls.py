@@ -1,7 +1,10 @@
 from django.urls import path
-from .views import StartParseView, ParseStatusView
+from .views import StartParseView, ParseStatusView, ResumeParseView, ResultsView, ResultsExportView
 
 urlpatterns = [
     path("start/", StartParseView.as_view()),
     path("status/<int:pk>/", ParseStatusView.as_view()),
+    path("resume/<int:pk>/", ResumeParseView.as_view()),
+    path("results/<int:pk>/", ResultsView.as_view()),
+    path("results/<int:pk>/export/<str:fmt>/", ResultsExportView.as_view()),
 ]
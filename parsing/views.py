@@ -1,37 +1,148 @@
+import csv
+import json
+from django.http import StreamingHttpResponse
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
-from .models import Request
-from .serializers import RequestSerializer
-import threading
-import asyncio
+from .coalescing import create_request
+from .job_queue import resume_job
+from .models import Request, Result
+from .serializers import RequestSerializer, ResultSerializer
 
-def run_async_task(coro):
-    loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(loop)
-    loop.run_until_complete(coro)
-    loop.close()
+RESULT_EXPORT_FIELDS = ("id", "url", "article", "name", "price", "stock", "tx1", "tx2", "change")
 
 class StartParseView(APIView):
     def post(self, request):
         serializer = RequestSerializer(data=request.data)
         if serializer.is_valid():
-            parse_request = serializer.save(status='pending')
-            from .tasks import run_parser_task
-            # ВАЖНО: просто передаём функцию и аргумент, без run_async_task!
-            threading.Thread(target=run_parser_task, args=(parse_request.id,)).start()
-            return Response({'request_id': parse_request.id}, status=status.HTTP_201_CREATED)
+            # Задачу заберёт воркер (manage.py run_parse_workers), а если такой же
+            # запрос уже в работе — новый просто присоединится к нему
+            parse_request = create_request(**serializer.validated_data)
+            data = {'request_id': parse_request.id}
+            if parse_request.leader_id:
+                data['attached_to'] = parse_request.leader_id
+            return Response(data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 class ParseStatusView(APIView):
+    # Всё берём из одной строки parsing_requests по первичному ключу, без COUNT по результатам
+    PROGRESS_FIELDS = ('links_found', 'pages_processed', 'items_saved', 'items_failed')
+
     def get(self, request, pk):
+        fields = ('status', 'error_message', 'stage', 'leader_id', *self.PROGRESS_FIELDS)
         try:
-            parse_request = Request.objects.get(pk=pk)
+            parse_request = Request.objects.only(*fields).get(pk=pk)
         except Request.DoesNotExist:
             return Response({'error': 'Not found'}, status=404)
-        data = {'status': parse_request.status}
+        attached_to = None
+        if parse_request.status == 'attached' and parse_request.leader_id:
+            # Пока идёт общий парсинг, показываем состояние leader'а
+            attached_to = parse_request.leader_id
+            parse_request = Request.objects.only(*fields).get(pk=attached_to)
+        data = {'status': parse_request.status, 'stage': parse_request.stage}
+        if attached_to:
+            data['attached_to'] = attached_to
         if parse_request.status == 'error':
             data['error_message'] = parse_request.error_message
-        if parse_request.status == 'done':
-            data['results_count'] = parse_request.results.count()
-        return Response(data)
\ No newline at end of file
+        if parse_request.status in ('running', 'done'):
+            data['results_count'] = parse_request.items_saved
+        data['progress'] = {f: getattr(parse_request, f) for f in self.PROGRESS_FIELDS}
+        return Response(data)
+
+
+class ResumeParseView(APIView):
+    """
+    Продолжить упавшую задачу с последнего чекпоинта:
+    POST /api/parsing/resume/<id>/
+    Уже собранные результаты остаются, парсер доберёт оставшиеся ссылки.
+    """
+
+    def post(self, request, pk):
+        parse_request, resumed = resume_job(pk)
+        if parse_request is None:
+            return Response({'error': 'Not found'}, status=404)
+        if not resumed and parse_request.leader_id:
+            return Response(
+                {'error': 'Request is attached to another job, resume that one', 'attached_to': parse_request.leader_id},
+                status=status.HTTP_409_CONFLICT,
+            )
+        if not resumed:
+            return Response(
+                {'error': f"Only failed jobs can be resumed, status is '{parse_request.status}'"},
+                status=status.HTTP_409_CONFLICT,
+            )
+        return Response({'request_id': parse_request.id, 'status': 'pending'}, status=status.HTTP_202_ACCEPTED)
+
+
+class ResultsView(APIView):
+    """
+    Результаты запроса с keyset-пагинацией по id:
+    GET /api/parsing/results/<id>/?after=<last_id>&limit=100
+    """
+    DEFAULT_LIMIT = 100
+    MAX_LIMIT = 1000
+
+    def get(self, request, pk):
+        if not Request.objects.filter(pk=pk).exists():
+            return Response({'error': 'Not found'}, status=404)
+        try:
+            after = int(request.query_params.get('after', 0))
+            limit = int(request.query_params.get('limit', self.DEFAULT_LIMIT))
+        except ValueError:
+            return Response({'error': 'after and limit must be integers'}, status=400)
+        limit = max(1, min(limit, self.MAX_LIMIT))
+
+        rows = list(
+            Result.objects.filter(request_id=pk, id__gt=after).order_by('id')[:limit]
+        )
+        next_after = rows[-1].id if len(rows) == limit else None
+        return Response({
+            'results': ResultSerializer(rows, many=True).data,
+            'next_after': next_after,
+        })
+
+
+class _Echo:
+    # csv.writer пишет строку в «файл» и мы сразу отдаём её в поток
+    def write(self, value):
+        return value
+
+
+class ResultsExportView(APIView):
+    """
+    Потоковая выгрузка всех результатов запроса за постоянную память:
+    GET /api/parsing/results/<id>/export/ndjson/ или .../export/csv/
+    """
+    CHUNK_SIZE = 2000
+    FORMATS = {
+        'ndjson': 'application/x-ndjson; charset=utf-8',
+        'csv': 'text/csv; charset=utf-8',
+    }
+
+    def get(self, request, pk, fmt):
+        if fmt not in self.FORMATS:
+            return Response({'error': f'Unknown format: {fmt}'}, status=400)
+        if not Request.objects.filter(pk=pk).exists():
+            return Response({'error': 'Not found'}, status=404)
+
+        rows = (
+            Result.objects.filter(request_id=pk)
+            .order_by('id')
+            .values_list(*RESULT_EXPORT_FIELDS)
+            .iterator(chunk_size=self.CHUNK_SIZE)
+        )
+        stream = self._csv(rows) if fmt == 'csv' else self._ndjson(rows)
+        response = StreamingHttpResponse(stream, content_type=self.FORMATS[fmt])
+        response['Content-Disposition'] = f'attachment; filename="results_{pk}.{fmt}"'
+        return response
+
+    def _ndjson(self, rows):
+        for row in rows:
+            yield json.dumps(dict(zip(RESULT_EXPORT_FIELDS, row)), ensure_ascii=False) + "\n"
+
+    def _csv(self, rows):
+        writer = csv.writer(_Echo())
+        # BOM — чтобы Excel открыл кириллицу без плясок с кодировкой
+        yield "\ufeff" + writer.writerow(RESULT_EXPORT_FIELDS)
+        for row in rows:
+            yield writer.writerow(row)
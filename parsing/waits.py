@@ -0,0 +1,112 @@
+# parsing/waits.py
+"""
+Ожидания по событиям вместо фиксированных wait_for_timeout.
+
+Каждое ожидание ждёт конкретного условия (селектор, сетевой простой,
+затишье DOM, рост списка/высоты) и ограничено жёстким cap_ms. Фактическая
+длительность пишется в WAIT_STATS по метке, чтобы подбирать cap по данным:
+
+    await wait_for_dom_quiet(page, cap_ms=2000, label="baucenter.product")
+    wait_stats()  # {"baucenter.product": {"count": ..., "avg_ms": ..., "capped": ...}}
+"""
+import time
+
+WAIT_STATS = {}
+
+_DOM_QUIET_JS = """([quietMs, capMs, sel]) => new Promise(resolve => {
+    const target = (sel && document.querySelector(sel)) || document.documentElement;
+    if (!target) { resolve(false); return; }
+    let timer = null, cap = null;
+    const obs = new MutationObserver(() => {
+        clearTimeout(timer);
+        timer = setTimeout(() => done(true), quietMs);
+    });
+    const done = (quiet) => { obs.disconnect(); clearTimeout(timer); clearTimeout(cap); resolve(quiet); };
+    obs.observe(target, {childList: true, subtree: true, attributes: true, characterData: true});
+    timer = setTimeout(() => done(true), quietMs);
+    cap = setTimeout(() => done(false), capMs);
+})"""
+
+
+def record(label, elapsed_ms, capped):
+    st = WAIT_STATS.setdefault(label, {"count": 0, "total_ms": 0.0, "max_ms": 0.0, "capped": 0})
+    st["count"] += 1
+    st["total_ms"] += elapsed_ms
+    st["max_ms"] = max(st["max_ms"], elapsed_ms)
+    if capped:
+        st["capped"] += 1
+
+
+def wait_stats():
+    return {
+        label: {
+            "count": st["count"],
+            "avg_ms": round(st["total_ms"] / st["count"], 1) if st["count"] else 0,
+            "max_ms": round(st["max_ms"], 1),
+            "capped": st["capped"],
+        }
+        for label, st in WAIT_STATS.items()
+    }
+
+
+async def _timed(label, coro):
+    started = time.monotonic()
+    ok = False
+    try:
+        ok = bool(await coro)
+    except Exception:
+        ok = False
+    record(label, (time.monotonic() - started) * 1000, capped=not ok)
+    return ok
+
+
+async def wait_for_selector(page, selector, cap_ms, label, state="visible"):
+    """True, если селектор появился до cap_ms."""
+    async def run():
+        await page.wait_for_selector(selector, state=state, timeout=cap_ms)
+        return True
+    return await _timed(label, run())
+
+
+async def wait_for_dom_quiet(page, cap_ms, label, quiet_ms=250, selector=None):
+    """Ждём, пока DOM (или узел selector) не меняется quiet_ms подряд, но не дольше cap_ms."""
+    return await _timed(label, page.evaluate(_DOM_QUIET_JS, [quiet_ms, cap_ms, selector]))
+
+
+async def wait_for_count_change(page, selector, previous, cap_ms, label):
+    """Ждём, пока число элементов selector станет отличным от previous (подгрузка списка)."""
+    async def run():
+        await page.wait_for_function(
+            "([sel, prev]) => document.querySelectorAll(sel).length !== prev",
+            arg=[selector, previous], timeout=cap_ms,
+        )
+        return True
+    return await _timed(label, run())
+
+
+async def wait_for_height_change(page, previous, cap_ms, label, selector=None):
+    """Ждём роста scrollHeight страницы (или контейнера selector) относительно previous."""
+    async def run():
+        await page.wait_for_function(
+            """([sel, prev]) => {
+                const el = sel ? document.querySelector(sel) : document.body;
+                return !!el && el.scrollHeight !== prev;
+            }""",
+            arg=[selector, previous], timeout=cap_ms,
+        )
+        return True
+    return await _timed(label, run())
+
+
+async def wait_until_not_challenge(page, cap_ms, label, markers):
+    """Ждём, пока страница-заглушка (DDoS-Guard и т.п.) сама не сменится на контент."""
+    async def run():
+        await page.wait_for_function(
+            """(markers) => {
+                const html = (document.documentElement.outerHTML || '').toLowerCase();
+                return !markers.some(m => html.includes(m));
+            }""",
+            arg=list(markers), timeout=cap_ms, polling=250,
+        )
+        return True
+    return await _timed(label, run())